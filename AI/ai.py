@@ -5,26 +5,50 @@
 # =========================
 
 import os
+import sys
 import time
 import threading
 import json
-from collections import deque
+import queue
 from pathlib import Path
-from uuid import uuid4
 
 import numpy as np
-import pandas as pd
 import requests
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
 import pickle
 
 BASE_DIR = Path(__file__).resolve().parent
-DASHBOARD_EVENTS_URL = "http://127.0.0.1:8000/dashboard/events"
-MCP_ENQUEUE_URL = "http://127.0.0.1:8000/mcp/enqueue"
+ROOT_DIR = BASE_DIR.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
 MANUAL_PATH = str((BASE_DIR.parents[0] / "docs/manuals/manual.txt").resolve())
 MANUAL_DIR = str((BASE_DIR.parents[0] / "docs/manuals").resolve())
 
+from AI.history import SnapshotRing  # noqa: E402
+from AI.metrics import PipelineMetrics  # noqa: E402
+from AI.scoring import (  # noqa: E402
+    FusedScorer,
+    SnapshotScore,
+    score_batch,
+    scorer_from_bundle,
+    top_k_rows,
+    top_k_sensors,
+)
+from AI.transport import (  # noqa: E402
+    DASHBOARD_EVENTS_URL,
+    MCP_ENQUEUE_URL,
+    EventTransport,
+    mcp_job_payload,
+    wants_mcp_job,
+)
+
+MODEL_BUNDLE_NAME = "model.bundle"
+EVENT_HISTORY_ROWS = 5
+EVENT_OUTBOX_DIR = Path(os.getenv("AI_OUTBOX_DIR", BASE_DIR / "event_outbox"))
+SCORING_DTYPE = np.dtype(os.getenv("AI_SCORING_DTYPE", "float64"))
+STATS_PORT = int(os.getenv("AI_STATS_PORT", "0")) or None
+SENSOR_CURSOR_PATH = Path(os.getenv("AI_SENSOR_CURSOR", BASE_DIR / "sensor_cursor.json"))
+SENSOR_COLUMNS = [f"XMEAS({i})" for i in range(1, 42)] + [f"XMV({i})" for i in range(1, 12)]
+
 
 def send_event_to_dashboard(event: dict):
     """Send anomaly event to FastAPI dashboard endpoint."""
@@ -37,7 +61,6 @@ def send_event_to_dashboard(event: dict):
         if resp.status_code >= 400:
             print(f"[Dashboard] Failed to send event ({resp.status_code}): {resp.text}")
             return None
-        print(f"[Dashboard] Event sent ({resp.status_code})")
         return resp.json()
     except requests.RequestException as exc:
         print(f"[Dashboard] Error sending event: {exc}")
@@ -102,13 +125,98 @@ class EventLog:
         self.logs.append(event_dict)
 
 
-def train_models(normal_csv: str = "normal.csv"):
-    """Train scaler/PCA models and persist thresholds."""
+T2_CONFIDENCE = 0.95
+SPE_CONFIDENCE = 0.99
+LIMIT_METHODS = ("empirical", "analytical", "validate")
+
+
+def residual_eigenvalues(pca, covariance):
+    """Eigenvalues of ``covariance`` left out of the retained PCA subspace."""
+    eigvals = np.linalg.eigvalsh(covariance)[::-1]
+    return np.clip(eigvals[pca.n_components_ :], 0.0, None)
+
+
+def t2_control_limit(n_components, n_samples=None, confidence=T2_CONFIDENCE):
+    """Hotelling T² limit from the F distribution (chi-square when ``n_samples`` is unknown)."""
+    from scipy import stats
+
+    k = n_components
+    if n_samples is None or n_samples <= k:
+        return float(stats.chi2.ppf(confidence, k))
+    n = n_samples
+    factor = k * (n - 1) * (n + 1) / (n * (n - k))
+    return float(factor * stats.f.ppf(confidence, k, n - k))
+
+
+def spe_control_limit(residual_eigvals, confidence=SPE_CONFIDENCE):
+    """Jackson–Mudholkar approximation of the SPE (Q statistic) limit."""
+    from scipy import stats
+
+    return _jackson_mudholkar(residual_eigvals, stats.norm.ppf(confidence))
+
+
+def _jackson_mudholkar(residual_eigvals, c_alpha):
+    """SPE limit at the normal quantile ``c_alpha``; numpy only, so refreshes need no scipy.
+
+    For flat residual spectra (``h0 <= 0``, e.g. the summed residuals of a
+    multi-block model) Jackson–Mudholkar is undefined. It then falls back to
+    Box's ``g·χ²(h)`` with ``g = θ2/θ1`` and ``h = θ1²/θ2``, taking the χ²
+    quantile from ``c_alpha`` by Wilson–Hilferty.
+    """
+    lambdas = np.asarray(residual_eigvals, dtype=float)
+    theta1, theta2, theta3 = (np.sum(lambdas**i) for i in (1, 2, 3))
+    if theta1 <= 0:
+        return 0.0
+    h0 = 1.0 - 2.0 * theta1 * theta3 / (3.0 * theta2**2)
+    if h0 <= 0:
+        h = theta1**2 / theta2
+        chi2 = h * (1.0 - 2.0 / (9.0 * h) + c_alpha * np.sqrt(2.0 / (9.0 * h))) ** 3
+        return float(theta2 / theta1 * chi2)
+    term = (
+        c_alpha * np.sqrt(2.0 * theta2 * h0**2) / theta1
+        + 1.0
+        + theta2 * h0 * (h0 - 1.0) / theta1**2
+    )
+    return float(theta1 * term ** (1.0 / h0))
+
+
+def analytical_limits(pca, residual_eigvals, n_samples=None):
+    """Return ``(t2_limit, spe_limit)`` computed from the PCA eigenvalue spectrum."""
+    t2_limit = t2_control_limit(pca.n_components_, n_samples)
+    spe_limit = spe_control_limit(residual_eigvals)
+    return t2_limit, spe_limit
+
+
+def empirical_limits(pca, scaled):
+    """Return ``(t2_limit, spe_limit, scores)`` using percentiles of the training scores."""
+    scores = score_batch(pca, scaled, contributions=False)
+    t2_limit = float(np.percentile(scores["t2"], T2_CONFIDENCE * 100))
+    spe_limit = float(np.percentile(scores["spe"], SPE_CONFIDENCE * 100))
+    return t2_limit, spe_limit, scores
+
+
+def train_models(normal_csv: str = "normal.csv", limits: str = "empirical", out_dir=None):
+    """Train scaler/PCA models and persist thresholds.
+
+    ``limits`` selects how the thresholds are set: ``"empirical"`` takes
+    percentiles of the scored training data, ``"analytical"`` uses the
+    F / Jackson–Mudholkar limits from the eigenvalue spectrum without scoring
+    the data, and ``"validate"`` writes the analytical limits but also scores
+    the training data and reports the empirical percentiles next to them.
+    Artifacts are written to ``out_dir`` (default: next to this file).
+    """
+    if limits not in LIMIT_METHODS:
+        raise ValueError(f"limits must be one of {LIMIT_METHODS}, got {limits!r}")
+
+    import pandas as pd
+    from sklearn.decomposition import PCA
+    from sklearn.preprocessing import StandardScaler
+
     print(f"Loading {normal_csv}...")
     csv_path = (BASE_DIR / normal_csv).resolve()
     df = pd.read_csv(csv_path)
     df_features = df.select_dtypes(include=[np.number]).copy()
-    df_features = df_features.fillna(method="ffill").fillna(method="bfill")
+    df_features = df_features.ffill().bfill()
 
     print("Data shape:", df_features.shape)
 
@@ -121,45 +229,437 @@ def train_models(normal_csv: str = "normal.csv"):
     pca.fit(scaled)
     print(f"PCA components learned: {pca.n_components_}")
 
-    spe_scores = [compute_spe(pca, scaled[i : i + 1]) for i in range(len(scaled))]
-    spe_threshold = np.percentile(spe_scores, 99)
+    print(f"Computing thresholds ({limits})...")
+    if limits == "empirical":
+        threshold, spe_threshold, _ = empirical_limits(pca, scaled)
+    else:
+        covariance = scaled.T @ scaled / (len(scaled) - 1)
+        threshold, spe_threshold = analytical_limits(
+            pca, residual_eigenvalues(pca, covariance), pca.n_samples_
+        )
+        if limits == "validate":
+            emp_t2, emp_spe, scores = empirical_limits(pca, scaled)
+            print(
+                f"Empirical T2 p{T2_CONFIDENCE * 100:g}: {emp_t2:.4f}  "
+                f"false-alarm rate at analytical limit: {np.mean(scores['t2'] > threshold):.4f}"
+            )
+            print(
+                f"Empirical SPE p{SPE_CONFIDENCE * 100:g}: {emp_spe:.4f}  "
+                f"false-alarm rate at analytical limit: {np.mean(scores['spe'] > spe_threshold):.4f}"
+            )
+    print("Threshold :", threshold)
     print("SPE Threshold:", spe_threshold)
-    with open(BASE_DIR / "threshold_spe.txt", "w") as f:
-        f.write(str(spe_threshold))
 
-    print("Computing threshold...")
-    t2_scores = [compute_risk_pca(pca, scaled[i : i + 1]) for i in range(len(scaled))]
-    threshold = np.percentile(t2_scores, 95)
-    print("Threshold :", threshold)
+    save_trained_artifacts(scaler, pca, threshold, spe_threshold, out_dir)
 
+
+def save_trained_artifacts(scaler, pca, threshold, spe_threshold, out_dir=None, dtype=SCORING_DTYPE):
+    out_dir = Path(out_dir) if out_dir is not None else BASE_DIR
     print("Saving scaler.pkl and pca.pkl ...")
-    with open(BASE_DIR / "scaler.pkl", "wb") as f:
+    with open(out_dir / "scaler.pkl", "wb") as f:
         pickle.dump(scaler, f)
-    with open(BASE_DIR / "pca.pkl", "wb") as f:
+    with open(out_dir / "pca.pkl", "wb") as f:
         pickle.dump(pca, f)
-    with open(BASE_DIR / "threshold.txt", "w") as f:
+    with open(out_dir / "threshold.txt", "w") as f:
         f.write(str(threshold))
+    with open(out_dir / "threshold_spe.txt", "w") as f:
+        f.write(str(spe_threshold))
+    export_model_bundle(out_dir / MODEL_BUNDLE_NAME, scaler, pca, threshold, spe_threshold, dtype=dtype)
 
     print("Training complete!")
-    print("Generated files: scaler.pkl, pca.pkl, threshold.txt, threshold_spe.txt")
+    print(f"Generated files: scaler.pkl, pca.pkl, threshold.txt, threshold_spe.txt, {MODEL_BUNDLE_NAME}")
+
+
+def export_model_bundle(path, scaler, pca, threshold, spe_threshold, metadata=None, dtype=np.float64):
+    """Write scaler/PCA/thresholds as a numpy-only bundle (see AI/model_bundle.py).
+
+    Besides the raw scaler and PCA arrays the bundle carries the compiled
+    :class:`FusedScorer` matrices, so loading it needs no sklearn and no
+    recomputation. With ``dtype=np.float32`` (``AI_SCORING_DTYPE=float32``
+    for :func:`save_trained_artifacts`) the compiled matrices are stored in
+    float32 and every scorer built from the bundle scores in float32 (see
+    AI/scoring.py for the tolerance).
+    """
+    from AI.model_bundle import write_model_bundle
+
+    scorer = FusedScorer(scaler, pca, dtype=dtype)
+    arrays = {
+        "scaler_mean": scaler.mean_,
+        "scaler_scale": scaler.scale_,
+        "components": pca.components_,
+        "explained_variance": pca.explained_variance_,
+        "pca_mean": pca.mean_,
+        "offset": scorer.offset,
+        "projector": scorer.projector,
+        "inv_lambdas": scorer.inv_lambdas,
+        "abs_components": scorer.abs_components,
+    }
+    info = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "n_samples": int(getattr(pca, "n_samples_", 0) or 0),
+        "noise_variance": float(getattr(pca, "noise_variance_", 0.0)),
+        "scoring_dtype": np.dtype(dtype).name,
+    }
+    feature_names = getattr(scaler, "feature_names_in_", None)
+    if feature_names is not None:
+        info["feature_names"] = [str(name) for name in feature_names]
+    info.update(metadata or {})
+    return write_model_bundle(path, arrays, threshold, spe_threshold, info)
+
+
+def load_model_bundle(path=None, mmap: bool = True):
+    """Open a model bundle with numpy only; defaults to the one next to this file."""
+    from AI.model_bundle import read_model_bundle
+
+    return read_model_bundle(path or BASE_DIR / MODEL_BUNDLE_NAME, mmap=mmap)
+
+
+class RunningCovariance:
+    """Streaming mean/covariance accumulator (chunk-wise Chan et al. merge)."""
+
+    def __init__(self, n_features: int):
+        self.n = 0
+        self.mean = np.zeros(n_features)
+        self.comoment = np.zeros((n_features, n_features))
+
+    def update(self, chunk):
+        chunk = np.asarray(chunk, dtype=float)
+        m = len(chunk)
+        if m == 0:
+            return
+        chunk_mean = chunk.mean(axis=0)
+        centered = chunk - chunk_mean
+        delta = chunk_mean - self.mean
+        total = self.n + m
+        self.comoment += centered.T @ centered + np.outer(delta, delta) * (self.n * m / total)
+        self.mean += delta * (m / total)
+        self.n = total
+
+    def variance(self, ddof: int = 0):
+        return np.diag(self.comoment) / (self.n - ddof)
+
+    def covariance(self, ddof: int = 1):
+        return self.comoment / (self.n - ddof)
+
+
+def _principal_subspace(covariance, n_components=0.90):
+    """Sorted eigenpairs of ``covariance`` and the number of components to keep.
 
+    A float ``n_components`` is a retained-variance fraction, resolved the
+    same way sklearn's PCA does.
+    """
+    eigvals, eigvecs = np.linalg.eigh(covariance)
+    order = np.argsort(eigvals)[::-1]
+    eigvals = np.clip(eigvals[order], 0.0, None)
+    eigvecs = eigvecs[:, order]
+    # Same sign convention as sklearn's svd_flip: largest |loading| positive.
+    signs = np.sign(eigvecs[np.abs(eigvecs).argmax(axis=0), range(eigvecs.shape[1])])
+    eigvecs *= np.where(signs == 0, 1.0, signs)
 
-def load_trained_artifacts():
-    with open(BASE_DIR / "scaler.pkl", "rb") as f:
+    ratio = eigvals / eigvals.sum()
+    if isinstance(n_components, float):
+        k = int(np.searchsorted(np.cumsum(ratio), n_components, side="right") + 1)
+    else:
+        k = int(n_components)
+    return eigvals, eigvecs, ratio, min(k, len(eigvals))
+
+
+def models_from_moments(stats: RunningCovariance, n_components=0.90):
+    """Build fitted StandardScaler/PCA objects from streamed moments.
+
+    The scaled covariance is the raw covariance divided by the outer product
+    of the scaler's standard deviations; its eigendecomposition gives the
+    same subspace ``PCA.fit`` would find on the scaled data. Also returns the
+    residual eigenvalues for :func:`analytical_limits`.
+    """
+    variance = stats.variance(ddof=0)
+    scale = np.sqrt(variance)
+    scale[scale == 0.0] = 1.0
+
+    covariance = stats.covariance(ddof=1) / np.outer(scale, scale)
+    eigvals, eigvecs, _, k = _principal_subspace(covariance, n_components)
+    scaler, pca = models_from_spectrum(stats.mean, variance, stats.n, eigvals, eigvecs.T, k, n_components)
+    return scaler, pca, eigvals[k:]
+
+
+def models_from_spectrum(mean, variance, n_samples, eigvals, components, k, n_components=0.90):
+    """Fitted StandardScaler/PCA objects from a precomputed decomposition.
+
+    ``eigvals`` is the full sorted spectrum of the scaled covariance and
+    ``components`` the matching loadings (one row per eigenvalue); the
+    first ``k`` are kept.
+    """
+    from sklearn.decomposition import PCA
+    from sklearn.preprocessing import StandardScaler
+
+    variance = np.asarray(variance, dtype=float)
+    scale = np.sqrt(variance)
+    scale[scale == 0.0] = 1.0
+
+    scaler = StandardScaler()
+    scaler.mean_ = np.array(mean, dtype=float)
+    scaler.var_ = variance
+    scaler.scale_ = scale
+    scaler.n_samples_seen_ = n_samples
+    scaler.n_features_in_ = len(scale)
+
+    ratio = eigvals / eigvals.sum()
+    pca = PCA(n_components=n_components)
+    pca.components_ = np.array(components[:k], dtype=float)
+    pca.explained_variance_ = eigvals[:k]
+    pca.explained_variance_ratio_ = ratio[:k]
+    pca.singular_values_ = np.sqrt(eigvals[:k] * (n_samples - 1))
+    pca.mean_ = np.zeros(len(scale))
+    pca.n_components_ = k
+    pca.n_samples_ = n_samples
+    pca.n_features_in_ = len(scale)
+    pca.noise_variance_ = float(eigvals[k:].mean()) if k < len(eigvals) else 0.0
+    return scaler, pca
+
+
+def iter_csv_chunks(csv_path, chunk_size: int = 50_000):
+    """Yield gap-filled numeric chunks of a CSV as float arrays.
+
+    Forward fill carries the last row across chunk boundaries; leading gaps
+    are back-filled within the first chunk, matching ffill().bfill() on the
+    whole frame.
+    """
+    import pandas as pd
+
+    carry = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        features = chunk.select_dtypes(include=[np.number]).ffill()
+        if carry is not None:
+            features = features.fillna(carry)
+        features = features.bfill()
+        carry = features.iloc[-1]
+        yield features.to_numpy(dtype=float)
+
+
+def train_models_streaming(
+    normal_csv: str = "normal.csv",
+    chunk_size: int = 50_000,
+    from_db: bool = False,
+    limits: str = "analytical",
+    out_dir=None,
+):
+    """Train from chunked normal data with memory bounded by ``chunk_size``.
+
+    Reads ``normal_csv`` (or the `sensor` table when ``from_db`` is set) in
+    chunks, accumulates the mean/covariance in one pass and derives the
+    scaler and PCA from it. ``"analytical"`` limits need no further pass;
+    ``"empirical"``/``"validate"`` re-read the source once to score it and
+    keep only the two score arrays in memory. Artifacts go to ``out_dir``
+    as in :func:`train_models`.
+    """
+    if limits not in LIMIT_METHODS:
+        raise ValueError(f"limits must be one of {LIMIT_METHODS}, got {limits!r}")
+
+    def _chunks():
+        if from_db:
+            from AI.sensor_db import iter_sensor_chunks
+
+            return iter_sensor_chunks(chunk_size)
+        return iter_csv_chunks((BASE_DIR / normal_csv).resolve(), chunk_size)
+
+    source = "sensor table" if from_db else normal_csv
+    print(f"Streaming {source} in chunks of {chunk_size}...")
+    stats = None
+    for chunk in _chunks():
+        if stats is None:
+            stats = RunningCovariance(chunk.shape[1])
+        stats.update(chunk)
+    if stats is None or stats.n < 2:
+        raise ValueError(f"Not enough rows in {source} to train")
+    empty = np.flatnonzero(~np.isfinite(stats.mean))
+    if len(empty):
+        raise ValueError(f"Columns {empty.tolist()} of {source} have no finite values to train on")
+    print("Data shape:", (stats.n, len(stats.mean)))
+
+    scaler, pca, residual = models_from_moments(stats)
+    print(f"PCA components learned: {pca.n_components_}")
+
+    print(f"Computing thresholds ({limits})...")
+    threshold, spe_threshold = analytical_limits(pca, residual, stats.n)
+    if limits != "analytical":
+        t2_parts, spe_parts = [], []
+        for chunk in _chunks():
+            scores = score_batch(pca, chunk, scaler=scaler, contributions=False)
+            t2_parts.append(scores["t2"])
+            spe_parts.append(scores["spe"])
+        t2_scores, spe_scores = np.concatenate(t2_parts), np.concatenate(spe_parts)
+        emp_t2 = float(np.percentile(t2_scores, T2_CONFIDENCE * 100))
+        emp_spe = float(np.percentile(spe_scores, SPE_CONFIDENCE * 100))
+        if limits == "empirical":
+            threshold, spe_threshold = emp_t2, emp_spe
+        else:
+            print(
+                f"Empirical T2 p{T2_CONFIDENCE * 100:g}: {emp_t2:.4f}  "
+                f"false-alarm rate at analytical limit: {np.mean(t2_scores > threshold):.4f}"
+            )
+            print(
+                f"Empirical SPE p{SPE_CONFIDENCE * 100:g}: {emp_spe:.4f}  "
+                f"false-alarm rate at analytical limit: {np.mean(spe_scores > spe_threshold):.4f}"
+            )
+    print("Threshold :", threshold)
+    print("SPE Threshold:", spe_threshold)
+
+    save_trained_artifacts(scaler, pca, threshold, spe_threshold, out_dir)
+
+
+class AdaptivePCAModel:
+    """Recursive PCA for the live loop.
+
+    Samples judged normal are folded into a weighted mean and covariance with
+    a rank-one O(p^2) update. The first samples are weighted equally (an
+    exact running covariance); once ``1 / (1 - forgetting)`` samples have
+    been seen the weights decay exponentially, so ``forgetting`` close to 1
+    means a long memory. After ``warmup`` accepted samples, and then every
+    ``refresh_every``, the loadings are recomputed from the correlation
+    matrix and the T²/SPE limits from the chi-square / Jackson–Mudholkar
+    formulas. The new ``(scorer, t2_limit, spe_limit)`` triple replaces
+    :attr:`state` in a single assignment, so a reader always sees a
+    consistent model; until the first refresh it is the trained model.
+    """
+
+    def __init__(
+        self,
+        scaler,
+        pca,
+        threshold_t2,
+        threshold_spe,
+        forgetting: float = 0.999,
+        refresh_every: int = 500,
+        warmup: int | None = None,
+        n_components=0.90,
+    ):
+        from scipy import stats
+
+        n_features = len(scaler.scale_)
+        self.forgetting = forgetting
+        self.refresh_every = refresh_every
+        self.warmup = warmup if warmup is not None else max(refresh_every, int(round(1 / (1 - forgetting))))
+        self.n_components = n_components
+        self.mean = np.zeros(n_features)
+        self.covariance = np.zeros((n_features, n_features))
+        self.accepted = 0
+        self.refreshes = 0
+        self._t2_table = stats.chi2.ppf(T2_CONFIDENCE, np.arange(1, n_features + 1))
+        self._c_alpha = float(stats.norm.ppf(SPE_CONFIDENCE))
+        self._lock = threading.Lock()
+        self.state = (FusedScorer(scaler, pca), float(threshold_t2), float(threshold_spe))
+
+    def observe(self, snap):
+        """Fold one normal snapshot into the running moments; refresh on schedule."""
+        with self._lock:
+            self.accepted += 1
+            weight = max(1.0 - self.forgetting, 1.0 / self.accepted)
+            delta = snap - self.mean
+            self.mean += weight * delta
+            self.covariance += weight * np.outer(delta, delta)
+            self.covariance *= 1.0 - weight
+            due = self.accepted >= self.warmup and (self.accepted - self.warmup) % self.refresh_every == 0
+        if due:
+            self.refresh()
+
+    def refresh(self):
+        """Recompute loadings and limits from the current moments and swap them in."""
+        with self._lock:
+            mean = self.mean.copy()
+            covariance = self.covariance.copy()
+        scale = np.sqrt(np.clip(np.diag(covariance), 0.0, None))
+        scale[scale == 0.0] = 1.0
+        eigvals, eigvecs, _, k = _principal_subspace(covariance / np.outer(scale, scale), self.n_components)
+        scorer = FusedScorer.from_arrays(mean, scale, eigvecs[:, :k].T, eigvals[:k])
+        t2_limit = float(self._t2_table[k - 1])
+        spe_limit = _jackson_mudholkar(eigvals[k:], self._c_alpha)
+        self.state = (scorer, t2_limit, spe_limit)
+        self.refreshes += 1
+        return self.state
+
+
+def load_trained_artifacts(model_dir=None):
+    model_dir = Path(model_dir) if model_dir is not None else BASE_DIR
+    with open(model_dir / "scaler.pkl", "rb") as f:
         scaler = pickle.load(f)
-    with open(BASE_DIR / "pca.pkl", "rb") as f:
+    with open(model_dir / "pca.pkl", "rb") as f:
         pca = pickle.load(f)
-    with open(BASE_DIR / "threshold.txt") as f:
+    with open(model_dir / "threshold.txt") as f:
         threshold = float(f.read().strip())
-    with open(BASE_DIR / "threshold_spe.txt") as f:
+    with open(model_dir / "threshold_spe.txt") as f:
         spe_threshold = float(f.read().strip())
     return scaler, pca, threshold, spe_threshold
 
 
-def load_sensor_data(test_csv: str = "test2.csv"):
+def iter_sensor_csv(
+    test_csv: str = "test2.csv",
+    chunk_size: int = 10_000,
+    columns=SENSOR_COLUMNS,
+    dtype=np.float64,
+):
+    """Yield ``(rows, n_features)`` float arrays from a sensor CSV, one chunk at a time.
+
+    Only the sensor columns are parsed, with a fixed dtype, and they are
+    returned in ``columns`` order regardless of their order in the file.
+    """
+    import pandas as pd
+
     csv_path = (BASE_DIR / test_csv).resolve()
-    df = pd.read_csv(csv_path)
-    return df.select_dtypes(include=[np.number]).values
+    reader = pd.read_csv(
+        csv_path,
+        usecols=list(columns),
+        dtype={col: dtype for col in columns},
+        chunksize=chunk_size,
+        engine="c",
+    )
+    with reader:
+        for chunk in reader:
+            yield chunk[list(columns)].to_numpy(dtype=dtype)
+
+
+def prefetch(iterable, depth: int = 2):
+    """Run ``iterable`` on a background thread, keeping up to ``depth`` items ready.
+
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def _produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(done)
+        except BaseException as exc:  # handed over to the consumer
+            buffer.put(exc)
+
+    thread = threading.Thread(target=_produce, name="sensor-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def load_sensor_data(test_csv: str = "test2.csv"):
+    chunks = list(iter_sensor_csv(test_csv))
+    if not chunks:
+        return np.empty((0, len(SENSOR_COLUMNS)))
+    return np.concatenate(chunks)
 
 
 def make_snapshot_reader(sensor_cols):
@@ -178,137 +678,457 @@ def make_snapshot_reader(sensor_cols):
     return _reader
 
 
-def warn_loop(get_snapshot, history_buffer, scaler, pca, log, threshold_t2, threshold_spe):
+def make_chunked_snapshot_reader(chunks):
+    """Snapshot reader over an iterator of 2-D chunks (see :func:`iter_sensor_csv`)."""
+    chunks = iter(chunks)
+    current = np.empty((0, 0))
+    cursor = 0
+    seen_rows = False
+
+    def _reader():
+        nonlocal current, cursor, seen_rows
+        while cursor >= len(current):
+            try:
+                current = next(chunks)
+            except StopIteration:
+                if not seen_rows:
+                    raise RuntimeError("Sensor dataset is empty.")
+                raise StopIteration("All sensor snapshots processed.")
+            cursor = 0
+        seen_rows = True
+        snap = current[cursor]
+        cursor += 1
+        return snap
+
+    return _reader
+
+
+class ReplayClock:
+    """Paces the warn loop.
+
+    ``"realtime"`` waits ``interval`` seconds per snapshot, ``"accelerated"``
+    waits ``interval / speed`` and ``"backtest"`` never waits. Waits are
+    scheduled against absolute deadlines, so scoring time does not add
+    drift. :meth:`report` gives the achieved throughput.
+    """
+
+    MODES = ("realtime", "accelerated", "backtest")
+
+    def __init__(self, mode: str = "realtime", interval: float = 3.0, speed: float = 1.0):
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}, got {mode!r}")
+        if mode == "accelerated" and speed <= 0:
+            raise ValueError("speed must be positive")
+        self.mode = mode
+        self.interval = float(interval)
+        self.speed = float(speed) if mode == "accelerated" else 1.0
+        self.ticks = 0
+        self._start = None
+
+    @classmethod
+    def from_csv(cls, test_csv: str = "test2.csv", mode: str = "realtime", speed: float = 1.0):
+        """Build a clock whose interval is the sample period of the CSV's timestamp column."""
+        import pandas as pd
+
+        csv_path = (BASE_DIR / test_csv).resolve()
+        head = pd.read_csv(csv_path, usecols=[0], nrows=2)
+        stamps = pd.to_datetime(head.iloc[:, 0], errors="coerce")
+        interval = (stamps.iloc[1] - stamps.iloc[0]).total_seconds() if len(stamps) == 2 else None
+        if interval is None or not interval > 0:
+            raise ValueError(f"Cannot infer a sample interval from {csv_path}")
+        return cls(mode=mode, interval=interval, speed=speed)
+
+    @property
+    def period(self) -> float:
+        return 0.0 if self.mode == "backtest" else self.interval / self.speed
+
+    def start(self):
+        self._start = time.perf_counter()
+        self.ticks = 0
+
+    def tick(self):
+        """Mark one snapshot processed and wait for the next slot."""
+        delay = self.next_delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    def next_delay(self) -> float:
+        """Mark one snapshot processed and return the seconds left until the next slot."""
+        if self._start is None:
+            self.start()
+        self.ticks += 1
+        period = self.period
+        if not period:
+            return 0.0
+        return self._start + self.ticks * period - time.perf_counter()
+
+    def scaled(self, seconds: float) -> float:
+        """Wall-clock seconds for ``seconds`` of replay time (0 in backtest mode)."""
+        return 0.0 if self.mode == "backtest" else seconds / self.speed
+
+    def sleep(self, seconds: float):
+        """Wait ``seconds`` of replay time (scaled by the mode)."""
+        delay = self.scaled(seconds)
+        if delay:
+            time.sleep(delay)
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self._start if self._start is not None else 0.0
+        rate = self.ticks / elapsed if elapsed > 0 else 0.0
+        return {"mode": self.mode, "snapshots": self.ticks, "elapsed_s": elapsed, "snapshots_per_s": rate}
+
+
+def warn_loop(
+    get_snapshot,
+    history_buffer,
+    scaler,
+    pca,
+    log,
+    threshold_t2,
+    threshold_spe,
+    adaptive=None,
+    clock=None,
+    scorer=None,
+    watcher=None,
+    transport=None,
+    episodes=None,
+    metrics=None,
+):
+    """Score snapshots until ``get_snapshot`` raises StopIteration.
+
+    This is the single-threaded loop; :func:`run_pipeline` runs the same
+    stages on the asyncio runtime in AI/runtime.py. Machine alarms are not
+    raised here (see :func:`trigger_alarm` and
+    ``PipelineRuntime.raise_alarm``).
+
+    Stage timings, throughput and event rate go to ``metrics``
+    (AI/metrics.py), which prints a ``[Metrics]`` line every
+    ``log_interval`` seconds and once more when the loop ends.
+    """
+    if adaptive is not None and watcher is not None:
+        raise ValueError("adaptive and watcher both replace the model; pass only one")
+    scorer = scorer or FusedScorer(scaler, pca)
+    clock = clock or ReplayClock()
+    metrics = metrics or PipelineMetrics()
+    perf = time.perf_counter
+    clock.start()
     while True:
+        started = perf()
         try:
             snap = get_snapshot()
         except StopIteration:
             print("Sensor data exhausted, stopping warn loop.")
+            if episodes is not None and episodes.active:
+                summary = episodes.close(time.time(), reason="stopped")
+                _emit_warn(summary, history_buffer, log, transport, metrics)
             break
-        history_buffer.append(snap.tolist())
-        snap_scaled = scaler.transform(snap.reshape(1, -1))
-
-        risk_t2 = compute_risk_pca(pca, snap_scaled)
-        risk_spe = compute_spe(pca, snap_scaled)
-        print(f"[T2] {risk_t2:.4f}   [SPE] {risk_spe:.4f}")
-
-        if (risk_t2 > threshold_t2) or (risk_spe > threshold_spe):
-            top3_t2 = get_top3_features_with_scores(pca, snap_scaled)
-            top3_spe = get_top3_spe_features(pca, snap_scaled)
-            event = {
-                "event_type": "WARN",
-                "timestamp": time.time(),
-                "risk": float(risk_t2),
-                "spe": float(risk_spe),
-                "top3_t2": top3_t2,
-                "top3_spe": top3_spe,
-                "history": list(history_buffer),
-                "alarm_code": "Warning",
-                "raw_data": snap.tolist(),
-                "source": "sensor",
-            }
-            event = json.loads(json.dumps(event, default=float))
-            log.add(event)
-            response = send_event_to_dashboard(event)
-            if response and isinstance(response, dict):
-                alert_id = response.get("id")
-                if alert_id:
-                    send_event_to_mcp(alert_id, event)
-
-        time.sleep(3)
-        print(">>> ALARM TEST RUN")
-        trigger_alarm(code=101, log=log, history_buffer=history_buffer, scaler=scaler, pca=pca)
-
-
-
-def analyze_alarm_snapshot(pca, scaler, history_buffer):
-    snap = np.array(history_buffer[-1]).reshape(1, -1)
-    snap_scaled = scaler.transform(snap)
-    t2 = compute_risk_pca(pca, snap_scaled)
-    spe = compute_spe(pca, snap_scaled)
-    top3_t2 = get_top3_features_with_scores(pca, snap_scaled)
-    top3_spe = get_top3_spe_features(pca, snap_scaled)
-    return {"risk": float(t2), "spe": float(spe), "top3_t2": top3_t2, "top3_spe": top3_spe}
-
-
-def trigger_alarm(code, log: EventLog, history_buffer, scaler, pca):
-    if not history_buffer:
-        raise ValueError("history_buffer is empty")
-    latest_raw = history_buffer[-1]
-    latest_snap = np.array(latest_raw).reshape(1, -1)
-    analysis = analyze_alarm_snapshot(pca, scaler, history_buffer)
+        read = perf()
+        metrics.record("read", read - started)
+        metrics.count_snapshot()
+        history_buffer.append(snap if isinstance(history_buffer, SnapshotRing) else snap.tolist())
+        if adaptive is not None:
+            scorer, threshold_t2, threshold_spe = adaptive.state
+        elif watcher is not None:
+            scorer, threshold_t2, threshold_spe = watcher.state
+        result = scorer.score(snap)
+        exceeded = (result.t2 > threshold_t2) or (result.spe > threshold_spe)
+        scored = perf()
+        metrics.record("score", scored - read)
+
+        if episodes is not None:
+            analysis = episodes.observe(time.time(), result, threshold_t2, threshold_spe)
+        else:
+            analysis = result.as_dict() if exceeded else None
+        if exceeded:
+            metrics.record("contribution", perf() - scored)
+        if analysis is not None:
+            _emit_warn(analysis, history_buffer, log, transport, metrics)
+        if not exceeded and adaptive is not None:
+            adaptive.observe(snap)
+
+        clock.tick()
+        metrics.maybe_log()
+
+    report = clock.report()
+    print(
+        f"[Clock] {report['snapshots']} snapshots in {report['elapsed_s']:.2f}s "
+        f"({report['snapshots_per_s']:.1f} snapshots/s, {report['mode']})"
+    )
+    if metrics.log_interval is not None:
+        metrics.log()
+    return report
+
+
+
+EPISODE_ALARM_CODES = {"open": "Warning", "update": "Warning-update", "close": "Warning-cleared"}
+
+
+def _history_rows(history_buffer, n: int = EVENT_HISTORY_ROWS):
+    """The last ``n`` history rows as lists, from a :class:`SnapshotRing` or a deque of lists."""
+    if isinstance(history_buffer, SnapshotRing):
+        return history_buffer.tolist(n)
+    return list(history_buffer)[-n:]
+
+
+def _row_list(row):
+    return row.tolist() if isinstance(row, np.ndarray) else list(row)
+
+
+def _analysis_event(event_type, alarm_code, source, analysis, history_buffer, raw_data):
+    """The event fields WARN and ALARM events share, built from a scorer's ``analysis``.
+
+    A multi-block model's ``block`` summary (AI/multiblock.py) is passed through.
+    """
     event = {
-        "event_type": "ALARM",
+        "event_type": event_type,
         "timestamp": time.time(),
         "risk": analysis["risk"],
         "spe": analysis["spe"],
         "top3_t2": analysis["top3_t2"],
         "top3_spe": analysis["top3_spe"],
-        "history": list(history_buffer),
-        "alarm_code": code,
-        "raw_data": list(latest_raw),
-        "source": "machine",
+        "history": _history_rows(history_buffer),
+        "alarm_code": alarm_code,
+        "raw_data": _row_list(raw_data),
+        "source": source,
     }
-    event = json.loads(json.dumps(event, default=float))
+    if "block" in analysis:
+        event["block"] = analysis["block"]
+    return event
+
+
+def _warn_event(analysis, history_buffer, raw_data):
+    """Build a WARN event from ``analysis``; an ``episode`` block selects the alarm code."""
+    event = _analysis_event("WARN", "Warning", "sensor", analysis, history_buffer, raw_data)
+    if "episode" in analysis:
+        event["episode"] = analysis["episode"]
+        event["alarm_code"] = EPISODE_ALARM_CODES[analysis["episode"]["phase"]]
+    return event
+
+
+def _emit_warn(analysis, history_buffer, log, transport, metrics):
+    with metrics.time("serialize"):
+        event = _warn_event(analysis, history_buffer, history_buffer[-1])
     log.add(event)
+    deliver_event(event, transport, metrics)
+    metrics.count_event()
+
+
+def analyze_alarm_snapshot(pca, scaler, history_buffer, scorer=None):
+    if scorer is None:
+        scorer = FusedScorer(scaler, pca)
+    snap = np.asarray(history_buffer[-1], dtype=float)
+    return scorer.analyze(snap)
+
+
+def deliver_event(event: dict, transport: EventTransport | None = None, metrics=None):
+    """Hand ``event`` to ``transport`` (non-blocking) or post it synchronously.
+
+    The synchronous path sends the event to the dashboard and, if an alert
+    was created, enqueues its MCP job before returning. Its request times
+    are recorded in ``metrics``; the transport records its own.
+    """
+    if transport is not None:
+        transport.send(event)
+        return
+    started = time.perf_counter()
     response = send_event_to_dashboard(event)
+    if metrics is not None:
+        metrics.record("dashboard_post", time.perf_counter() - started)
     if response and isinstance(response, dict):
         alert_id = response.get("id")
-        if alert_id:
+        if alert_id and wants_mcp_job(event):
+            started = time.perf_counter()
             send_event_to_mcp(alert_id, event)
+            if metrics is not None:
+                metrics.record("mcp_post", time.perf_counter() - started)
+
+
+def alarm_event(code, history_buffer, scaler, pca, scorer=None) -> dict:
+    """Build a machine ALARM event for the latest snapshot in ``history_buffer``."""
+    if not history_buffer:
+        raise ValueError("history_buffer is empty")
+    analysis = analyze_alarm_snapshot(pca, scaler, history_buffer, scorer=scorer)
+    return _analysis_event("ALARM", code, "machine", analysis, history_buffer, history_buffer[-1])
+
+
+def trigger_alarm(code, log: EventLog, history_buffer, scaler, pca, scorer=None, transport=None, metrics=None):
+    event = alarm_event(code, history_buffer, scaler, pca, scorer=scorer)
+    log.add(event)
+    deliver_event(event, transport, metrics)
+    if metrics is not None:
+        metrics.count_event()
     return event
 
 
-def run_pipeline(normal_csv: str = "normal.csv", test_csv: str = "test2.csv"):
-    train_models(normal_csv)
-    scaler, pca, threshold_t2, threshold_spe = load_trained_artifacts()
-    sensor_cols = load_sensor_data(test_csv)
-    history_buffer = deque(maxlen=5)
-    get_snapshot = make_snapshot_reader(sensor_cols)
+def run_pipeline(
+    normal_csv: str = "normal.csv",
+    test_csv: str = "test2.csv",
+    adaptive: bool = False,
+    clock: ReplayClock | None = None,
+    registry_dir=None,
+    outbox_dir=EVENT_OUTBOX_DIR,
+    coalesce: bool = True,
+    history_window: int = EVENT_HISTORY_ROWS,
+    from_db: bool = False,
+    cursor_path=SENSOR_CURSOR_PATH,
+    stats_port: int | None = STATS_PORT,
+    multiblock: bool = False,
+):
+    """Train, then replay ``test_csv`` through the warn loop.
+
+    ``clock`` sets the pacing: the default waits 3 seconds per snapshot,
+    ``ReplayClock.from_csv(test_csv)`` follows the data's own timestamps and
+    ``ReplayClock("backtest")`` runs unthrottled.
+
+    With ``registry_dir`` the trained bundle is published to that model
+    registry and the loop serves whatever version ``ACTIVE`` points at,
+    switching when it changes (see AI/model_registry.py).
+
+    Events are written to the outbox in ``outbox_dir`` before delivery, so
+    alarms raised while the backend is down are sent once it is back,
+    including ones left over from a previous run.
+
+    With ``coalesce`` consecutive exceedances form one alarm episode
+    (AI/episodes.py): one event when it opens, updates only on material
+    changes, and a summary when it clears.
+
+    ``history_window`` sets how many snapshots the history ring keeps (for
+    example 3600 for an hour at 1 Hz); events always carry the last
+    ``EVENT_HISTORY_ROWS`` of them.
+
+    With ``from_db`` the loop scores new rows of the `sensor` table as they
+    are inserted instead of ``test_csv`` (see ``SensorTail`` in
+    AI/sensor_db.py), resuming after the row recorded in ``cursor_path``.
+    The tail paces itself, so the default clock is then ``"backtest"``.
+
+    With ``multiblock`` the model is the per-group multi-block PCA of
+    AI/multiblock.py instead of the global one. Its thresholds are the
+    consensus limits, and events also carry a ``block`` naming the process
+    group that exceeded.
+
+    The stages run on the asyncio runtime in AI/runtime.py, joined by
+    bounded queues; Ctrl-C stops the source and drains what is queued.
+
+    Stage latencies, throughput and the transport/episode/runtime counters
+    are logged as a ``[Metrics]`` line every 10 seconds. With ``stats_port``
+    (``AI_STATS_PORT``) they are also served at
+    ``http://127.0.0.1:<port>/stats``.
+    """
+    if adaptive and registry_dir is not None:
+        raise ValueError("adaptive and registry_dir both replace the model; pass only one")
+    if adaptive and multiblock:
+        raise ValueError("adaptive updates the global PCA; it cannot be combined with multiblock")
+    clock = clock or ReplayClock("backtest" if from_db else "realtime")
+    if multiblock:
+        from AI.multiblock import train_multiblock
+
+        bundle_path = train_multiblock(normal_csv)[1]
+    else:
+        train_models(normal_csv)
+        bundle_path = BASE_DIR / MODEL_BUNDLE_NAME
+    watcher = None
+    if registry_dir is not None:
+        from AI.model_registry import ModelRegistry, RegistryWatcher
+
+        registry = ModelRegistry(registry_dir)
+        registry.publish(bundle_path)
+        watcher = RegistryWatcher(registry).start()
+        bundle = registry.load(watcher.version)[1]
+    else:
+        bundle = load_model_bundle(bundle_path)
+    scaler, pca = bundle.scaler, bundle.pca
+    threshold_t2, threshold_spe = bundle.threshold_t2, bundle.threshold_spe
+    scorer = scorer_from_bundle(bundle)
+    history_buffer = SnapshotRing(bundle.n_features, history_window)
+    tail = None
+    if from_db:
+        from AI.sensor_db import SensorTail
+
+        get_snapshot = tail = SensorTail(state_path=cursor_path)
+    else:
+        get_snapshot = make_chunked_snapshot_reader(prefetch(iter_sensor_csv(test_csv)))
     log = EventLog()
+    adaptive_model = AdaptivePCAModel(scaler, pca, threshold_t2, threshold_spe) if adaptive else None
+
+    from AI.episodes import EpisodeTracker
+    from AI.outbox import Outbox
+
+    episodes = EpisodeTracker() if coalesce else None
+    metrics = PipelineMetrics()
 
-    warn_thread = threading.Thread(
-        target=warn_loop,
-        args=(get_snapshot, history_buffer, scaler, pca, log, threshold_t2, threshold_spe),
+    transport = EventTransport(
+        DASHBOARD_EVENTS_URL,
+        MCP_ENQUEUE_URL,
+        manual_path=_manual_path(),
+        outbox=Outbox(outbox_dir),
+        packed=True,
+        metrics=metrics,
     )
-    warn_thread.daemon = False  # keep warn loop alive until join() completes
-    warn_thread.start()
-    time.sleep(15)  # warn_loop 조금 돌리고
+    metrics.add_source("transport", transport.stats)
+    if episodes is not None:
+        metrics.add_source("episodes", episodes.stats)
+    if tail is not None:
+        metrics.add_source("sensor_tail", tail.stats)
+    stats_server = None
+    if stats_port:
+        from AI.metrics import serve_stats
 
-    print(">>> ALARM TEST RUN")
-    trigger_alarm(code=101, log=log, history_buffer=history_buffer, scaler=scaler, pca=pca)
+        stats_server = serve_stats(metrics, port=stats_port)
+        print(f"[Metrics] Serving http://127.0.0.1:{stats_port}/stats")
 
-    print(">>> LAST LOG")
-    print(log.logs[-1])
+    from AI.runtime import PipelineRuntime
 
-    try:
-        warn_thread.join()
-    except KeyboardInterrupt:
-        print("Stopping warn loop...")
+    runtime = PipelineRuntime(
+        get_snapshot,
+        scorer,
+        threshold_t2,
+        threshold_spe,
+        history_buffer,
+        log,
+        adaptive=adaptive_model,
+        watcher=watcher,
+        clock=clock,
+        episodes=episodes,
+        transport=transport,
+        metrics=metrics,
+        source_batch=1 if from_db or clock.period else 256,
+    )
+    metrics.add_source("runtime", runtime.stats)
+
+    # warn stage 조금 돌리고: 15초 분량의 스냅샷이 처리된 뒤 (backtest 에서도 동일하게) 테스트 알람을 보냅니다.
+    alarm_after = max(1, int(np.ceil(15 / clock.interval)))
+    print(f">>> ALARM TEST RUN after {alarm_after} snapshots")
+    runtime.raise_alarm(101, after_snapshots=alarm_after)
+    runtime.run()
+
+    if log.logs:
+        print(">>> LAST LOG")
+        print(log.logs[-1])
+    print(f"[Runtime] {runtime.stats()}")
+    if tail is not None:
+        tail.close()
+        print(f"[Sensor tail] {tail.stats()}")
+    if watcher is not None:
+        watcher.stop()
+    transport.close(timeout=30)
+    print(f"[Transport] {transport.stats()}")
+    if stats_server is not None:
+        stats_server.shutdown()
+    if episodes is not None:
+        print(f"[Episodes] {episodes.stats()}")
 
     return log, history_buffer, scaler, pca
 
+def _manual_path() -> str:
+    return MANUAL_PATH or str(Path(MANUAL_DIR) / "manual.txt")
+
+
 def send_event_to_mcp(alert_id: int, event: dict):
-    manual_path = MANUAL_PATH or str(Path(MANUAL_DIR) / "manual.txt")
-    payload = {
-        "trace_id": f"ai-event-{alert_id}-{uuid4().hex}",
-        "message": str(event.get("alarm_code", "")),
-        "anomaly": {
-            "sensor_id": event.get("sensor_id", 0),
-            "type": event.get("event_type", "warning"),
-        },
-        "manual_reference": {"path": manual_path},
-        "metadata": {
-            "dashboard_id": alert_id,
-            "event_type": (event.get("event_type") or "warning").upper(),
-        },
-    }
+    payload = mcp_job_payload(alert_id, event, _manual_path())
     try:
         resp = requests.post(MCP_ENQUEUE_URL, json=payload, timeout=5)
         if resp.status_code >= 400:
             print(f"[MCP] Failed to enqueue job ({resp.status_code}): {resp.text}")
-        else:
-            print(f"[MCP] Job enqueued ({resp.status_code})")
     except requests.RequestException as exc:
         print(f"[MCP] Error enqueueing job: {exc}")
 
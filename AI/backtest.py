@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Offline backtest: score whole sensor CSVs and write columnar results.
+
+Each input file is scored in vectorized chunks by one worker of a process
+pool and written to ``<out-dir>/<file stem>.npz`` with one array per column:
+
+* ``t2``, ``spe`` (float32) and ``t2_exceed``, ``spe_exceed`` (bool) per row
+* ``event_row`` plus ``event_top3_t2``/``event_top3_spe`` sensor numbers and
+  their ``*_score`` contributions for every row over either threshold
+
+A ``summary.json`` with per-file exceedance rates is written next to them.
+``--float32`` reads and scores in float32 (see AI/scoring.py for the
+tolerance), which halves the memory traffic of every chunk.
+
+Workers load the numpy-only ``model.bundle`` (no sklearn needed) through a
+memory map, so the projector pages are shared between them rather than
+unpickled into each process. A multi-block bundle scores with its
+multi-block model.
+
+Usage (from the repository root)::
+
+    python -m AI.backtest data/d01_te.csv data/d02_te.csv --out-dir backtest_out --workers 4
+    python -m AI.backtest data/d01_te.csv --float32
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from AI import ai  # noqa: E402
+
+_MODEL = None
+
+
+def load_model(model_dir=None, dtype=np.float64):
+    """``(scorer, t2_limit, spe_limit)`` from the bundle in ``model_dir``, scoring in ``dtype``."""
+    path = Path(model_dir) / ai.MODEL_BUNDLE_NAME if model_dir else None
+    bundle = ai.load_model_bundle(path)
+    scorer = ai.scorer_from_bundle(bundle)
+    if scorer.dtype != np.dtype(dtype):
+        # The bundle holds one dtype; the cast copies only the small scoring arrays.
+        scorer = copy.copy(scorer)
+        for name in ("projector", "inv_lambdas", "abs_components"):
+            setattr(scorer, name, getattr(scorer, name).astype(dtype))
+    return scorer, bundle.threshold_t2, bundle.threshold_spe
+
+
+def _init_worker(model_dir, dtype):
+    global _MODEL
+    _MODEL = load_model(model_dir, dtype)
+
+
+def backtest_file(csv_path, out_dir, model, chunk_size: int = 50_000, dtype=np.float64):
+    """Score one CSV with ``model = (scorer, t2_limit, spe_limit)`` and write its ``.npz``.
+
+    ``scorer`` is a :class:`~AI.scoring.FusedScorer` (or multi-block scorer)
+    as returned by :func:`load_model`; it scores in its own dtype.
+    """
+    scorer, threshold_t2, threshold_spe = model
+    started = time.perf_counter()
+    t2_parts, spe_parts, t2_flags, spe_flags = [], [], [], []
+    event_rows, top_t2, top_t2_score, top_spe, top_spe_score = [], [], [], [], []
+    offset = 0
+
+    for chunk in ai.iter_sensor_csv(str(csv_path), chunk_size=chunk_size, dtype=dtype):
+        scores = scorer.score_batch(chunk, contributions=False)
+        t2_parts.append(scores["t2"].astype(np.float32))
+        spe_parts.append(scores["spe"].astype(np.float32))
+
+        # Flags come from the full-precision scores, like the events, not the stored float32 copies.
+        t2_exceed = scores["t2"] > threshold_t2
+        spe_exceed = scores["spe"] > threshold_spe
+        t2_flags.append(t2_exceed)
+        spe_flags.append(spe_exceed)
+        exceed = t2_exceed | spe_exceed
+        if exceed.any():
+            detail = scorer.score_batch(chunk[exceed])
+            sensors, contrib = ai.top_k_rows(detail["t2_contrib"])
+            top_t2.append(sensors.astype(np.int16))
+            top_t2_score.append(contrib.astype(np.float32))
+            sensors, contrib = ai.top_k_rows(detail["spe_contrib"])
+            top_spe.append(sensors.astype(np.int16))
+            top_spe_score.append(contrib.astype(np.float32))
+            event_rows.append(np.flatnonzero(exceed) + offset)
+        offset += len(chunk)
+
+    t2 = np.concatenate(t2_parts) if t2_parts else np.empty(0, dtype=np.float32)
+    spe = np.concatenate(spe_parts) if spe_parts else np.empty(0, dtype=np.float32)
+
+    def _stack(parts, dtype, width=3):
+        return np.concatenate(parts) if parts else np.empty((0, width), dtype=dtype)
+
+    columns = {
+        "t2": t2,
+        "spe": spe,
+        "t2_exceed": np.concatenate(t2_flags) if t2_flags else np.empty(0, dtype=bool),
+        "spe_exceed": np.concatenate(spe_flags) if spe_flags else np.empty(0, dtype=bool),
+        "event_row": np.concatenate(event_rows) if event_rows else np.empty(0, dtype=np.int64),
+        "event_top3_t2": _stack(top_t2, np.int16),
+        "event_top3_t2_score": _stack(top_t2_score, np.float32),
+        "event_top3_spe": _stack(top_spe, np.int16),
+        "event_top3_spe_score": _stack(top_spe_score, np.float32),
+        "threshold_t2": np.float64(threshold_t2),
+        "threshold_spe": np.float64(threshold_spe),
+    }
+    out_path = Path(out_dir) / f"{Path(csv_path).stem}.npz"
+    np.savez_compressed(out_path, **columns)
+
+    events = columns["event_row"]
+    return {
+        "file": str(csv_path),
+        "output": str(out_path),
+        "rows": int(len(t2)),
+        "t2_exceed_rate": float(columns["t2_exceed"].mean()) if len(t2) else 0.0,
+        "spe_exceed_rate": float(columns["spe_exceed"].mean()) if len(t2) else 0.0,
+        "event_rate": float(len(events) / len(t2)) if len(t2) else 0.0,
+        "first_event_row": int(events[0]) if len(events) else None,
+        "elapsed_s": time.perf_counter() - started,
+    }
+
+
+def _run_one(csv_path, out_dir, chunk_size, dtype):
+    return backtest_file(csv_path, out_dir, _MODEL, chunk_size, dtype)
+
+
+def run_backtest(csv_paths, out_dir, model_dir=None, workers=None, chunk_size: int = 50_000, dtype=np.float64):
+    """Score ``csv_paths`` across a process pool and write ``summary.json`` to ``out_dir``."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    csv_paths = [str(Path(path).resolve()) for path in csv_paths]
+    stems = [Path(path).stem for path in csv_paths]
+    if len(set(stems)) != len(stems):
+        raise ValueError("Input files must have distinct names; outputs are keyed by file stem")
+
+    workers = workers or min(len(csv_paths), os.cpu_count() or 1)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_dir, dtype)) as pool:
+        futures = [pool.submit(_run_one, path, str(out_dir), chunk_size, dtype) for path in csv_paths]
+        results = [future.result() for future in futures]
+
+    summary = {
+        "model_dir": str(Path(model_dir).resolve()) if model_dir else str(ai.BASE_DIR),
+        "workers": workers,
+        "dtype": np.dtype(dtype).name,
+        "elapsed_s": time.perf_counter() - started,
+        "files": results,
+    }
+    with open(out_dir / "summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score sensor CSVs offline into columnar .npz files.")
+    parser.add_argument("csv", nargs="+", help="sensor CSV files to score")
+    parser.add_argument("--out-dir", default="backtest_out")
+    parser.add_argument("--model-dir", default=None, help="directory with model.bundle")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--float32", action="store_true", help="read and score in float32")
+    args = parser.parse_args(argv)
+
+    dtype = np.float32 if args.float32 else np.float64
+    summary = run_backtest(args.csv, args.out_dir, args.model_dir, args.workers, args.chunk_size, dtype)
+    for result in summary["files"]:
+        print(
+            f"{Path(result['file']).name}: {result['rows']} rows, "
+            f"T2 {result['t2_exceed_rate']:.2%} SPE {result['spe_exceed_rate']:.2%} "
+            f"first event row {result['first_event_row']} ({result['elapsed_s']:.2f}s)"
+        )
+    print(f"Scored {len(summary['files'])} files in {summary['elapsed_s']:.2f}s -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
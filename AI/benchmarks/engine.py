@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""Throughput benchmarks for training and scoring, with a baseline comparison.
+
+Benchmarks (``BENCHMARKS``), each run at every requested row count:
+
+* ``train_models`` / ``train_models_streaming``: training from a synthetic
+  normal CSV written beforehand (untimed), up to ``max_train_rows``.
+* ``score_snapshot``: :meth:`FusedScorer.score` one row at a time, as the
+  warn loop does, up to ``max_snapshot_rows``.
+* ``score_batch``: :func:`score_batch` T²/SPE without contributions.
+* ``contributions``: :func:`score_batch` with contributions, plus the
+  T²/SPE top-3 ranking of every row (:func:`top_k_rows`).
+
+Scoring runs on synthetic TEP-shaped rows (AI/benchmarks/synthetic.py)
+with a step fault in the second half. The rows are generated once, in
+blocks of at most ``block_rows``, and reused cyclically for larger
+counts. Memory stays bounded at 10M rows and generation is never timed.
+
+Each measurement is repeated (each round lasting at least ``min_time``,
+like ``timeit``) and the minimum and median per-call times are kept. The
+results go to a JSON file. Against a baseline file the minimum times are
+compared per (benchmark, rows): a ratio above ``1 + tolerance`` is a
+regression, below ``1 - tolerance`` an improvement. Timings only compare
+on the same machine, so record the baseline with ``--update-baseline``
+on the machine that runs the comparison.
+
+Usage (from the repository root)::
+
+    python -m AI.benchmarks.engine --out bench.json --baseline AI/benchmarks/baseline.json
+    python -m AI.benchmarks.engine --full --only score_batch contributions
+    python -m AI.benchmarks.engine --update-baseline --baseline AI/benchmarks/baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from AI import ai  # noqa: E402
+from AI.benchmarks import synthetic  # noqa: E402
+
+BENCHMARKS = ("train_models", "train_models_streaming", "score_snapshot", "score_batch", "contributions")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+FULL_SIZES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+
+def _blocks(data, rows: int):
+    """Yield ``rows`` rows of ``data`` in blocks, cycling through it."""
+    remaining = rows
+    while remaining > 0:
+        block = data[: min(len(data), remaining)]
+        yield block
+        remaining -= len(block)
+
+
+def _timed(fn, repeat: int, min_time: float = 0.2):
+    """Per-call times of ``fn`` over ``repeat`` rounds.
+
+    Each round calls ``fn`` as many times as needed to last ``min_time``
+    (calibrated like ``timeit``), so short calls are not timer noise.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / elapsed) + 1) if elapsed > 0 else number * 10
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - started) / number)
+    return times
+
+
+class EngineBenchmark:
+    """Holds the fitted model and the synthetic scoring rows shared by all benchmarks."""
+
+    def __init__(self, seed: int = 0, block_rows: int = 100_000, model_rows: int = 20_000):
+        stats = ai.RunningCovariance(synthetic.N_CHANNELS)
+        for chunk in synthetic.iter_chunks(model_rows, seed=seed):
+            stats.update(chunk)
+        self.scaler, self.pca, _ = ai.models_from_moments(stats)
+        self.scorer = ai.FusedScorer(self.scaler, self.pca)
+        self.seed = seed
+        fault = synthetic.Fault(start=block_rows // 2, sensors=(0, 7, 44), kind="step", magnitude=4.0)
+        self.rows = synthetic.generate(block_rows, seed=seed + 1, fault=fault)
+
+    def score_snapshot(self, rows: int):
+        score = self.scorer.score
+        for block in _blocks(self.rows, rows):
+            for snap in block:
+                score(snap)
+
+    def score_batch(self, rows: int):
+        for block in _blocks(self.rows, rows):
+            ai.score_batch(self.pca, block, scaler=self.scaler, contributions=False)
+
+    def contributions(self, rows: int):
+        for block in _blocks(self.rows, rows):
+            scores = ai.score_batch(self.pca, block, scaler=self.scaler)
+            ai.top_k_rows(scores["t2_contrib"])
+            ai.top_k_rows(scores["spe_contrib"])
+
+    def train(self, name: str, rows: int, repeat: int, min_time: float = 0.2):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = synthetic.write_csv(Path(tmp) / "normal.csv", rows, seed=self.seed)
+            train = getattr(ai, name)
+
+            def _run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    train(str(csv_path), out_dir=tmp)
+
+            return _timed(_run, repeat, min_time)
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run(
+    sizes=DEFAULT_SIZES,
+    benchmarks=BENCHMARKS,
+    repeat: int = 5,
+    max_train_rows: int = 1_000_000,
+    max_snapshot_rows: int = 1_000_000,
+    seed: int = 0,
+    min_time: float = 0.2,
+) -> dict:
+    """Run ``benchmarks`` at each row count in ``sizes`` and return the results document."""
+    unknown = set(benchmarks) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+    bench = EngineBenchmark(seed=seed)
+    results = []
+    for name in benchmarks:
+        training = name.startswith("train")
+        limit = max_train_rows if training else max_snapshot_rows if name == "score_snapshot" else None
+        for rows in sizes:
+            if limit is not None and rows > limit:
+                continue
+            times = (
+                bench.train(name, rows, repeat, min_time)
+                if training
+                else _timed(lambda: getattr(bench, name)(rows), repeat, min_time)
+            )
+            median = statistics.median(times)
+            results.append(
+                {
+                    "benchmark": name,
+                    "rows": rows,
+                    "repeat": repeat,
+                    "seconds": median,
+                    "min_seconds": min(times),
+                    "rows_per_s": rows / median if median > 0 else 0.0,
+                }
+            )
+    return {"environment": _environment(), "results": results}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.3) -> list:
+    """Compare minimum times per (benchmark, rows) with ``baseline``; return one row per result."""
+    reference = {(r["benchmark"], r["rows"]): r for r in baseline.get("results", [])}
+    rows = []
+    for result in results["results"]:
+        base = reference.get((result["benchmark"], result["rows"]))
+        row = {"benchmark": result["benchmark"], "rows": result["rows"], "seconds": result["min_seconds"]}
+        if base is None:
+            row.update(baseline_s=None, ratio=None, status="new")
+        else:
+            ratio = result["min_seconds"] / base["min_seconds"] if base["min_seconds"] > 0 else float("inf")
+            status = "regression" if ratio > 1 + tolerance else "improvement" if ratio < 1 - tolerance else "ok"
+            row.update(baseline_s=base["min_seconds"], ratio=ratio, status=status)
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark training and scoring on synthetic TEP data.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=None, help="row counts (default 1k, 10k, 100k)")
+    parser.add_argument("--full", action="store_true", help="run 1k to 10M rows")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timing round")
+    parser.add_argument("--max-train-rows", type=int, default=1_000_000)
+    parser.add_argument("--max-snapshot-rows", type=int, default=1_000_000)
+    parser.add_argument("--out", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (FULL_SIZES if args.full else DEFAULT_SIZES)
+    results = run(
+        sizes, args.only, args.repeat, args.max_train_rows, args.max_snapshot_rows, min_time=args.min_time
+    )
+    baseline_path = Path(args.baseline)
+    comparison = None
+    if baseline_path.exists() and not args.update_baseline:
+        with open(baseline_path) as f:
+            comparison = compare(results, json.load(f), args.tolerance)
+        results["comparison"] = comparison
+
+    for i, result in enumerate(results["results"]):
+        line = (
+            f"{result['benchmark']:<24} {result['rows']:>10,} rows  {result['min_seconds']:>9.4f}s  "
+            f"{result['rows_per_s']:>14,.0f} rows/s"
+        )
+        if comparison is not None:
+            row = comparison[i]
+            line += f"  {row['status']}" + (f" ({row['ratio']:.2f}x)" if row["ratio"] is not None else "")
+        print(line)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {baseline_path}")
+    regressions = [row for row in comparison or [] if row["status"] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%} of {baseline_path}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Cold-start benchmark for the inference path.
+
+Each repeat runs in a fresh interpreter and measures how long it takes to
+import the scoring module, open the model bundle and score the first
+snapshot, and which heavy training dependencies ended up imported.
+
+Usage (from the repository root)::
+
+    python -m AI.benchmarks.startup --repeat 5
+    python -m AI.benchmarks.startup --module AI.scoring --json startup.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+HEAVY_MODULES = ("pandas", "sklearn", "scipy")
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import numpy as np
+import {module}
+imported = time.perf_counter()
+from AI.model_bundle import read_model_bundle
+from AI.scoring import FusedScorer
+bundle = read_model_bundle({bundle!r})
+scorer = FusedScorer.from_bundle(bundle)
+loaded = time.perf_counter()
+snap = np.asarray(bundle.scaler.mean_, dtype=float)
+scorer.analyze(snap)
+scored = time.perf_counter()
+print(json.dumps({{
+    "import_s": imported - started,
+    "load_s": loaded - imported,
+    "first_score_s": scored - loaded,
+    "total_s": scored - started,
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure_once(module: str, bundle_path) -> dict:
+    code = _CHILD.format(module=module, bundle=str(bundle_path), heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(module: str = "AI.ai", bundle_path=None, repeat: int = 5) -> dict:
+    """Return the median of each timing over ``repeat`` cold starts."""
+    bundle_path = Path(bundle_path or ROOT_DIR / "AI" / "model.bundle").resolve()
+    runs = [measure_once(module, bundle_path) for _ in range(repeat)]
+    report = {
+        "module": module,
+        "bundle": str(bundle_path),
+        "repeat": repeat,
+        "heavy_modules": sorted({name for r in runs for name in r["heavy_modules"]}),
+    }
+    for key in ("import_s", "load_s", "first_score_s", "total_s"):
+        report[key] = statistics.median(r[key] for r in runs)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import and first-score latency.")
+    parser.add_argument("--module", default="AI.ai", help="module a scoring process imports first")
+    parser.add_argument("--bundle", default=None, help="model bundle to load (default: AI/model.bundle)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.module, args.bundle, args.repeat)
+    print(
+        f"[Startup] {report['module']}: import {report['import_s'] * 1e3:.1f} ms, "
+        f"bundle {report['load_s'] * 1e3:.1f} ms, first score {report['first_score_s'] * 1e3:.2f} ms, "
+        f"total {report['total_s'] * 1e3:.1f} ms (median of {report['repeat']})"
+    )
+    print(f"[Startup] heavy modules imported: {', '.join(report['heavy_modules']) or 'none'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Synthetic Tennessee Eastman-shaped sensor data for benchmarks.
+
+Rows have the 52 channels of ``SENSOR_COLUMNS`` (41 XMEAS and 11 XMV).
+They are driven by a few slow latent process variables, moving averages
+of white noise, through fixed loadings. Each channel has its own level
+and spread (0.1 to a few thousand, like the real plant) plus independent
+measurement noise, so the channels are correlated the way PCA monitoring
+expects.
+
+Generation is chunked and carries its state across chunks, so
+``iter_chunks(n, chunk_rows)`` gives the same rows for any ``chunk_rows``.
+Arbitrarily large data sets can be streamed in bounded memory.
+
+A :class:`Fault` adds a step, a drift or extra noise to chosen channels
+from a given row on.
+"""
+
+import io
+
+import numpy as np
+
+N_XMEAS = 41
+N_XMV = 11
+N_CHANNELS = N_XMEAS + N_XMV
+FAULT_KINDS = ("step", "drift", "noise")
+CSV_COLUMNS = [f"XMEAS({i})" for i in range(1, N_XMEAS + 1)] + [f"XMV({i})" for i in range(1, N_XMV + 1)]
+
+
+class Fault:
+    """Disturbance on ``sensors`` (0-based channel indexes) from row ``start`` on.
+
+    ``magnitude`` is in channel standard deviations. It is the step size,
+    the drift per 1000 rows, or the extra noise level, depending on ``kind``.
+    """
+
+    def __init__(self, start: int = 0, sensors=(0,), kind: str = "step", magnitude: float = 4.0):
+        if kind not in FAULT_KINDS:
+            raise ValueError(f"kind must be one of {FAULT_KINDS}, got {kind!r}")
+        self.start = start
+        self.sensors = np.asarray(sensors, dtype=int)
+        self.kind = kind
+        self.magnitude = magnitude
+
+    def apply(self, rows, first_row: int, spread, rng):
+        """Disturb ``rows`` (which start at ``first_row``) in place."""
+        offset = max(0, self.start - first_row)
+        if offset >= len(rows):
+            return
+        block = rows[offset:, self.sensors]
+        scale = spread[self.sensors] * self.magnitude
+        if self.kind == "step":
+            block += scale
+        elif self.kind == "drift":
+            elapsed = np.arange(first_row + offset - self.start, first_row + len(rows) - self.start)
+            block += np.outer(elapsed / 1000.0, scale)
+        else:
+            block += rng.normal(size=block.shape) * scale
+        rows[offset:, self.sensors] = block
+
+
+class TEPGenerator:
+    """Deterministic stream of TEP-shaped rows for a given ``seed``."""
+
+    def __init__(self, seed: int = 0, n_latent: int = 8, smoothing: int = 20, noise: float = 0.3):
+        setup = np.random.default_rng(seed)
+        self.n_latent = n_latent
+        self.smoothing = smoothing
+        self.levels = np.exp(setup.uniform(np.log(0.1), np.log(4000.0), size=N_CHANNELS))
+        self.spread = self.levels * setup.uniform(0.005, 0.05, size=N_CHANNELS)
+        loadings = setup.normal(size=(n_latent, N_CHANNELS))
+        # Manipulated variables follow the first few latent loops more tightly.
+        loadings[: n_latent // 2, N_XMEAS:] *= 2.0
+        self.loadings = loadings / np.linalg.norm(loadings, axis=0)
+        self.noise = noise
+        self._latent_rng = np.random.default_rng([seed, 1])
+        self._noise_rng = np.random.default_rng([seed, 2])
+        self._fault_rng = np.random.default_rng([seed, 3])
+        self._tail = self._latent_rng.normal(size=(smoothing - 1, n_latent))
+        self.rows = 0
+
+    def next_chunk(self, n: int, fault: Fault | None = None):
+        """Return the next ``n`` rows as a ``(n, 52)`` float64 array."""
+        shocks = np.concatenate([self._tail, self._latent_rng.normal(size=(n, self.n_latent))])
+        csum = np.cumsum(shocks, axis=0)
+        csum = np.concatenate([np.zeros((1, self.n_latent)), csum])
+        window = self.smoothing
+        latent = (csum[window:] - csum[:-window]) / np.sqrt(window)
+        self._tail = shocks[len(shocks) - (window - 1) :]
+
+        rows = latent @ self.loadings
+        rows += self.noise * self._noise_rng.normal(size=rows.shape)
+        rows = rows * self.spread + self.levels
+        if fault is not None:
+            fault.apply(rows, self.rows, self.spread, self._fault_rng)
+        self.rows += n
+        return rows
+
+
+def iter_chunks(rows: int, chunk_rows: int = 100_000, seed: int = 0, fault: Fault | None = None, **kwargs):
+    """Yield ``rows`` synthetic rows in chunks of at most ``chunk_rows``."""
+    generator = TEPGenerator(seed, **kwargs)
+    remaining = rows
+    while remaining > 0:
+        n = min(chunk_rows, remaining)
+        yield generator.next_chunk(n, fault)
+        remaining -= n
+
+
+def generate(rows: int, seed: int = 0, fault: Fault | None = None, **kwargs):
+    """Return ``rows`` synthetic rows as one array."""
+    chunks = list(iter_chunks(rows, max(rows, 1), seed, fault, **kwargs))
+    return np.concatenate(chunks) if chunks else np.empty((0, N_CHANNELS))
+
+
+def write_csv(path, rows: int, seed: int = 0, fault: Fault | None = None, chunk_rows: int = 100_000):
+    """Write a CSV shaped like AI/test2.csv: a timestamp column, then the 52 channels."""
+    start = np.datetime64("1970-01-01T00:00")
+    written = 0
+    with open(path, "w") as f:
+        f.write(",".join(["", *CSV_COLUMNS]) + "\n")
+        for chunk in iter_chunks(rows, chunk_rows, seed, fault):
+            stamps = (start + np.arange(written, written + len(chunk)) * np.timedelta64(3, "m")).astype(str)
+            values = io.StringIO()
+            np.savetxt(values, chunk, fmt="%.10g", delimiter=",")
+            f.writelines(f"{stamp},{line}\n" for stamp, line in zip(stamps, values.getvalue().splitlines()))
+            written += len(chunk)
+    return path
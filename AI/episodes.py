@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Coalesce consecutive exceedances into alarm episodes.
+
+An episode opens on the first snapshot over either limit (or after
+``open_after`` consecutive ones, which keeps isolated single-snapshot false
+alarms from becoming open/close pairs). While it is open
+a new event is emitted only when the picture changes materially:
+- severity has grown or shrunk by a factor of ``severity_step`` since the
+  last emitted event, where severity is the larger of T²/limit and
+  SPE/limit;
+- at least ``sensor_change`` sensors of the T²/SPE top-k are replaced.
+The sensor test uses contributions smoothed with weight ``smoothing`` per
+snapshot, so a third-place sensor that flickers from one snapshot to the
+next does not count as a change. Updates are at most one per
+``min_update_gap`` snapshots.
+
+The episode closes after ``dwell`` consecutive snapshots below
+``clear_ratio`` times the limits (hysteresis). Snapshots between
+``clear_ratio`` and the limit keep it open. The closing event carries a
+summary with the peak values and the sensors that contributed most over
+the whole episode.
+
+With a multi-block model (AI/multiblock.py) each event also carries the
+snapshot's ``block`` summary, and the closing one the block summary of the
+episode's peak snapshot.
+"""
+
+from uuid import uuid4
+
+import numpy as np
+
+from AI.scoring import top_k_sensors
+
+OPEN, UPDATE, CLOSE = "open", "update", "close"
+
+
+def _severity(t2, spe, threshold_t2, threshold_spe) -> float:
+    """The larger of T²/limit and SPE/limit.
+
+    A limit of zero or less (an empty residual spectrum, where the statistic
+    is identically zero) leaves that statistic out instead of dividing by it.
+    """
+    ratios = [value / limit for value, limit in ((t2, threshold_t2), (spe, threshold_spe)) if limit > 0]
+    return float(max(ratios, default=0.0))
+
+
+class EpisodeTracker:
+    """Per-line episode state; feed it every scored snapshot in order."""
+
+    def __init__(
+        self,
+        clear_ratio: float = 0.9,
+        dwell: int = 5,
+        min_update_gap: int = 10,
+        severity_step: float = 2.0,
+        sensor_change: int = 2,
+        top_k: int = 3,
+        smoothing: float = 0.1,
+        open_after: int = 1,
+    ):
+        if not 0 < clear_ratio <= 1:
+            raise ValueError("clear_ratio must be in (0, 1]")
+        self.clear_ratio = clear_ratio
+        self.dwell = max(1, dwell)
+        self.min_update_gap = min_update_gap
+        self.severity_step = severity_step
+        self.sensor_change = sensor_change
+        self.top_k = top_k
+        self.smoothing = smoothing
+        self.open_after = max(1, open_after)
+        self.opened = 0
+        self.updates = 0
+        self.closed = 0
+        self.suppressed = 0
+        self._episode = None
+        self._run = 0
+
+    @property
+    def active(self) -> bool:
+        return self._episode is not None
+
+    def _sensors(self, episode) -> set:
+        t2_top = np.argsort(episode["t2_smooth"])[-self.top_k :]
+        spe_top = np.argsort(episode["spe_smooth"])[-self.top_k :]
+        return {("t2", int(i)) for i in t2_top} | {("spe", int(i)) for i in spe_top}
+
+    def observe(self, timestamp, result, threshold_t2, threshold_spe):
+        """Feed one scored snapshot; return an event dict to emit, or None.
+
+        ``result`` is a :class:`~AI.scoring.SnapshotScore`. The returned dict
+        has ``risk``, ``spe``, ``top3_t2``, ``top3_spe``, ``block`` for a
+        multi-block result, and an ``episode`` block whose ``phase`` is
+        ``"open"``, ``"update"`` or ``"close"``.
+        """
+        severity = _severity(result.t2, result.spe, threshold_t2, threshold_spe)
+        episode = self._episode
+
+        if severity <= 1.0:
+            self._run = 0
+            if episode is None:
+                return None
+            episode["below"] = episode["below"] + 1 if severity < self.clear_ratio else 0
+            episode["samples"] += 1
+            if episode["below"] >= self.dwell:
+                return self.close(timestamp)
+            return None
+
+        self._run += 1
+        if episode is None and self._run < self.open_after:
+            self.suppressed += 1
+            return None
+
+        t2_contrib = result.t2_contributions()
+        spe_contrib = result.spe_contributions()
+        analysis = {
+            "risk": result.t2,
+            "spe": result.spe,
+            "top3_t2": top_k_sensors(t2_contrib, self.top_k),
+            "top3_spe": top_k_sensors(spe_contrib, self.top_k),
+        }
+        if hasattr(result, "block_summary"):
+            analysis["block"] = result.block_summary()
+        if episode is None:
+            episode = self._episode = {
+                "id": uuid4().hex,
+                "started_at": timestamp,
+                "samples": 0,
+                "exceedances": 0,
+                "below": 0,
+                "peak_severity": severity,
+                "peak_risk": result.t2,
+                "peak_spe": result.spe,
+                "t2_sum": np.zeros_like(t2_contrib),
+                "spe_sum": np.zeros_like(spe_contrib),
+                "t2_smooth": t2_contrib.copy(),
+                "spe_smooth": spe_contrib.copy(),
+                "since_update": 0,
+            }
+            phase = OPEN
+            self.opened += 1
+        else:
+            episode["t2_smooth"] += self.smoothing * (t2_contrib - episode["t2_smooth"])
+            episode["spe_smooth"] += self.smoothing * (spe_contrib - episode["spe_smooth"])
+            emitted = episode["emitted_severity"]
+            changed_severity = severity >= emitted * self.severity_step or severity <= emitted / self.severity_step
+            changed_sensors = len(self._sensors(episode) ^ episode["sensors"]) >= 2 * self.sensor_change
+            due = episode["since_update"] >= self.min_update_gap
+            phase = UPDATE if (changed_severity or changed_sensors) and due else None
+
+        episode["samples"] += 1
+        episode["exceedances"] += 1
+        episode["below"] = 0
+        episode["since_update"] += 1
+        if "block" in analysis and severity >= episode["peak_severity"]:
+            episode["peak_block"] = analysis["block"]
+        episode["peak_severity"] = max(episode["peak_severity"], severity)
+        episode["peak_risk"] = max(episode["peak_risk"], result.t2)
+        episode["peak_spe"] = max(episode["peak_spe"], result.spe)
+        episode["t2_sum"] += t2_contrib
+        episode["spe_sum"] += spe_contrib
+
+        if phase is None:
+            self.suppressed += 1
+            return None
+        if phase == UPDATE:
+            self.updates += 1
+        episode["emitted_severity"] = severity
+        episode["sensors"] = self._sensors(episode)
+        episode["since_update"] = 0
+        analysis["episode"] = self._describe(episode, phase, timestamp, severity)
+        return analysis
+
+    def close(self, timestamp, reason: str = "cleared"):
+        """Close the open episode (if any) and return its summary event."""
+        episode = self._episode
+        if episode is None:
+            return None
+        self._episode = None
+        self.closed += 1
+        count = episode["exceedances"]
+        summary = self._describe(episode, CLOSE, timestamp, episode["peak_severity"])
+        summary.update(ended_at=timestamp, reason=reason)
+        analysis = {
+            "risk": episode["peak_risk"],
+            "spe": episode["peak_spe"],
+            "top3_t2": top_k_sensors(episode["t2_sum"] / count, self.top_k),
+            "top3_spe": top_k_sensors(episode["spe_sum"] / count, self.top_k),
+            "episode": summary,
+        }
+        if "peak_block" in episode:
+            analysis["block"] = episode["peak_block"]
+        return analysis
+
+    @staticmethod
+    def _describe(episode, phase, timestamp, severity):
+        return {
+            "id": episode["id"],
+            "phase": phase,
+            "started_at": episode["started_at"],
+            "at": timestamp,
+            "samples": episode["samples"],
+            "exceedances": episode["exceedances"],
+            "severity": float(severity),
+            "peak_severity": float(episode["peak_severity"]),
+            "peak_risk": episode["peak_risk"],
+            "peak_spe": episode["peak_spe"],
+        }
+
+    def stats(self) -> dict:
+        return {
+            "opened": self.opened,
+            "updates": self.updates,
+            "closed": self.closed,
+            "suppressed": self.suppressed,
+        }
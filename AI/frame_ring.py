@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""Shared-memory ring of sensor frames: one writer, several readers.
+
+A frame is one float64 row ``[line code, timestamp, value_1 .. value_n]``.
+The frames live in a ``multiprocessing.shared_memory`` block together with
+an int64 control header:
+
+* the writer sequence (frames published so far), capacity, width and the
+  ``closed`` flag;
+* per reader slot: its read sequence, an ``active`` flag and the lag and
+  overrun counters.
+
+Writes are published seqlock style: the writer first bumps the claimed
+sequence to the end of the range it is about to fill, then copies the
+frames into slots ``seq % capacity`` and finally bumps the writer sequence
+to commit them. Readers only see committed frames, and the claimed
+sequence tells them which slots may be under overwrite right now. Each
+reader keeps its own sequence, so every reader sees every frame (sharded
+consumers filter by line code).
+:meth:`FrameReader.read` returns a :class:`FrameBatch` of numpy views
+straight into the shared block, nothing is pickled or copied, and
+:meth:`FrameReader.release` hands the slots back.
+
+With ``overwrite=True`` (the default) the writer never waits: a reader
+whose next frame could be overwritten by the next claim (``capacity`` or
+more frames behind the claimed sequence) skips ahead and counts the skipped
+frames as ``overruns``, and a batch that was overwritten, or claimed for
+overwriting, while it was being used makes ``release()`` return False and
+counts as ``torn``. With ``overwrite=False`` the writer instead waits for the
+slowest active reader (counted as ``writer_waits``), so nothing is lost.
+``lag`` and ``max_lag`` tell how far a reader is behind the writer.
+"""
+
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+LINE, TIMESTAMP, VALUES = 0, 1, 2
+_WRITE_SEQ, _CAPACITY, _WIDTH, _MAX_READERS, _CLOSED, _WRITER_WAITS, _CLAIM_SEQ = range(7)
+_HEADER_WORDS = 8
+_READ_SEQ, _ACTIVE, _OVERRUNS, _TORN, _MAX_LAG = range(5)
+_READER_WORDS = 8
+
+
+def _attach(name, untrack):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if untrack:
+        # Before 3.13 attaching registers the block with this process's
+        # resource tracker, which would unlink it when the process exits.
+        from multiprocessing import resource_tracker
+
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class FrameBatch:
+    """Consecutive frames ``[start, start + len(frames))`` as views into the ring."""
+
+    __slots__ = ("start", "frames")
+
+    def __init__(self, start, frames):
+        self.start = start
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def line_codes(self):
+        return self.frames[:, LINE]
+
+    @property
+    def timestamps(self):
+        return self.frames[:, TIMESTAMP]
+
+    @property
+    def values(self):
+        return self.frames[:, VALUES:]
+
+
+class FrameRing:
+    """A ring of ``capacity`` frames of ``n_values`` sensor values in shared memory.
+
+    Create it in the ingest process and pass :attr:`name` to the workers,
+    which open it with :meth:`attach`. Only the creator writes and unlinks.
+    """
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        header = np.ndarray((_HEADER_WORDS,), dtype=np.int64, buffer=shm.buf)
+        self.capacity = int(header[_CAPACITY])
+        self.width = int(header[_WIDTH])
+        self.max_readers = int(header[_MAX_READERS])
+        control_words = _HEADER_WORDS + self.max_readers * _READER_WORDS
+        self._header = header
+        self._readers = np.ndarray(
+            (self.max_readers, _READER_WORDS), dtype=np.int64, buffer=shm.buf, offset=_HEADER_WORDS * 8
+        )
+        self._frames = np.ndarray(
+            (self.capacity, self.width), dtype=np.float64, buffer=shm.buf, offset=control_words * 8
+        )
+        self.overwrite = True
+        self.poll_interval = 5e-4
+
+    @classmethod
+    def create(cls, capacity: int = 4096, n_values: int = 52, max_readers: int = 8, overwrite: bool = True):
+        if capacity < 2 or max_readers < 1:
+            raise ValueError("capacity must be at least 2 and max_readers at least 1")
+        width = VALUES + n_values
+        control_words = _HEADER_WORDS + max_readers * _READER_WORDS
+        shm = shared_memory.SharedMemory(create=True, size=(control_words + capacity * width) * 8)
+        control = np.ndarray((control_words,), dtype=np.int64, buffer=shm.buf)
+        control[:] = 0
+        control[_CAPACITY], control[_WIDTH], control[_MAX_READERS] = capacity, width, max_readers
+        del control
+        ring = cls(shm, owner=True)
+        ring.overwrite = overwrite
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, untrack: bool = False):
+        """Open an existing ring by :attr:`name`.
+
+        Processes started by the creator through ``multiprocessing`` share
+        its resource tracker. A process started independently has its own,
+        and must pass ``untrack=True`` so the block outlives it.
+        """
+        return cls(_attach(name, untrack), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def n_values(self) -> int:
+        return self.width - VALUES
+
+    @property
+    def written(self) -> int:
+        return int(self._header[_WRITE_SEQ])
+
+    @property
+    def claimed(self) -> int:
+        """End of the frames published or being written; ``claimed - written`` are in flight."""
+        return int(self._header[_CLAIM_SEQ])
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._header[_CLOSED])
+
+    def write(self, line_code: int, timestamp: float, values) -> int:
+        """Publish one frame and return its sequence number."""
+        seq = int(self._header[_WRITE_SEQ])
+        if not self.overwrite:
+            self._wait_for_space(seq, 1)
+        self._header[_CLAIM_SEQ] = seq + 1
+        frame = self._frames[seq % self.capacity]
+        frame[LINE] = line_code
+        frame[TIMESTAMP] = timestamp
+        frame[VALUES:] = values
+        self._header[_WRITE_SEQ] = seq + 1
+        return seq
+
+    def write_many(self, line_codes, timestamps, values) -> int:
+        """Publish ``len(values)`` frames at once (split at the wrap); return the first sequence."""
+        values = np.asarray(values)
+        line_codes = np.broadcast_to(line_codes, len(values))
+        timestamps = np.broadcast_to(timestamps, len(values))
+        first = seq = int(self._header[_WRITE_SEQ])
+        done = 0
+        while done < len(values):
+            slot = seq % self.capacity
+            # Never claim a whole ring at once: a reader needs one slot that is not being written.
+            n = min(len(values) - done, self.capacity - slot, self.capacity - 1)
+            if not self.overwrite:
+                self._wait_for_space(seq, n)
+            self._header[_CLAIM_SEQ] = seq + n
+            block = self._frames[slot : slot + n]
+            block[:, LINE] = line_codes[done : done + n]
+            block[:, TIMESTAMP] = timestamps[done : done + n]
+            block[:, VALUES:] = values[done : done + n]
+            seq += n
+            done += n
+            self._header[_WRITE_SEQ] = seq
+        return first
+
+    def _wait_for_space(self, seq, n):
+        waited = False
+        while True:
+            active = self._readers[:, _ACTIVE] > 0
+            # Strictly below capacity, or the slowest reader would count the next claim as an overrun.
+            if not active.any() or seq + n - int(self._readers[active, _READ_SEQ].min()) < self.capacity:
+                break
+            waited = True
+            time.sleep(self.poll_interval)
+        if waited:
+            self._header[_WRITER_WAITS] += 1
+
+    def close_writer(self):
+        """Tell readers no more frames are coming; they finish what is published."""
+        self._header[_CLOSED] = 1
+
+    def reader(self, index: int, from_start: bool = False) -> "FrameReader":
+        """Claim reader slot ``index``; it starts at the newest frame unless ``from_start``."""
+        if not 0 <= index < self.max_readers:
+            raise ValueError(f"reader index must be in [0, {self.max_readers})")
+        return FrameReader(self, index, from_start)
+
+    def detach_reader(self, index: int):
+        """Deactivate reader slot ``index`` (e.g. of a dead process) so a non-overwriting writer stops waiting for it."""
+        self._readers[index, _ACTIVE] = 0
+
+    def stats(self) -> dict:
+        written = self.written
+        readers = {}
+        for index, slot in enumerate(self._readers):
+            if not slot[_ACTIVE]:
+                continue
+            readers[index] = {
+                "read": int(slot[_READ_SEQ]),
+                "lag": written - int(slot[_READ_SEQ]),
+                "max_lag": int(slot[_MAX_LAG]),
+                "overruns": int(slot[_OVERRUNS]),
+                "torn": int(slot[_TORN]),
+            }
+        return {
+            "capacity": self.capacity,
+            "written": written,
+            "writer_waits": int(self._header[_WRITER_WAITS]),
+            "readers": readers,
+        }
+
+    def close(self):
+        """Detach from the block (the owner also unlinks it). Batches must be dropped first."""
+        if self._shm is None:
+            return
+        self._header = self._readers = self._frames = None
+        shm, self._shm = self._shm, None
+        shm.close()
+        if self.owner:
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameReader:
+    """One consumer's cursor into a :class:`FrameRing`."""
+
+    def __init__(self, ring, index, from_start=False):
+        self.ring = ring
+        self.index = index
+        self._slot[_READ_SEQ] = 0 if from_start else ring.written
+        self._slot[_ACTIVE] = 1
+        self._pending = None
+
+    @property
+    def _slot(self):
+        # Not cached: a held view would keep the ring from closing.
+        return self.ring._readers[self.index]
+
+    @property
+    def position(self) -> int:
+        return int(self._slot[_READ_SEQ])
+
+    @property
+    def lag(self) -> int:
+        return self.ring.written - self.position
+
+    def read(self, max_frames: int | None = None) -> FrameBatch | None:
+        """Return the next published frames as views, or None if there are none yet.
+
+        The batch stops at the end of the buffer, so a read after a wrap
+        returns the rest. Call :meth:`release` when done with it.
+        """
+        ring = self.ring
+        written = ring.written
+        seq = self.position
+        lag = written - seq
+        if lag > self._slot[_MAX_LAG]:
+            self._slot[_MAX_LAG] = lag
+        # A frame ``capacity`` behind the claimed sequence is the next to be
+        # overwritten (or is being overwritten), so it is never handed out.
+        behind = ring.claimed - seq
+        if behind >= ring.capacity:
+            skipped = behind - ring.capacity + 1
+            self._slot[_OVERRUNS] += skipped
+            seq += skipped
+            self._slot[_READ_SEQ] = seq
+        if seq >= written:
+            return None
+        slot = seq % ring.capacity
+        n = min(written - seq, ring.capacity - slot)
+        if max_frames is not None:
+            n = min(n, max_frames)
+        self._pending = FrameBatch(seq, ring._frames[slot : slot + n])
+        return self._pending
+
+    def wait(self, max_frames: int | None = None, timeout: float | None = None) -> FrameBatch | None:
+        """Like :meth:`read`, polling until frames arrive, the writer closes or ``timeout`` passes.
+
+        The poll interval starts at the ring's ``poll_interval`` and doubles
+        up to 10 ms, so an idle reader adds at most that much latency.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = self.ring.poll_interval
+        while True:
+            batch = self.read(max_frames)
+            if batch is not None:
+                return batch
+            if self.ring.closed:
+                # Frames published just before the close are still readable.
+                return self.read(max_frames)
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+            interval = min(interval * 2, 0.01)
+
+    def release(self, batch: FrameBatch | None = None) -> bool:
+        """Advance past ``batch`` (default: the last read one).
+
+        Returns False if the writer overwrote part of it while it was in use,
+        or has claimed its slots for a write in flight, in which case its
+        views may hold newer frames and the results are suspect.
+        """
+        batch = batch or self._pending
+        if batch is None:
+            return True
+        self._pending = None
+        end = batch.start + len(batch)
+        intact = self.ring.claimed - batch.start < self.ring.capacity
+        if not intact:
+            self._slot[_TORN] += 1
+        if end > self.position:
+            self._slot[_READ_SEQ] = end
+        return intact
+
+    def detach(self):
+        """Release the slot so a non-overwriting writer stops waiting for it."""
+        self._pending = None
+        self._slot[_ACTIVE] = 0
+
+    def stats(self) -> dict:
+        return self.ring.stats()["readers"].get(self.index, {})
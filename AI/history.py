@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Preallocated ring buffer of sensor snapshots.
+
+Every row is written twice, at ``i`` and ``i + window``, in a
+``(2 * window, n_features)`` array, so the last ``n`` snapshots are always
+one contiguous slice. :meth:`SnapshotRing.view` therefore returns an
+ordered, read-only view without copying. Running sums of the window
+(relative to a reference row, to avoid cancellation) give the windowed
+mean and variance in O(n_features) per snapshot. They are recomputed
+exactly once per ``window`` appends, so rounding does not accumulate.
+"""
+
+import numpy as np
+
+
+class SnapshotRing:
+    """Fixed-size history of the last ``window`` snapshots, oldest first.
+
+    Indexing, iteration, ``len()`` and truthiness behave like the
+    ``deque(maxlen=window)`` it replaces, except that rows are numpy views.
+    """
+
+    def __init__(self, n_features: int, window: int = 5, dtype=np.float64):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self.n_features = n_features
+        self._data = np.zeros((2 * window, n_features), dtype=dtype)
+        self._next = 0
+        self._count = 0
+        self._appends = 0
+        self._ref = np.zeros(n_features)
+        self._sum = np.zeros(n_features)
+        self._sumsq = np.zeros(n_features)
+        self._scratch = np.empty(n_features)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def _end(self) -> int:
+        return (self._next - 1) % self.window + self.window + 1
+
+    def view(self, n: int | None = None):
+        """Return the last ``n`` snapshots (default: all held) as a read-only ordered view."""
+        n = self._count if n is None else min(n, self._count)
+        end = self._end()
+        out = self._data[end - n : end]
+        out.flags.writeable = False
+        return out
+
+    def latest(self):
+        if not self._count:
+            raise IndexError("SnapshotRing is empty")
+        return self[-1]
+
+    def tolist(self, n: int | None = None):
+        return self.view(n).tolist()
+
+    def append(self, snap):
+        slot = self._next
+        row = self._data[slot]
+        if self._count == self.window:
+            np.subtract(row, self._ref, out=self._scratch)
+            self._sum -= self._scratch
+            self._sumsq -= np.multiply(self._scratch, self._scratch, out=self._scratch)
+        else:
+            self._count += 1
+        row[...] = snap
+        self._data[slot + self.window] = row
+        np.subtract(row, self._ref, out=self._scratch)
+        self._sum += self._scratch
+        self._sumsq += np.multiply(self._scratch, self._scratch, out=self._scratch)
+
+        self._next = (slot + 1) % self.window
+        self._appends += 1
+        if self._appends % self.window == 0:
+            self._resync()
+
+    def extend(self, block):
+        """Append the rows of ``block`` in order (only the last ``window`` are kept)."""
+        block = np.asarray(block)[-self.window :]
+        n = len(block)
+        if n == 0:
+            return
+        slots = (self._next + np.arange(n)) % self.window
+        self._data[slots] = block
+        self._data[slots + self.window] = block
+        self._next = (self._next + n) % self.window
+        self._count = min(self.window, self._count + n)
+        self._appends += n
+        self._resync()
+
+    def clear(self):
+        self._next = self._count = self._appends = 0
+        self._sum[:] = self._sumsq[:] = 0.0
+
+    def _resync(self):
+        rows = self.view()
+        self._ref = rows[-1].astype(float)
+        centered = rows - self._ref
+        self._sum = centered.sum(axis=0)
+        self._sumsq = np.einsum("ij,ij->j", centered, centered)
+
+    def mean(self):
+        """Per-sensor mean over the window."""
+        if not self._count:
+            raise ValueError("SnapshotRing is empty")
+        return self._ref + self._sum / self._count
+
+    def var(self, ddof: int = 0):
+        """Per-sensor variance over the window."""
+        if self._count - ddof <= 0:
+            raise ValueError("Not enough snapshots for the requested ddof")
+        shift = self._sum / self._count
+        return np.maximum(self._sumsq / self._count - shift * shift, 0.0) * (self._count / (self._count - ddof))
+
+    def std(self, ddof: int = 0):
+        return np.sqrt(self.var(ddof))
+
+    def window_stats(self, n: int | None = None) -> dict:
+        """Mean, std, min and max of the last ``n`` snapshots, computed on the view."""
+        rows = self.view(n)
+        return {
+            "count": len(rows),
+            "mean": rows.mean(axis=0),
+            "std": rows.std(axis=0),
+            "min": rows.min(axis=0),
+            "max": rows.max(axis=0),
+        }
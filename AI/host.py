@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+"""Multi-line scoring host.
+
+One process scores every process line: each line has its own model bundle,
+thresholds and history, and lines are sharded across worker processes so
+scoring is not bound by a single GIL. Snapshots are routed by line id;
+exceedances come back as the same WARN events ``warn_loop`` emits, tagged
+with ``line_id``.
+
+By default snapshots reach the shards pickled through queues. With
+``ring_capacity`` they are written into a shared-memory
+:class:`~AI.frame_ring.FrameRing` instead and every shard scores its lines
+straight from views of the ring; :meth:`ScoringHost.stats` then reports
+each shard's lag and overruns.
+
+If a shard fails (its model cannot be loaded, or it dies), the host raises
+the shard's exception from the constructor, :meth:`ScoringHost.submit` or
+:meth:`ScoringHost.join` instead of waiting for it forever.
+
+Config (JSON)::
+
+    {"lines": {"line-a": {"model_dir": "models/line-a", "source": "line_a.csv"},
+               "line-b": {"model_dir": "models/line-b", "source": "line_b.csv"}}}
+
+Replay every line's ``source`` through the host (from the repository root)::
+
+    python -m AI.host lines.json --workers 4
+    python -m AI.host lines.json --workers 4 --ring-capacity 65536
+"""
+
+import argparse
+import json
+import multiprocessing
+import pickle
+import queue
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from AI import ai  # noqa: E402
+from AI.frame_ring import LINE, TIMESTAMP, VALUES, FrameRing  # noqa: E402
+from AI.history import SnapshotRing  # noqa: E402
+
+
+class _LineState:
+    def __init__(self, line_id, model_path, history_size):
+        if Path(model_path).is_file():
+            bundle = ai.load_model_bundle(model_path)
+            self.scorer = ai.scorer_from_bundle(bundle)
+            threshold_t2, threshold_spe = bundle.threshold_t2, bundle.threshold_spe
+        else:
+            scaler, pca, threshold_t2, threshold_spe = ai.load_trained_artifacts(model_path)
+            self.scorer = ai.FusedScorer(scaler, pca)
+        self.line_id = line_id
+        self.threshold_t2 = threshold_t2
+        self.threshold_spe = threshold_spe
+        self.history = SnapshotRing(self.scorer.n_features, history_size, dtype=self.scorer.dtype)
+
+    def score(self, timestamp, snap):
+        self.history.append(snap)
+        result = self.scorer.score(snap)
+        if result.t2 <= self.threshold_t2 and result.spe <= self.threshold_spe:
+            return None
+        analysis = result.as_dict()
+        return {
+            "event_type": "WARN",
+            "timestamp": timestamp,
+            "risk": result.t2,
+            "spe": result.spe,
+            "top3_t2": analysis["top3_t2"],
+            "top3_spe": analysis["top3_spe"],
+            "history": self.history.tolist(),
+            "alarm_code": "Warning",
+            "raw_data": snap.tolist(),
+            "source": "sensor",
+            "line_id": self.line_id,
+        }
+
+
+class _ShardTraceback(Exception):
+    """The traceback of a shard's exception, attached as its ``__cause__`` in the host."""
+
+    def __str__(self):
+        return "\n" + self.args[0]
+
+
+def _shard_entry(target, shard_id, outbox, args):
+    try:
+        target(*args)
+    except BaseException as exc:
+        tb = traceback.format_exc()
+        try:
+            pickle.dumps(exc)
+        except Exception:
+            exc = RuntimeError(repr(exc))
+        outbox.put(("error", shard_id, (exc, tb)))
+        raise
+
+
+def _shard_main(shard_id, line_dirs, history_size, inbox, outbox):
+    lines = {
+        line_id: _LineState(line_id, model_path, history_size) for line_id, model_path in line_dirs.items()
+    }
+    outbox.put(("ready", shard_id, None))
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            break
+        events = []
+        for line_id, timestamp, snap in batch:
+            event = lines[line_id].score(timestamp, snap)
+            if event is not None:
+                events.append(event)
+        outbox.put(("scored", shard_id, (len(batch), events)))
+    outbox.put(("stopped", shard_id, None))
+
+
+def _ring_shard_main(shard_id, line_dirs, line_codes, history_size, ring_name, outbox, report_every=1024):
+    lines = {
+        line_codes[line_id]: _LineState(line_id, model_path, history_size)
+        for line_id, model_path in line_dirs.items()
+    }
+    own = np.array(sorted(lines), dtype=np.float64)
+    ring = FrameRing.attach(ring_name)
+    reader = ring.reader(shard_id, from_start=True)
+    outbox.put(("ready", shard_id, None))
+    count, events, unreported, torn = 0, [], 0, 0
+    while True:
+        batch = reader.read()
+        if batch is None:
+            # Caught up: report progress (``join`` waits on it) before idling.
+            if unreported:
+                outbox.put(("scored", shard_id, (count, events, reader.position, torn)))
+                count, events, unreported, torn = 0, [], 0, 0
+            batch = reader.wait(timeout=0.1)
+            if batch is None:
+                if ring.closed:
+                    break
+                continue
+        # Copy this shard's frames out, then check they were not overwritten
+        # meanwhile; only a verified copy is scored (and enters the history).
+        frames = batch.frames[np.isin(batch.line_codes, own)]
+        unreported += len(batch)
+        del batch
+        if not reader.release():
+            torn += len(frames)
+            frames = frames[:0]
+        for frame in frames:
+            event = lines[int(frame[LINE])].score(float(frame[TIMESTAMP]), frame[VALUES:])
+            count += 1
+            if event is not None:
+                events.append(event)
+        if events or unreported >= report_every:
+            outbox.put(("scored", shard_id, (count, events, reader.position, torn)))
+            count, events, unreported, torn = 0, [], 0, 0
+    outbox.put(("scored", shard_id, (count, events, reader.position, torn)))
+    reader.detach()
+    ring.close()
+    outbox.put(("stopped", shard_id, None))
+
+
+class ScoringHost:
+    """Routes ``(line_id, snapshot)`` pairs to per-line models sharded over processes.
+
+    ``line_dirs`` maps line id to a model bundle file (memory-mapped, so
+    lines sharing a bundle share its pages) or a model directory
+    (``scaler.pkl``, ``pca.pkl``, ``threshold*.txt``). Lines are assigned to ``workers``
+    shards round-robin. Snapshots are sent in batches of ``batch_size`` per
+    shard (``1`` for lowest latency, larger for replay throughput).
+    ``on_event`` is called from a host thread for every exceedance event.
+
+    With ``ring_capacity`` the snapshots (``n_values`` wide) go through a
+    shared-memory :class:`~AI.frame_ring.FrameRing` that every shard reads,
+    and ``batch_size`` is unused. ``ring_overwrite=False`` makes
+    :meth:`submit` wait for the slowest shard instead of letting it overrun.
+    With overwriting, frames of a batch the writer overwrote while a shard
+    was copying it are dropped unscored and counted as ``torn_dropped``.
+
+    Shards are watched every ``poll_interval`` seconds. The first failure is
+    raised (with the shard's traceback as its cause) by the constructor or the
+    next :meth:`submit`/:meth:`join`, and a dead shard's ring reader is
+    detached so :meth:`submit` does not wait for it. :meth:`close` waits at
+    most ``shutdown_timeout`` seconds per shard before terminating it.
+    """
+
+    def __init__(
+        self,
+        line_dirs,
+        workers=None,
+        history_size=5,
+        batch_size=1,
+        on_event=None,
+        ring_capacity=None,
+        n_values=len(ai.SENSOR_COLUMNS),
+        ring_overwrite=True,
+        poll_interval=0.5,
+        shutdown_timeout=10.0,
+    ):
+        if not line_dirs:
+            raise ValueError("line_dirs must contain at least one line")
+        ctx = multiprocessing.get_context("spawn")
+        line_ids = sorted(line_dirs)
+        workers = max(1, min(workers or multiprocessing.cpu_count(), len(line_ids)))
+
+        self.batch_size = batch_size
+        self.on_event = on_event or (lambda event: None)
+        self.scored = 0
+        self.events = 0
+        self.torn_dropped = 0
+        self.poll_interval = poll_interval
+        self.shutdown_timeout = shutdown_timeout
+        self._error = None
+        self._stopped = set()
+        self._exited = set()
+        self._closing = False
+        self._drain_thread = None
+        self._shard_of = {line_id: i % workers for i, line_id in enumerate(line_ids)}
+        self._line_codes = {line_id: code for code, line_id in enumerate(line_ids)}
+        self._pending = [[] for _ in range(workers)]
+        self._submitted = 0
+        self._done = threading.Condition()
+        self._outbox = ctx.Queue()
+        self._inboxes = [ctx.Queue() for _ in range(workers)]
+        self._ring = None
+        self._positions = [0] * workers
+        if ring_capacity:
+            self._ring = FrameRing.create(ring_capacity, n_values, max_readers=workers, overwrite=ring_overwrite)
+        self._processes = []
+        for shard_id in range(workers):
+            shard_lines = {
+                line_id: str(Path(line_dirs[line_id]).resolve())
+                for line_id in line_ids
+                if self._shard_of[line_id] == shard_id
+            }
+            if self._ring is None:
+                target = _shard_main
+                args = (shard_id, shard_lines, history_size, self._inboxes[shard_id], self._outbox)
+            else:
+                target = _ring_shard_main
+                args = (shard_id, shard_lines, self._line_codes, history_size, self._ring.name, self._outbox)
+            process = ctx.Process(
+                target=_shard_entry,
+                args=(target, shard_id, self._outbox, args),
+                name=f"scoring-shard-{shard_id}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+        try:
+            self._wait_ready()
+        except BaseException:
+            self._terminate()
+            if self._ring is not None:
+                self._ring.close()
+            raise
+        self._drain_thread = threading.Thread(target=self._drain, name="scoring-host-drain", daemon=True)
+        self._drain_thread.start()
+
+    @property
+    def shards(self):
+        return len(self._processes)
+
+    def submit(self, line_id, snap, timestamp=None):
+        self._raise_if_failed()
+        timestamp = time.time() if timestamp is None else timestamp
+        if self._ring is not None:
+            self._ring.write(self._line_codes[line_id], timestamp, snap)
+            return
+        shard_id = self._shard_of[line_id]
+        pending = self._pending[shard_id]
+        pending.append((line_id, timestamp, snap))
+        if len(pending) >= self.batch_size:
+            self._send(shard_id)
+
+    def flush(self):
+        for shard_id in range(self.shards):
+            if self._pending[shard_id]:
+                self._send(shard_id)
+
+    def join(self, timeout=None):
+        """Flush and wait until every submitted snapshot has been scored.
+
+        With a ring, "scored" means every shard has read past the last
+        written frame; frames lost to overruns are not waited for.
+        """
+        self._raise_if_failed()
+        self.flush()
+        with self._done:
+            if self._ring is not None:
+                written = self._ring.written
+                done = self._done.wait_for(
+                    lambda: self._error is not None or min(self._positions) >= written, timeout
+                )
+            else:
+                done = self._done.wait_for(
+                    lambda: self._error is not None or self.scored >= self._submitted, timeout
+                )
+        self._raise_if_failed()
+        return done
+
+    def stats(self) -> dict:
+        """Scored and event counts, plus the ring's lag/overrun counters when there is one."""
+        stats = {"shards": self.shards, "scored": self.scored, "events": self.events}
+        if self._ring is not None:
+            stats["torn_dropped"] = self.torn_dropped
+            stats["ring"] = self._ring.stats()
+        return stats
+
+    def close(self):
+        """Wait for the submitted snapshots (unless a shard already failed) and stop the shards."""
+        try:
+            if self._error is None:
+                self.join()
+        finally:
+            if self._ring is not None:
+                self._ring.close_writer()
+            for inbox in self._inboxes:
+                inbox.put(None)
+            for process in self._processes:
+                process.join(self.shutdown_timeout)
+            self._terminate()
+            # No sentinel through the outbox: a killed shard may have died holding its write lock.
+            self._closing = True
+            self._drain_thread.join()
+            if self._ring is not None:
+                self._ring.close()
+
+    def _wait_ready(self):
+        ready = set()
+        while len(ready) < self.shards:
+            try:
+                kind, shard_id, payload = self._outbox.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self._check_shards()
+            else:
+                if kind == "error":
+                    self._fail(shard_id, payload)
+                elif kind == "ready":
+                    ready.add(shard_id)
+            self._raise_if_failed()
+
+    def _terminate(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    def _check_shards(self):
+        """Fail on a shard that exited without saying ``stopped`` (a crash or a kill).
+
+        A shard seen dead is only failed at the next empty poll, so a last
+        message it sent just before exiting is still read first.
+        """
+        for shard_id, process in enumerate(self._processes):
+            if shard_id in self._stopped or process.is_alive():
+                continue
+            if shard_id in self._exited:
+                exc = RuntimeError(f"Scoring shard {shard_id} exited with code {process.exitcode}")
+                self._fail(shard_id, (exc, ""))
+            else:
+                self._exited.add(shard_id)
+
+    def _fail(self, shard_id, payload):
+        exc, tb = payload
+        if tb:
+            exc.__cause__ = _ShardTraceback(tb)
+        self._stopped.add(shard_id)
+        if self._ring is not None:
+            self._ring.detach_reader(shard_id)
+        with self._done:
+            if self._error is None:
+                self._error = exc
+            self._done.notify_all()
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def _send(self, shard_id):
+        batch = self._pending[shard_id]
+        self._pending[shard_id] = []
+        with self._done:
+            self._submitted += len(batch)
+        self._inboxes[shard_id].put(batch)
+
+    def _drain(self):
+        while True:
+            try:
+                kind, shard_id, payload = self._outbox.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if self._closing:
+                    return
+                self._check_shards()
+                continue
+            if kind == "error":
+                self._fail(shard_id, payload)
+            elif kind == "stopped":
+                self._stopped.add(shard_id)
+            if kind != "scored":
+                continue
+            count, events, *progress = payload
+            for event in events:
+                self.on_event(event)
+            with self._done:
+                self.scored += count
+                self.events += len(events)
+                if progress:
+                    self._positions[shard_id], torn = progress
+                    self.torn_dropped += torn
+                self._done.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def replay_lines(config, workers=None, batch_size=256, on_event=None, ring_capacity=None):
+    """Replay every line's ``source`` CSV through a :class:`ScoringHost`, interleaving lines.
+
+    With ``ring_capacity`` the snapshots go through a shared-memory ring
+    that waits for the slowest shard, so a replay never drops frames.
+    """
+    lines = config["lines"]
+    line_dirs = {line_id: spec["model_dir"] for line_id, spec in lines.items()}
+    readers = {
+        line_id: ai.make_chunked_snapshot_reader(
+            ai.prefetch(ai.iter_sensor_csv(str(Path(spec["source"]).resolve())))
+        )
+        for line_id, spec in lines.items()
+    }
+    started = time.perf_counter()
+    with ScoringHost(
+        line_dirs,
+        workers=workers,
+        batch_size=batch_size,
+        on_event=on_event,
+        ring_capacity=ring_capacity,
+        ring_overwrite=False,
+    ) as host:
+        while readers:
+            for line_id in list(readers):
+                try:
+                    host.submit(line_id, readers[line_id]())
+                except StopIteration:
+                    del readers[line_id]
+        host.join()
+        stats = host.stats()
+    elapsed = time.perf_counter() - started
+    report = {
+        "lines": len(lines),
+        "shards": host.shards,
+        "snapshots": host.scored,
+        "events": host.events,
+        "elapsed_s": elapsed,
+        "snapshots_per_s": host.scored / elapsed if elapsed > 0 else 0.0,
+    }
+    if "ring" in stats:
+        report["ring"] = stats["ring"]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay several process lines through one scoring host.")
+    parser.add_argument("config", help="JSON file with a 'lines' mapping")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--ring-capacity", type=int, default=None, help="pass snapshots through shared memory")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = json.load(f)
+    report = replay_lines(
+        config, workers=args.workers, batch_size=args.batch_size, ring_capacity=args.ring_capacity
+    )
+    print(
+        f"[Host] {report['lines']} lines on {report['shards']} shards: {report['snapshots']} snapshots, "
+        f"{report['events']} events in {report['elapsed_s']:.2f}s ({report['snapshots_per_s']:.0f} snapshots/s)"
+    )
+    if "ring" in report:
+        print(f"[Host] ring: {json.dumps(report['ring'])}")
+
+
+if __name__ == "__main__":
+    main()
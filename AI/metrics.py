@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Per-stage latency histograms and throughput counters for the warn loop.
+
+Stages recorded by the pipeline (``STAGES``):
+
+* ``read``: fetching the next snapshot from the CSV reader or sensor tail.
+* ``score``: the fused projection. Scaling is folded into the projector
+  (see :class:`~AI.scoring.FusedScorer`), so it is part of this stage.
+* ``contribution``: per-sensor contributions and the top-k of an exceeding
+  snapshot.
+* ``serialize``: building an event dict and packing transport frames.
+* ``dashboard_post`` and ``mcp_post``: one HTTP request each.
+
+Timings go into fixed log-spaced buckets (20 per decade, 100 ns to 100 s,
+so a percentile is off by at most about 12%). Recording costs one bisect
+and a counter increment. :meth:`PipelineMetrics.maybe_log` prints one
+``[Metrics] {json}`` line every ``log_interval`` seconds, and
+:func:`serve_stats` serves the same snapshot as JSON over local HTTP.
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+STAGES = ("read", "score", "contribution", "serialize", "dashboard_post", "mcp_post")
+_EDGES = (10.0 ** np.linspace(-7, 2, 9 * 20 + 1)).tolist()
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram:
+    """Counts of durations (seconds) in log-spaced buckets."""
+
+    def __init__(self):
+        self.counts = [0] * (len(_EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Upper edge of the bucket holding the ``q``-th percentile (capped at the max seen)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        index = int(np.searchsorted(np.cumsum(self.counts), rank, side="left"))
+        return min(_EDGES[min(index, len(_EDGES) - 1)], self.max)
+
+    def summary(self) -> dict:
+        summary = {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3 if self.count else 0.0,
+            "max_ms": self.max * 1e3,
+        }
+        for q in PERCENTILES:
+            summary[f"p{q}_ms"] = self.percentile(q) * 1e3
+        return summary
+
+
+class PipelineMetrics:
+    """Stage histograms plus snapshot and event counters, safe to share across threads."""
+
+    def __init__(self, log_interval: float | None = 10.0):
+        self.log_interval = log_interval
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.snapshots = 0
+        self.events = 0
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._last_log = self._started
+        self._last_counts = (0, 0)
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def time(self, stage: str):
+        """Context manager that records the duration of its block under ``stage``."""
+        return _StageTimer(self, stage)
+
+    def count_snapshot(self):
+        self.snapshots += 1
+
+    def count_event(self):
+        self.events += 1
+
+    def add_source(self, name: str, stats):
+        """Include ``stats()`` (e.g. ``EventTransport.stats``) in every snapshot under ``name``."""
+        self._sources[name] = stats
+
+    def snapshot(self) -> dict:
+        now = time.perf_counter()
+        elapsed = now - self._started
+        with self._lock:
+            stages = {name: h.summary() for name, h in self.stages.items() if h.count}
+        snapshot = {
+            "uptime_s": elapsed,
+            "snapshots": self.snapshots,
+            "events": self.events,
+            "snapshots_per_s": self.snapshots / elapsed if elapsed > 0 else 0.0,
+            "events_per_s": self.events / elapsed if elapsed > 0 else 0.0,
+            "stages": stages,
+        }
+        for name, stats in self._sources.items():
+            snapshot[name] = stats()
+        return snapshot
+
+    def maybe_log(self, now: float | None = None) -> bool:
+        """Call :meth:`log` if ``log_interval`` has passed since the last line; return whether it did."""
+        if self.log_interval is None:
+            return False
+        now = time.perf_counter() if now is None else now
+        if now - self._last_log < self.log_interval:
+            return False
+        self.log(now)
+        return True
+
+    def log(self, now: float | None = None):
+        """Print one ``[Metrics] {json}`` line, with rates over the window since the last one."""
+        now = time.perf_counter() if now is None else now
+        window = now - self._last_log
+        line = self.snapshot()
+        snapshots, events = self._last_counts
+        line["window_s"] = window
+        line["window_snapshots_per_s"] = (self.snapshots - snapshots) / window if window > 0 else 0.0
+        line["window_events_per_s"] = (self.events - events) / window if window > 0 else 0.0
+        self._last_log = now
+        self._last_counts = (self.snapshots, self.events)
+        print("[Metrics] " + json.dumps(line, default=float, separators=(",", ":")))
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+def serve_stats(metrics: PipelineMetrics, host: str = "127.0.0.1", port: int = 0):
+    """Serve ``GET /stats`` with :meth:`PipelineMetrics.snapshot` on a daemon thread.
+
+    Returns the server; ``server.server_address`` has the bound port and
+    ``server.shutdown()`` stops it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/stats":
+                self.send_error(404)
+                return
+            body = json.dumps(metrics.snapshot(), default=float).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Single-file, memory-mappable model bundle (numpy only).
+
+Layout::
+
+    8 bytes   magic b"AIPCABDL"
+    4 bytes   format version (little-endian uint32)
+    4 bytes   header length in bytes (little-endian uint32)
+    header    UTF-8 JSON: thresholds, metadata and an ``arrays`` table of
+              {name: {"dtype", "shape", "offset"}}
+    arrays    raw C-order data, each starting on a 64-byte boundary
+
+Opening a bundle with ``mmap=True`` maps the file read-only, so every
+scoring process that loads the same bundle shares one copy of the arrays in
+the page cache.
+"""
+
+import json
+import os
+import struct
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+MAGIC = b"AIPCABDL"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGN = 64
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class ModelBundle:
+    """Arrays and thresholds of one exported model.
+
+    ``arrays`` are read-only views into the file (or its bytes when not
+    memory-mapped). ``scaler`` and ``pca`` expose them under the sklearn
+    attribute names so existing scoring helpers accept a bundle unchanged.
+    """
+
+    def __init__(self, path, arrays, threshold_t2, threshold_spe, metadata):
+        self.path = path
+        self.arrays = arrays
+        self.threshold_t2 = threshold_t2
+        self.threshold_spe = threshold_spe
+        self.metadata = metadata
+        self.scaler = SimpleNamespace(mean_=arrays["scaler_mean"], scale_=arrays["scaler_scale"])
+        self.pca = SimpleNamespace(
+            components_=arrays["components"],
+            explained_variance_=arrays["explained_variance"],
+            mean_=arrays["pca_mean"],
+            n_components_=int(arrays["components"].shape[0]),
+            noise_variance_=float(metadata.get("noise_variance", 0.0)),
+        )
+
+    @property
+    def n_features(self) -> int:
+        return int(self.arrays["scaler_mean"].shape[0])
+
+    @property
+    def n_components(self) -> int:
+        return self.pca.n_components_
+
+
+def write_model_bundle(path, arrays: dict, threshold_t2: float, threshold_spe: float, metadata=None):
+    """Write ``arrays`` and thresholds to ``path`` atomically (temp file + rename)."""
+    path = Path(path)
+    arrays = {name: np.ascontiguousarray(value) for name, value in arrays.items()}
+    table = {}
+    offset = 0
+    for name, value in arrays.items():
+        offset = _aligned(offset)
+        table[name] = {"dtype": value.dtype.str, "shape": list(value.shape), "offset": offset}
+        offset += value.nbytes
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "threshold_t2": float(threshold_t2),
+        "threshold_spe": float(threshold_spe),
+        "metadata": metadata or {},
+        "arrays": table,
+    }
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    data_start = _aligned(_PREAMBLE.size + len(header_bytes))
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, value in arrays.items():
+            f.seek(data_start + table[name]["offset"])
+            f.write(value.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_model_bundle(path, mmap: bool = True) -> ModelBundle:
+    """Open a bundle; with ``mmap`` the arrays are read-only views of the mapped file."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        magic, version, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a model bundle")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model bundle version {version} in {path}")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+        buffer = None if mmap else f.read()
+    data_start = _aligned(_PREAMBLE.size + header_len)
+
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        base = data_start
+    else:
+        base = data_start - (_PREAMBLE.size + header_len)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=base + spec["offset"])
+        arrays[name] = array.reshape(spec["shape"])
+
+    return ModelBundle(path, arrays, header["threshold_t2"], header["threshold_spe"], header["metadata"])
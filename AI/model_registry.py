@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""Versioned model registry with an atomically switched "active" pointer.
+
+Layout::
+
+    <root>/versions/<version>.bundle    model bundle (see AI/model_bundle.py)
+    <root>/versions/<version>.sha256    hex SHA-256 of the bundle
+    <root>/ACTIVE                       name of the version to serve
+
+Publishing copies a bundle in under a temporary name, records its checksum
+and renames it into place; activating rewrites ``ACTIVE`` with
+``os.replace``, so a reader sees either the old or the new version, never a
+partial one. :class:`RegistryWatcher` follows ``ACTIVE`` from a running
+loop and swaps the compiled model in without pausing scoring.
+
+Manage a registry (from the repository root)::
+
+    python -m AI.model_registry models publish AI/model.bundle
+    python -m AI.model_registry models activate 20251204-101500-3f2a9c1b
+    python -m AI.model_registry models list
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from AI.model_bundle import read_model_bundle  # noqa: E402
+from AI.scoring import scorer_from_bundle  # noqa: E402
+
+ACTIVE_NAME = "ACTIVE"
+BUNDLE_SUFFIX = ".bundle"
+CHECKSUM_SUFFIX = ".sha256"
+
+
+def file_sha256(path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, text: str):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """Directory of versioned model bundles plus the ``ACTIVE`` pointer."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.versions_dir = self.root / "versions"
+        self.active_path = self.root / ACTIVE_NAME
+
+    def bundle_path(self, version: str) -> Path:
+        return self.versions_dir / f"{version}{BUNDLE_SUFFIX}"
+
+    def versions(self):
+        if not self.versions_dir.is_dir():
+            return []
+        return sorted(path.name[: -len(BUNDLE_SUFFIX)] for path in self.versions_dir.glob(f"*{BUNDLE_SUFFIX}"))
+
+    def active_version(self):
+        try:
+            version = self.active_path.read_text().strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def publish(self, bundle_path, version: str | None = None, activate: bool = True) -> str:
+        """Copy ``bundle_path`` into the registry and return its version name.
+
+        The default version name is a timestamp plus the first 8 hex digits
+        of the checksum. The bundle is opened once first, so a file that is
+        not a readable bundle never gets a version.
+        """
+        read_model_bundle(bundle_path, mmap=False)
+        checksum = file_sha256(bundle_path)
+        version = version or f"{time.strftime('%Y%m%d-%H%M%S')}-{checksum[:8]}"
+        if not version or Path(version).name != version or version.startswith("."):
+            raise ValueError(f"Invalid version name {version!r}")
+        target = self.bundle_path(version)
+        if target.exists():
+            raise ValueError(f"Version {version} already exists in {self.root}")
+
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + ".tmp")
+        shutil.copyfile(bundle_path, tmp_path)
+        _write_atomic(target.with_suffix(CHECKSUM_SUFFIX), checksum + "\n")
+        os.replace(tmp_path, target)
+        if activate:
+            self.activate(version)
+        return version
+
+    def verify(self, version: str) -> Path:
+        """Return the bundle path of ``version`` after checking it against its recorded checksum."""
+        path = self.bundle_path(version)
+        if not path.is_file():
+            raise ValueError(f"Unknown model version {version!r} in {self.root}")
+        expected = path.with_suffix(CHECKSUM_SUFFIX).read_text().strip()
+        if file_sha256(path) != expected:
+            raise ValueError(f"Checksum mismatch for model version {version!r}")
+        return path
+
+    def activate(self, version: str):
+        self.verify(version)
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self.active_path, version + "\n")
+
+    def load(self, version: str | None = None):
+        """Return ``(version, bundle)`` for ``version`` (default: the active one)."""
+        version = version or self.active_version()
+        if version is None:
+            raise ValueError(f"No active model version in {self.root}")
+        return version, read_model_bundle(self.verify(version))
+
+
+class RegistryWatcher:
+    """Follow a registry's ``ACTIVE`` pointer and serve its compiled model.
+
+    :attr:`state` is a ``(scorer, t2_limit, spe_limit)`` triple, the same
+    shape as :attr:`AdaptivePCAModel.state`. A new version is loaded, verified
+    and compiled on the watcher's thread and then published with a single
+    assignment, so the scoring loop switches models between two snapshots
+    without waiting on disk. A version that fails to load is reported once
+    and the current model stays in service.
+    """
+
+    def __init__(self, registry: ModelRegistry, poll_interval: float = 2.0):
+        self.registry = registry
+        self.poll_interval = poll_interval
+        self.swaps = 0
+        self.version = None
+        self.state = None
+        self._failed = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.check()
+        if self.state is None:
+            raise ValueError(f"No loadable active model in {registry.root}")
+
+    def check(self) -> bool:
+        """Poll ``ACTIVE`` once; swap in the new version and return True if it changed."""
+        version = self.registry.active_version()
+        if version is None or version == self.version or version == self._failed:
+            return False
+        try:
+            version, bundle = self.registry.load(version)
+            state = (scorer_from_bundle(bundle), float(bundle.threshold_t2), float(bundle.threshold_spe))
+        except (OSError, ValueError) as exc:
+            print(f"[Registry] Keeping model {self.version}: cannot load {version}: {exc}")
+            self._failed = version
+            return False
+        self.state = state
+        if self.version is not None:
+            self.swaps += 1
+            print(f"[Registry] Switched model {self.version} -> {version}")
+        self.version = version
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="model-registry-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage a versioned model registry.")
+    parser.add_argument("root", help="registry directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="add a model bundle as a new version")
+    publish.add_argument("bundle")
+    publish.add_argument("--version", default=None)
+    publish.add_argument("--no-activate", action="store_true")
+    activate = commands.add_parser("activate", help="point ACTIVE at an existing version")
+    activate.add_argument("version")
+    commands.add_parser("list", help="list versions, marking the active one")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.root)
+    if args.command == "publish":
+        version = registry.publish(args.bundle, args.version, activate=not args.no_activate)
+        print(f"[Registry] Published {version}{' (active)' if not args.no_activate else ''}")
+    elif args.command == "activate":
+        registry.activate(args.version)
+        print(f"[Registry] Active version is now {args.version}")
+    else:
+        active = registry.active_version()
+        for version in registry.versions():
+            print(f"{'*' if version == active else ' '} {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""Choose the PCA size and control limits from one cached decomposition.
+
+The normal data is scaled and decomposed (SVD) once. Every candidate is
+then scored from that cache. Each file is projected onto all loadings in
+one matrix product, and cumulative sums over the columns give T² and SPE
+for every number of components at once:
+
+* T²(k) = sum of t_j² / λ_j for j < k
+* SPE(k) = ‖z‖² − sum of t_j² for j < k
+
+A candidate is a retained-variance level combined with a limit choice.
+Limits are empirical percentiles or the analytical F / Jackson–Mudholkar
+values, each at a T²/SPE confidence pair. Files are streamed in chunks and
+scored on a thread pool, where the matrix products release the GIL.
+
+For every candidate the sweep reports:
+
+* the false-alarm rate on held-out normal rows (the last
+  ``validation_fraction`` of the normal file, plus any extra normal files);
+* the detection rate on each fault file (rows from ``fault_start`` on).
+
+The chosen candidate has the best mean detection rate within the
+false-alarm budget. Ties go to fewer components, then fewer false alarms.
+It is written as a model bundle, and optionally published to a registry.
+
+Usage (from the repository root)::
+
+    python -m AI.model_selection normal.csv --faults d01_te.csv d02_te.csv \
+        --max-false-alarm 0.05 --out AI/model.bundle --report selection.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from AI import ai  # noqa: E402
+
+DEFAULT_VARIANCES = (0.70, 0.75, 0.80, 0.85, 0.90, 0.95, 0.99)
+DEFAULT_LIMITS = (
+    ("empirical", 0.95, 0.99),
+    ("empirical", 0.99, 0.999),
+    ("analytical", 0.95, 0.99),
+    ("analytical", 0.99, 0.999),
+)
+
+
+class CachedDecomposition:
+    """Scaler statistics and the full SVD of the scaled training rows."""
+
+    def __init__(self, train):
+        train = np.asarray(train, dtype=float)
+        self.n_samples = len(train)
+        self.mean = train.mean(axis=0)
+        self.variance = train.var(axis=0)
+        self.scale = np.sqrt(self.variance)
+        self.scale[self.scale == 0.0] = 1.0
+
+        _, singular, vt = np.linalg.svd((train - self.mean) / self.scale, full_matrices=False)
+        # Same sign convention as sklearn's svd_flip: largest |loading| positive.
+        signs = np.sign(vt[range(len(vt)), np.abs(vt).argmax(axis=1)])
+        self.components = vt * np.where(signs == 0, 1.0, signs)[:, None]
+        self.eigvals = singular**2 / (self.n_samples - 1)
+        self.ratio = self.eigvals / self.eigvals.sum()
+        self._inv_eigvals = np.divide(1.0, self.eigvals, out=np.zeros_like(self.eigvals), where=self.eigvals > 0)
+
+    def n_components_for(self, variance: float) -> int:
+        """Components needed to retain ``variance``, resolved like sklearn's PCA."""
+        k = int(np.searchsorted(np.cumsum(self.ratio), variance, side="right") + 1)
+        return min(k, len(self.eigvals))
+
+    def scores(self, rows, ks):
+        """Return ``(t2, spe)``, each ``(len(rows), len(ks))``, for every size in ``ks``."""
+        z = (np.asarray(rows, dtype=float) - self.mean) / self.scale
+        t_squared = np.square(z @ self.components.T)
+        cols = np.asarray(ks) - 1
+        t2 = np.cumsum(t_squared * self._inv_eigvals, axis=1)[:, cols]
+        spe = np.einsum("ij,ij->i", z, z)[:, None] - np.cumsum(t_squared, axis=1)[:, cols]
+        return t2, np.maximum(spe, 0.0)
+
+
+def build_candidates(decomposition, train_scores, ks, variances, limits):
+    """One candidate per (variance, limit choice), with its T²/SPE limits."""
+    t2_train, spe_train = train_scores
+    candidates = []
+    for variance in variances:
+        k = decomposition.n_components_for(variance)
+        col = ks.index(k)
+        for method, t2_conf, spe_conf in limits:
+            if method == "empirical":
+                t2_limit = float(np.percentile(t2_train[:, col], t2_conf * 100))
+                spe_limit = float(np.percentile(spe_train[:, col], spe_conf * 100))
+            elif method == "analytical":
+                t2_limit = ai.t2_control_limit(k, decomposition.n_samples, t2_conf)
+                spe_limit = ai.spe_control_limit(decomposition.eigvals[k:], spe_conf)
+            else:
+                raise ValueError(f"Unknown limit method {method!r}")
+            candidates.append(
+                {
+                    "variance": variance,
+                    "n_components": k,
+                    "limits": method,
+                    "t2_confidence": t2_conf,
+                    "spe_confidence": spe_conf,
+                    "threshold_t2": t2_limit,
+                    "threshold_spe": spe_limit,
+                    "_col": col,
+                }
+            )
+    return candidates
+
+
+def count_alarms(decomposition, chunks, candidates, ks, skip_rows: int = 0):
+    """Rows scored and per-candidate alarm counts over ``chunks``, ignoring the first ``skip_rows``."""
+    cols = np.array([c["_col"] for c in candidates])
+    t2_limits = np.array([c["threshold_t2"] for c in candidates])
+    spe_limits = np.array([c["threshold_spe"] for c in candidates])
+    counts = np.zeros(len(candidates), dtype=np.int64)
+    rows = 0
+    for chunk in chunks:
+        if skip_rows:
+            dropped = min(skip_rows, len(chunk))
+            chunk, skip_rows = chunk[dropped:], skip_rows - dropped
+        if not len(chunk):
+            continue
+        t2, spe = decomposition.scores(chunk, ks)
+        counts += ((t2[:, cols] > t2_limits) | (spe[:, cols] > spe_limits)).sum(axis=0)
+        rows += len(chunk)
+    return rows, counts
+
+
+def _pick(candidates, max_false_alarm):
+    within = [c for c in candidates if c["false_alarm_rate"] <= max_false_alarm]
+    if within:
+        return min(within, key=lambda c: (-c["detection_rate"], c["n_components"], c["false_alarm_rate"]))
+    return min(candidates, key=lambda c: (c["false_alarm_rate"], -c["detection_rate"]))
+
+
+def sweep(
+    normal_csv,
+    fault_csvs,
+    normal_csvs=(),
+    variances=DEFAULT_VARIANCES,
+    limits=DEFAULT_LIMITS,
+    validation_fraction: float = 0.3,
+    fault_start: int = 0,
+    max_false_alarm: float = 0.05,
+    workers=None,
+    chunk_size: int = 50_000,
+):
+    """Evaluate every candidate and return the report (see the module docstring)."""
+    if not fault_csvs:
+        raise ValueError("Model selection needs at least one fault file")
+    if not 0 <= validation_fraction < 1:
+        raise ValueError("validation_fraction must be in [0, 1)")
+    started = time.perf_counter()
+    normal = ai.load_sensor_data(str(normal_csv))
+    n_train = len(normal) - int(len(normal) * validation_fraction)
+    train, held_out = normal[:n_train], normal[n_train:]
+    if n_train < 2:
+        raise ValueError(f"Not enough rows in {normal_csv} to train")
+
+    decomposition = CachedDecomposition(train)
+    fitted_s = time.perf_counter() - started
+    ks = sorted({decomposition.n_components_for(v) for v in variances})
+    candidates = build_candidates(decomposition, decomposition.scores(train, ks), ks, variances, limits)
+
+    def _chunks(path):
+        return ai.iter_sensor_csv(str(path), chunk_size=chunk_size)
+
+    normal_jobs = [("held-out", lambda: [held_out], 0)] if len(held_out) else []
+    normal_jobs += [(str(path), lambda path=path: _chunks(path), 0) for path in normal_csvs]
+    fault_jobs = [(str(path), lambda path=path: _chunks(path), fault_start) for path in fault_csvs]
+    if not normal_jobs:
+        raise ValueError("No normal rows to measure false alarms on; set validation_fraction or normal_csvs")
+
+    workers = workers or min(len(normal_jobs) + len(fault_jobs), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(count_alarms, decomposition, make_chunks(), candidates, ks, skip)
+            for _, make_chunks, skip in normal_jobs + fault_jobs
+        ]
+        results = [future.result() for future in futures]
+    normal_results, fault_results = results[: len(normal_jobs)], results[len(normal_jobs) :]
+
+    normal_rows = sum(rows for rows, _ in normal_results)
+    false_alarms = sum(counts for _, counts in normal_results)
+    for i, candidate in enumerate(candidates):
+        del candidate["_col"]
+        candidate["false_alarm_rate"] = float(false_alarms[i] / normal_rows) if normal_rows else 0.0
+        candidate["detection"] = {
+            name: float(counts[i] / rows) if rows else 0.0
+            for (name, _, _), (rows, counts) in zip(fault_jobs, fault_results)
+        }
+        candidate["detection_rate"] = float(np.mean(list(candidate["detection"].values())))
+
+    chosen = _pick(candidates, max_false_alarm)
+    return {
+        "normal_csv": str(normal_csv),
+        "train_rows": n_train,
+        "normal_rows": normal_rows,
+        "fault_start": fault_start,
+        "max_false_alarm": max_false_alarm,
+        "within_budget": chosen["false_alarm_rate"] <= max_false_alarm,
+        "workers": workers,
+        "decomposition_s": fitted_s,
+        "elapsed_s": time.perf_counter() - started,
+        "explained_variance_ratio": decomposition.ratio.tolist(),
+        "candidates": candidates,
+        "chosen": chosen,
+        "_decomposition": decomposition,
+    }
+
+
+def write_chosen_bundle(report, path, registry_dir=None):
+    """Write the chosen candidate as a model bundle; publish it to ``registry_dir`` if given."""
+    decomposition, chosen = report["_decomposition"], report["chosen"]
+    scaler, pca = ai.models_from_spectrum(
+        decomposition.mean,
+        decomposition.variance,
+        decomposition.n_samples,
+        decomposition.eigvals,
+        decomposition.components,
+        chosen["n_components"],
+        chosen["variance"],
+    )
+    metadata = {"selection": {key: chosen[key] for key in ("variance", "limits", "t2_confidence", "spe_confidence")}}
+    metadata["selection"].update(
+        false_alarm_rate=chosen["false_alarm_rate"], detection_rate=chosen["detection_rate"]
+    )
+    ai.export_model_bundle(path, scaler, pca, chosen["threshold_t2"], chosen["threshold_spe"], metadata)
+    if registry_dir is not None:
+        from AI.model_registry import ModelRegistry
+
+        return ModelRegistry(registry_dir).publish(path)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep PCA sizes and limits from one cached SVD.")
+    parser.add_argument("normal_csv", help="normal-operation CSV used for training and false alarms")
+    parser.add_argument("--faults", nargs="+", required=True, help="fault CSVs used for detection rates")
+    parser.add_argument("--normal", nargs="*", default=[], help="extra normal CSVs for false alarms")
+    parser.add_argument("--variance", nargs="+", type=float, default=list(DEFAULT_VARIANCES))
+    parser.add_argument("--validation-fraction", type=float, default=0.3)
+    parser.add_argument("--fault-start", type=int, default=0, help="rows of each fault file before the fault")
+    parser.add_argument("--max-false-alarm", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=str(ai.BASE_DIR / ai.MODEL_BUNDLE_NAME), help="bundle to write")
+    parser.add_argument("--registry", default=None, help="also publish the bundle to this model registry")
+    parser.add_argument("--report", default=None, help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    report = sweep(
+        args.normal_csv,
+        args.faults,
+        normal_csvs=args.normal,
+        variances=args.variance,
+        validation_fraction=args.validation_fraction,
+        fault_start=args.fault_start,
+        max_false_alarm=args.max_false_alarm,
+        workers=args.workers,
+    )
+    print(f"{'var':>5} {'k':>3} {'limits':<10} {'conf':<11} {'false alarm':>11} {'detection':>9}")
+    for c in report["candidates"]:
+        mark = "  <- chosen" if c is report["chosen"] else ""
+        conf = f"{c['t2_confidence']:g}/{c['spe_confidence']:g}"
+        print(
+            f"{c['variance']:>5.2f} {c['n_components']:>3} {c['limits']:<10} {conf:<11} "
+            f"{c['false_alarm_rate']:>11.2%} {c['detection_rate']:>9.2%}{mark}"
+        )
+    if not report["within_budget"]:
+        print(f"No candidate within a {args.max_false_alarm:.2%} false-alarm rate; chose the lowest.")
+
+    version = write_chosen_bundle(report, args.out, args.registry)
+    print(f"Wrote {args.out}" + (f" (registry version {version})" if version else ""))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({key: value for key, value in report.items() if not key.startswith("_")}, f, indent=2)
+    print(f"Swept {len(report['candidates'])} candidates in {report['elapsed_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""Multi-block PCA: one small PCA per process group plus a consensus score.
+
+The 52 sensors are split into the process groups the MCP prompt uses
+(``PROCESS_GROUPS``): A feed (XMEAS 1-7), B reactor (XMEAS 8-20),
+C separator (XMEAS 21-30), D output/storage (XMEAS 31-41) and
+E manipulated variables (XMV 1-11). Each group gets its own PCA on the
+shared standardization. Every block has its own T² and SPE with their own
+limits. On top of them, the consensus statistics are:
+
+* super T²: Hotelling's T² of all block scores together, whitened by their
+  joint covariance (the blocks' scores are correlated with each other);
+* super SPE: the sum of the block residuals.
+
+All of it is compiled into one ``[block scores | whitened scores |
+residual]`` projector, so a snapshot or a batch is scored for every block
+and the consensus in a single matmul (:class:`MultiBlockScorer`). The
+result behaves like a :class:`~AI.scoring.SnapshotScore` whose ``t2``/``spe``
+are the consensus values. Its ``block_summary()``, which WARN events carry
+as ``block``, names the exceeding blocks and the group with the highest
+severity, so the group is known without asking the LLM.
+
+Blocks are fitted from one set of streamed moments
+(:class:`~AI.ai.RunningCovariance`). :func:`fit_multiblock` with ``refit``
+and ``previous`` re-decomposes only the listed groups. The other groups
+keep their whole fit (standardization, loadings and limits).
+
+Train from a CSV (from the repository root)::
+
+    python -m AI.multiblock normal.csv --out AI/multiblock.bundle
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from AI.scoring import DEFAULT_BLOCK_ROWS, SnapshotScore, _normalize_rows_inplace  # noqa: E402
+
+# (name, label, first sensor index, end index) over ``SENSOR_COLUMNS`` order.
+PROCESS_GROUPS = (
+    ("A", "FEED", 0, 7),
+    ("B", "REACTOR", 7, 20),
+    ("C", "SEPARATOR", 20, 30),
+    ("D", "OUTPUT/STORAGE", 30, 41),
+    ("E", "Manipulated Vars", 41, 52),
+)
+MULTIBLOCK_BUNDLE_NAME = "multiblock.bundle"
+MODEL_KIND = "multiblock"
+
+
+class MultiBlockScore(SnapshotScore):
+    """Consensus T²/SPE of one snapshot plus the per-block statistics."""
+
+    __slots__ = ("block_t2", "block_spe", "_scorer")
+
+    def __init__(self, t2, spe, scores, residual, abs_components, block_t2, block_spe, scorer):
+        super().__init__(t2, spe, scores, residual, abs_components)
+        self.block_t2 = block_t2
+        self.block_spe = block_spe
+        self._scorer = scorer
+
+    def severities(self):
+        """Per-block ``max(T²/limit, SPE/limit)``; above 1 means the block exceeds.
+
+        A zero limit (a block that keeps all its components has no residual)
+        leaves that statistic out, as in the episode severity.
+        """
+        limits = self._scorer.block_limits
+        ratios = np.zeros((2, len(limits)))
+        np.divide(self.block_t2, limits[:, 0], out=ratios[0], where=limits[:, 0] > 0)
+        np.divide(self.block_spe, limits[:, 1], out=ratios[1], where=limits[:, 1] > 0)
+        return ratios.max(axis=0)
+
+    def block_summary(self) -> dict:
+        return self._scorer.describe_blocks(self.severities())
+
+    def as_dict(self, top_k=3):
+        analysis = super().as_dict(top_k)
+        analysis["block"] = self.block_summary()
+        return analysis
+
+
+class MultiBlockScorer:
+    """Compiled multi-block model; a drop-in for :class:`~AI.scoring.FusedScorer`.
+
+    ``blocks`` is a list of ``(name, label, start, stop)`` feature ranges
+    that tile the features in order, and ``block_components`` the number of
+    components of each. ``components`` is the block-diagonal
+    (K, n_features) loading matrix and ``explained_variance`` the K block
+    eigenvalues, block after block. ``whitener`` (K, K') maps block scores to
+    whitened consensus scores. ``block_limits`` is (n_blocks, 2) T²/SPE.
+    """
+
+    def __init__(
+        self,
+        blocks,
+        block_components,
+        mean,
+        scale,
+        components,
+        explained_variance,
+        whitener,
+        block_limits,
+        threshold_t2=np.inf,
+        threshold_spe=np.inf,
+        dtype=np.float64,
+    ):
+        self._set_layout(blocks, block_components, block_limits, threshold_t2, threshold_spe)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.components = np.asarray(components, dtype=float)
+        self.explained_variance = np.asarray(explained_variance, dtype=float)
+        self.whitener = np.asarray(whitener, dtype=float)
+        self.n_features = self.components.shape[1]
+        self.n_components = self.whitener.shape[1]
+
+        k, q, p = self.n_block_components, self.n_components, self.n_features
+        super_loadings = self.components.T @ self.whitener
+        projector = np.empty((p, k + q + p))
+        projector[:, :k] = self.components.T
+        projector[:, k : k + q] = super_loadings
+        projector[:, k + q :] = np.eye(p) - self.components.T @ self.components
+        self.offset = self.mean
+        self.projector = (projector / self.scale[:, None]).astype(dtype)
+        self.inv_lambdas = (1.0 / self.explained_variance).astype(dtype)
+        self.abs_components = np.abs(super_loadings.T).astype(dtype)
+
+    def _set_layout(self, blocks, block_components, block_limits, threshold_t2, threshold_spe):
+        self.blocks = [tuple(block) for block in blocks]
+        self.block_names = [block[0] for block in self.blocks]
+        self.block_components = [int(k) for k in block_components]
+        self.n_block_components = sum(self.block_components)
+        self.score_starts = np.concatenate([[0], np.cumsum(self.block_components)[:-1]]).astype(np.intp)
+        self.feature_starts = np.array([block[2] for block in self.blocks], dtype=np.intp)
+        self.block_limits = np.asarray(block_limits, dtype=float)
+        self.threshold_t2 = float(threshold_t2)
+        self.threshold_spe = float(threshold_spe)
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        """Build a scorer on a multi-block bundle's precompiled arrays (used in place, like FusedScorer)."""
+        arrays = bundle.arrays
+        meta = bundle.metadata
+        scorer = cls.__new__(cls)
+        scorer._set_layout(
+            meta["blocks"], meta["block_components"], arrays["block_limits"], bundle.threshold_t2, bundle.threshold_spe
+        )
+        scorer.mean = arrays["scaler_mean"]
+        scorer.scale = arrays["scaler_scale"]
+        scorer.components = arrays["components"]
+        scorer.explained_variance = arrays["explained_variance"]
+        scorer.whitener = arrays["whitener"]
+        scorer.n_features = bundle.n_features
+        scorer.n_components = scorer.whitener.shape[1]
+        scorer.offset = arrays["offset"]
+        scorer.projector = arrays["projector"]
+        scorer.inv_lambdas = arrays["inv_lambdas"]
+        scorer.abs_components = arrays["abs_components"]
+        return scorer
+
+    @property
+    def dtype(self):
+        return self.projector.dtype
+
+    def block_slice(self, name):
+        """``(score rows, feature columns)`` slices of block ``name`` in :attr:`components`."""
+        index = self.block_names.index(name)
+        first = int(self.score_starts[index])
+        _, _, start, stop = self.blocks[index]
+        return slice(first, first + self.block_components[index]), slice(start, stop)
+
+    def describe_blocks(self, severities) -> dict:
+        """Event summary: the most severe group, the groups over their limits and every severity."""
+        top = int(np.argmax(severities))
+        return {
+            "group": self.block_names[top],
+            "label": self.blocks[top][1],
+            "exceeded": [name for name, s in zip(self.block_names, severities) if s > 1.0],
+            "severity": {name: float(s) for name, s in zip(self.block_names, severities)},
+        }
+
+    def score(self, snap):
+        """Project one raw snapshot and return its :class:`MultiBlockScore`."""
+        out = (snap - self.offset).astype(self.projector.dtype, copy=False) @ self.projector
+        k, q = self.n_block_components, self.n_components
+        block_scores = out[:k]
+        block_t2 = np.add.reduceat(block_scores * block_scores * self.inv_lambdas, self.score_starts)
+        whitened = out[k : k + q]
+        residual = out[k + q :]
+        block_spe = np.add.reduceat(residual * residual, self.feature_starts)
+        t2 = float(whitened @ whitened)
+        spe = float(block_spe.sum())
+        return MultiBlockScore(t2, spe, whitened, residual, self.abs_components, block_t2, block_spe, self)
+
+    def analyze(self, snap, top_k=3):
+        return self.score(snap).as_dict(top_k)
+
+    def score_batch(self, x, contributions=True, block_rows=DEFAULT_BLOCK_ROWS):
+        """Score raw rows like :meth:`FusedScorer.score_batch`, adding ``block_t2``/``block_spe`` (n, n_blocks)."""
+        x = np.atleast_2d(np.asarray(x))
+        if x.dtype.kind != "f":
+            x = x.astype(float)
+        n, p, dtype = len(x), self.n_features, self.projector.dtype
+        k, q, b = self.n_block_components, self.n_components, len(self.blocks)
+        result = {
+            "t2": np.empty(n, dtype),
+            "spe": np.empty(n, dtype),
+            "block_t2": np.empty((n, b), dtype),
+            "block_spe": np.empty((n, b), dtype),
+        }
+        if contributions:
+            result["t2_contrib"] = np.empty((n, p), dtype)
+            result["spe_contrib"] = np.empty((n, p), dtype)
+        rows = max(1, min(block_rows, n))
+        centered = np.empty((rows, p), dtype)
+        projected = np.empty((rows, k + q + p), dtype)
+        weighted = np.empty((rows, k), dtype)
+
+        for start in range(0, n, rows):
+            stop = min(start + rows, n)
+            m = stop - start
+            z, out, w = centered[:m], projected[:m], weighted[:m]
+            np.subtract(x[start:stop], self.offset, out=z, casting="same_kind")
+            np.matmul(z, self.projector, out=out)
+            block_scores, whitened, residual = out[:, :k], out[:, k : k + q], out[:, k + q :]
+            np.multiply(block_scores, block_scores, out=w)
+            w *= self.inv_lambdas
+            result["block_t2"][start:stop] = np.add.reduceat(w, self.score_starts, axis=1)
+            np.einsum("ij,ij->i", whitened, whitened, out=result["t2"][start:stop])
+            squared = np.multiply(residual, residual, out=z)
+            block_spe = result["block_spe"][start:stop]
+            block_spe[:] = np.add.reduceat(squared, self.feature_starts, axis=1)
+            spe = block_spe.sum(axis=1, out=result["spe"][start:stop])
+            if contributions:
+                t2_contrib = result["t2_contrib"][start:stop]
+                np.matmul(np.abs(whitened), self.abs_components, out=t2_contrib)
+                _normalize_rows_inplace(t2_contrib)
+                spe_contrib = result["spe_contrib"][start:stop]
+                spe_contrib[:] = squared
+                _normalize_rows_inplace(spe_contrib, spe)
+        return result
+
+    def exceeded_blocks(self, block_t2, block_spe):
+        """Boolean (n, n_blocks) mask of blocks over either of their limits."""
+        return (block_t2 > self.block_limits[:, 0]) | (block_spe > self.block_limits[:, 1])
+
+
+def _block_decomposition(covariance, n_components):
+    from AI.ai import _principal_subspace
+
+    eigvals, eigvecs, _, k = _principal_subspace(covariance, n_components)
+    return eigvals, eigvecs[:, :k].T, k
+
+
+def fit_multiblock(stats, blocks=PROCESS_GROUPS, n_components=0.90, refit=None, previous=None):
+    """Fit a :class:`MultiBlockScorer` with analytical limits from streamed moments.
+
+    ``stats`` is a :class:`~AI.ai.RunningCovariance` over all features.
+    With ``previous`` (a scorer with the same blocks), only the groups in
+    ``refit`` are re-decomposed. The others keep their standardization
+    (mean and scale), loadings, eigenvalues and limits, so they score raw
+    data exactly as before. The consensus whitening and limits are always
+    recomputed from ``stats`` under the resulting standardization.
+    """
+    from AI.ai import spe_control_limit, t2_control_limit
+
+    mean = stats.mean.copy()
+    scale = np.sqrt(stats.variance(ddof=0))
+    scale[scale == 0.0] = 1.0
+    n_features = len(mean)
+    if blocks[0][2] != 0 or blocks[-1][3] != n_features or any(
+        a[3] != b[2] for a, b in zip(blocks, blocks[1:])
+    ):
+        raise ValueError(f"blocks must tile the {n_features} features in order")
+    names = [block[0] for block in blocks]
+    if previous is not None:
+        if previous.block_names != names:
+            raise ValueError("previous model has different blocks")
+        unknown = set(refit or ()) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown blocks to refit: {sorted(unknown)}")
+        for name, _, start, stop in blocks:
+            if name not in (refit or ()):
+                mean[start:stop] = previous.mean[start:stop]
+                scale[start:stop] = previous.scale[start:stop]
+    covariance = stats.covariance(ddof=1) / np.outer(scale, scale)
+
+    loadings, lambdas, limits = [], [], []
+    for index, (name, _, start, stop) in enumerate(blocks):
+        if previous is not None and name not in (refit or ()):
+            rows, cols = previous.block_slice(name)
+            loadings.append(previous.components[rows, cols])
+            lambdas.append(previous.explained_variance[rows])
+            limits.append(previous.block_limits[index])
+            continue
+        eigvals, block_components, k = _block_decomposition(covariance[start:stop, start:stop], n_components)
+        loadings.append(block_components)
+        lambdas.append(eigvals[:k])
+        limits.append((t2_control_limit(k, stats.n), spe_control_limit(eigvals[k:])))
+
+    components = np.zeros((sum(len(v) for v in loadings), n_features))
+    row = 0
+    for (_, _, start, stop), block_components in zip(blocks, loadings):
+        components[row : row + len(block_components), start:stop] = block_components
+        row += len(block_components)
+
+    # Joint covariance of all block scores; its inverse square root whitens them.
+    score_covariance = components @ covariance @ components.T
+    eigvals, eigvecs = np.linalg.eigh(score_covariance)
+    keep = eigvals > eigvals.max() * 1e-10
+    whitener = eigvecs[:, keep] / np.sqrt(eigvals[keep])
+
+    residual_projector = np.eye(n_features) - components.T @ components
+    residual_eigvals = np.clip(np.linalg.eigvalsh(residual_projector @ covariance @ residual_projector), 0.0, None)
+    threshold_t2 = t2_control_limit(int(keep.sum()), stats.n)
+    threshold_spe = spe_control_limit(residual_eigvals)
+
+    return MultiBlockScorer(
+        blocks,
+        [len(block_components) for block_components in loadings],
+        mean,
+        scale,
+        components,
+        np.concatenate(lambdas),
+        whitener,
+        np.array(limits, dtype=float),
+        threshold_t2,
+        threshold_spe,
+    )
+
+
+def export_multiblock_bundle(path, scorer: MultiBlockScorer, metadata=None, n_samples=0):
+    """Write ``scorer`` as a model bundle that :func:`~AI.scoring.scorer_from_bundle` loads back.
+
+    The bundle also has the usual ``scaler_*``/``components``/
+    ``explained_variance`` arrays (block-diagonal), so
+    ``bundle.scaler``/``bundle.pca`` keep working for generic helpers.
+    """
+    from AI.model_bundle import write_model_bundle
+
+    arrays = {
+        "scaler_mean": scorer.mean,
+        "scaler_scale": scorer.scale,
+        "components": scorer.components,
+        "explained_variance": scorer.explained_variance,
+        "pca_mean": np.zeros(scorer.n_features),
+        "whitener": scorer.whitener,
+        "block_limits": scorer.block_limits,
+        "offset": scorer.offset,
+        "projector": scorer.projector,
+        "inv_lambdas": scorer.inv_lambdas,
+        "abs_components": scorer.abs_components,
+    }
+    info = {
+        "model": MODEL_KIND,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "n_samples": int(n_samples),
+        "blocks": [list(block) for block in scorer.blocks],
+        "block_components": scorer.block_components,
+        "scoring_dtype": np.dtype(scorer.dtype).name,
+    }
+    info.update(metadata or {})
+    return write_model_bundle(path, arrays, scorer.threshold_t2, scorer.threshold_spe, info)
+
+
+def train_multiblock(normal_csv="normal.csv", out_path=None, chunk_size: int = 50_000, n_components=0.90):
+    """Stream ``normal_csv`` once, fit the multi-block model and write its bundle."""
+    from AI import ai
+
+    stats = ai.RunningCovariance(len(ai.SENSOR_COLUMNS))
+    for chunk in ai.iter_sensor_csv(str(normal_csv), chunk_size=chunk_size):
+        stats.update(chunk)
+    if stats.n < 2:
+        raise ValueError(f"{normal_csv} has too few rows to train on")
+    scorer = fit_multiblock(stats, n_components=n_components)
+    out_path = Path(out_path) if out_path is not None else ai.BASE_DIR / MULTIBLOCK_BUNDLE_NAME
+    export_multiblock_bundle(out_path, scorer, n_samples=stats.n)
+    return scorer, out_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the per-group multi-block PCA model.")
+    parser.add_argument("normal_csv", nargs="?", default="normal.csv")
+    parser.add_argument("--out", default=None, help=f"bundle path (default AI/{MULTIBLOCK_BUNDLE_NAME})")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    scorer, path = train_multiblock(args.normal_csv, args.out, args.chunk_size)
+    for (name, label, _, _), count, (t2_limit, spe_limit) in zip(
+        scorer.blocks, scorer.block_components, scorer.block_limits
+    ):
+        print(f"[Multiblock] {name} {label}: {count} components, T2 limit {t2_limit:.3f}, SPE limit {spe_limit:.3f}")
+    print(
+        f"[Multiblock] consensus T2 limit {scorer.threshold_t2:.3f}, SPE limit {scorer.threshold_spe:.3f} -> {path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
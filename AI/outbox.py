@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Durable, append-only outbox for events waiting to reach the backend.
+
+Layout::
+
+    <dir>/<first seq, 20 digits>.log   segments of JSON lines [seq, kind, body]
+    <dir>/ACKED                        highest acknowledged seq
+    <dir>/dead-letter.jsonl            records given up on, with the reason
+
+Records are appended in batches (one write and one fsync per batch) and
+read back strictly in sequence order. Acknowledging a seq moves the read
+cursor past it. Segments whose records are all acknowledged are deleted,
+except the one being written. A torn last line left by a crash is cut off
+when the outbox is reopened.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+SEGMENT_BYTES = 4 << 20
+SEGMENT_SUFFIX = ".log"
+ACKED_NAME = "ACKED"
+DEAD_LETTER_NAME = "dead-letter.jsonl"
+
+
+def _encode(seq, kind, body) -> bytes:
+    return (json.dumps([seq, kind, body], separators=(",", ":"), default=float) + "\n").encode("utf-8")
+
+
+class Outbox:
+    """Segmented append-only log with an acknowledged-sequence pointer.
+
+    ``fsync=False`` leaves durability to the OS page cache, which survives a
+    process crash but not a power loss.
+    """
+
+    def __init__(self, directory, segment_bytes: int = SEGMENT_BYTES, fsync: bool = True):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._acked_path = self.directory / ACKED_NAME
+        try:
+            self.acked = int(self._acked_path.read_text().strip() or 0)
+        except FileNotFoundError:
+            self.acked = 0
+
+        self._segments = sorted(int(path.stem) for path in self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+        self.last_seq = self.acked
+        if self._segments:
+            self.last_seq = max(self.last_seq, self._recover_tail(self._segments[-1]))
+        self._writer = None
+        self._peeked = []
+        self._cursor = self._locate(self.acked)
+
+    @property
+    def pending_count(self) -> int:
+        return self.last_seq - self.acked
+
+    def _path(self, first_seq: int) -> Path:
+        return self.directory / f"{first_seq:020d}{SEGMENT_SUFFIX}"
+
+    def _recover_tail(self, first_seq: int) -> int:
+        """Truncate a torn final line and return the last complete seq in the segment."""
+        path = self._path(first_seq)
+        data = path.read_bytes()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        last = first_seq - 1
+        for line in data[:end].splitlines():
+            last = json.loads(line)[0]
+        return last
+
+    def _locate(self, acked: int):
+        """Return ``(segment, offset)`` of the first record after ``acked``."""
+        for first_seq in self._segments:
+            with open(self._path(first_seq), "rb") as f:
+                offset = 0
+                for line in f:
+                    if json.loads(line)[0] > acked:
+                        return first_seq, offset
+                    offset += len(line)
+        return (self._segments[-1], self._path(self._segments[-1]).stat().st_size) if self._segments else None
+
+    def append_many(self, records) -> int:
+        """Append ``(kind, body)`` records durably; return the last assigned seq."""
+        with self._lock:
+            if self._writer is None or self._writer.tell() >= self.segment_bytes:
+                self._roll()
+            chunks = []
+            for kind, body in records:
+                self.last_seq += 1
+                chunks.append(_encode(self.last_seq, kind, body))
+            self._writer.write(b"".join(chunks))
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            return self.last_seq
+
+    def append(self, kind: str, body) -> int:
+        return self.append_many([(kind, body)])
+
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._segments and self._path(self._segments[-1]).stat().st_size < self.segment_bytes:
+            first_seq = self._segments[-1]
+        else:
+            first_seq = self.last_seq + 1
+            self._segments.append(first_seq)
+            if self._cursor is None:
+                self._cursor = (first_seq, 0)
+        self._writer = open(self._path(first_seq), "ab")
+
+    def pending(self, limit: int):
+        """Return up to ``limit`` unacknowledged ``(seq, kind, body)`` records in order."""
+        with self._lock:
+            self._peeked = []
+            if self._cursor is None or self.pending_count == 0:
+                return []
+            records = []
+            segment, offset = self._cursor
+            index = self._segments.index(segment)
+            while len(records) < limit and index < len(self._segments):
+                with open(self._path(segment), "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        offset += len(line)
+                        seq, kind, body = json.loads(line)
+                        records.append((seq, kind, body))
+                        self._peeked.append((seq, segment, offset))
+                        if len(records) >= limit:
+                            break
+                if len(records) < limit:
+                    index += 1
+                    if index < len(self._segments):
+                        segment, offset = self._segments[index], 0
+            return records
+
+    def ack(self, seq: int):
+        """Acknowledge every record up to and including ``seq`` and compact."""
+        with self._lock:
+            if seq <= self.acked:
+                return
+            for peeked_seq, segment, offset in self._peeked:
+                if peeked_seq == seq:
+                    self._cursor = (segment, offset)
+                    break
+            else:
+                self._cursor = self._locate(seq)
+            self._peeked = [entry for entry in self._peeked if entry[0] > seq]
+            self.acked = seq
+            tmp_path = self._acked_path.with_name(ACKED_NAME + ".tmp")
+            tmp_path.write_text(f"{seq}\n")
+            os.replace(tmp_path, self._acked_path)
+            self._compact()
+
+    def _compact(self):
+        while len(self._segments) > 1 and self._segments[1] <= self.acked + 1:
+            first_seq = self._segments.pop(0)
+            self._path(first_seq).unlink(missing_ok=True)
+            if self._cursor[0] == first_seq:
+                self._cursor = (self._segments[0], 0)
+
+    def dead_letter(self, seq: int, kind: str, body, reason: str):
+        """Record a message that will not be retried; the caller still acks it."""
+        entry = {"seq": seq, "kind": kind, "reason": reason, "at": time.time(), "body": body}
+        with open(self.directory / DEAD_LETTER_NAME, "a") as f:
+            f.write(json.dumps(entry, default=float) + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
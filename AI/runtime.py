@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""Staged asyncio runtime for the live pipeline.
+
+Snapshots flow through four stages joined by bounded ``asyncio.Queue``s::
+
+    source -> score -> episode -> sink
+                        alarm  ---^
+
+* ``source`` reads snapshots on its own thread (CSV readers and
+  :class:`~AI.sensor_db.SensorTail` block) and paces them with the
+  :class:`~AI.ai.ReplayClock`.
+* ``score`` runs the fused projection against the current model state
+  (adaptive or registry-watched) and feeds non-exceeding snapshots to the
+  adaptive model. Each batch is scored on a dedicated one-worker thread
+  (which keeps the order), so a long batch or an adaptive refresh never
+  holds up alarm intake or event dispatch on the event loop.
+* ``episode`` owns the history ring and the episode tracker and turns
+  exceedances into WARN events.
+* ``alarm`` takes machine alarm codes from :meth:`PipelineRuntime.raise_alarm`
+  (callable from any thread) and turns them into ALARM events for the
+  latest snapshot. An alarm can also be deferred until a number of
+  snapshots have been through ``episode``, which keeps it tied to replay
+  progress when the clock does not wait (backtest mode).
+* ``sink`` logs each event and delivers it on a thread pool of
+  ``concurrency["sink"]`` workers, so a slow backend never stalls scoring
+  until the sink queue is full.
+
+Snapshots travel in batches: as read from the source thread in replays,
+one at a time once the clock paces them. Queue sizes count batches (events
+on the sink and alarm queues). A full queue makes the stage before it
+wait, which eventually pauses the source: that is the backpressure. ``score`` and ``episode`` keep snapshot
+order and run one worker each. Only the event loop thread touches the
+history, episode tracker and event log, so none of them need locks.
+
+:meth:`PipelineRuntime.stop` (or Ctrl-C under :meth:`PipelineRuntime.run`)
+stops the source, lets the queued snapshots and events drain for up to
+``shutdown_timeout`` seconds, closes any open episode and returns the
+clock report.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from AI import ai  # noqa: E402
+from AI.history import SnapshotRing  # noqa: E402
+from AI.metrics import PipelineMetrics  # noqa: E402
+
+STAGES = ("source", "score", "episode", "alarm", "sink")
+QUEUE_SIZES = {"score": 256, "episode": 256, "sink": 1024, "alarm": 64}
+CONCURRENCY = {"sink": 1, "alarm": 1}
+_END = object()
+
+
+class PipelineRuntime:
+    """Runs ``get_snapshot`` through the scoring stages until it raises StopIteration or :meth:`stop`.
+
+    ``queue_sizes`` and ``concurrency`` override :data:`QUEUE_SIZES` and
+    :data:`CONCURRENCY` per stage. ``source_batch`` snapshots are read per
+    hop to the source thread (use 1 for live sources, more for replays).
+    The other arguments are those of :func:`~AI.ai.warn_loop`.
+    """
+
+    def __init__(
+        self,
+        get_snapshot,
+        scorer,
+        threshold_t2,
+        threshold_spe,
+        history_buffer,
+        log,
+        adaptive=None,
+        watcher=None,
+        clock=None,
+        episodes=None,
+        transport=None,
+        metrics=None,
+        queue_sizes=None,
+        concurrency=None,
+        source_batch: int = 1,
+        shutdown_timeout: float = 30.0,
+    ):
+        if adaptive is not None and watcher is not None:
+            raise ValueError("adaptive and watcher both replace the model; pass only one")
+        self.concurrency = {**CONCURRENCY, **(concurrency or {})}
+        self.queue_sizes = {**QUEUE_SIZES, **(queue_sizes or {})}
+        unknown = (set(self.concurrency) - set(CONCURRENCY)) | (set(self.queue_sizes) - set(QUEUE_SIZES))
+        if unknown:
+            raise ValueError(f"Unknown stage settings: {sorted(unknown)} (score and episode run one ordered worker)")
+        if min(self.concurrency.values()) < 1 or min(self.queue_sizes.values()) < 1 or source_batch < 1:
+            raise ValueError("concurrency, queue sizes and source_batch must be at least 1")
+
+        self.get_snapshot = get_snapshot
+        self._state = (scorer, threshold_t2, threshold_spe)
+        self.history = history_buffer
+        self.log = log
+        self.adaptive = adaptive
+        self.watcher = watcher
+        self.clock = clock or ai.ReplayClock()
+        self.episodes = episodes
+        self.transport = transport
+        self.metrics = metrics or PipelineMetrics()
+        self.source_batch = source_batch
+        self.shutdown_timeout = shutdown_timeout
+
+        self.processed = dict.fromkeys(STAGES, 0)
+        self.high_water = dict.fromkeys(self.queue_sizes, 0)
+        self.alarms_dropped = 0
+        self.alarms_skipped = 0
+        self._queues = {}
+        self._loop = None
+        self._stopping = threading.Event()
+        self._early_alarms = []
+        self._deferred_alarms = []
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """``(scorer, threshold_t2, threshold_spe)`` currently used for scoring."""
+        if self.adaptive is not None:
+            return self.adaptive.state
+        if self.watcher is not None:
+            return self.watcher.state
+        return self._state
+
+    def run(self) -> dict:
+        """Run the stages on a new event loop until the source ends; return the clock report."""
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> dict:
+        self._queues = {name: asyncio.Queue(size) for name, size in self.queue_sizes.items()}
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            early, self._early_alarms = self._early_alarms, []
+        for code in early:
+            self._offer_alarm(code)
+
+        source_pool = ThreadPoolExecutor(1, thread_name_prefix="runtime-source")
+        score_pool = ThreadPoolExecutor(1, thread_name_prefix="runtime-score")
+        sink_pool = ThreadPoolExecutor(self.concurrency["sink"], thread_name_prefix="runtime-sink")
+        self.clock.start()
+        ordered = [
+            asyncio.create_task(self._source(source_pool), name="runtime-source"),
+            asyncio.create_task(self._score(score_pool), name="runtime-score"),
+            asyncio.create_task(self._episode(), name="runtime-episode"),
+        ]
+        alarms = [
+            asyncio.create_task(self._alarm(), name=f"runtime-alarm-{i}") for i in range(self.concurrency["alarm"])
+        ]
+        sinks = [
+            asyncio.create_task(self._sink(sink_pool), name=f"runtime-sink-{i}")
+            for i in range(self.concurrency["sink"])
+        ]
+        try:
+            try:
+                # ``wait`` rather than ``gather``: cancelling this task must not cancel the stages.
+                done, _ = await asyncio.wait(ordered, return_when=asyncio.FIRST_EXCEPTION)
+            except asyncio.CancelledError:
+                print("Stopping pipeline runtime...")
+                self.stop()
+                await self._drain(ordered)
+            else:
+                failed = [task for task in done if task.exception() is not None]
+                if failed:
+                    for task in ordered + alarms + sinks:
+                        task.cancel()
+                    await asyncio.gather(*ordered, *alarms, *sinks, return_exceptions=True)
+                    raise failed[0].exception()
+            for _ in alarms:
+                await self._queues["alarm"].put(_END)
+            await self._drain(alarms)
+            for _ in sinks:
+                await self._queues["sink"].put(_END)
+            await self._drain(sinks)
+        finally:
+            source_pool.shutdown(wait=False, cancel_futures=True)
+            score_pool.shutdown(wait=False, cancel_futures=True)
+            sink_pool.shutdown(wait=False)
+            with self._lock:
+                self._loop = None
+
+        report = self.clock.report()
+        print(
+            f"[Clock] {report['snapshots']} snapshots in {report['elapsed_s']:.2f}s "
+            f"({report['snapshots_per_s']:.1f} snapshots/s, {report['mode']})"
+        )
+        if self.metrics.log_interval is not None:
+            self.metrics.log()
+        return report
+
+    async def _drain(self, tasks):
+        """Wait for ``tasks`` up to ``shutdown_timeout``, then cancel what is left."""
+        done, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"[Runtime] Cancelled {len(pending)} stage(s) still busy after {self.shutdown_timeout}s")
+            await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    def stop(self):
+        """Stop reading new snapshots and drain the rest. Safe to call from any thread."""
+        self._stopping.set()
+        stop_source = getattr(self.get_snapshot, "stop", None)
+        if stop_source is not None:
+            stop_source()
+
+    def raise_alarm(self, code, after_snapshots: int | None = None):
+        """Queue a machine alarm ``code`` for the latest snapshot. Safe to call from any thread.
+
+        With ``after_snapshots`` the alarm waits until that many snapshots
+        are in the history; if the source ends first it is counted as skipped.
+        """
+        with self._lock:
+            if after_snapshots is not None:
+                self._deferred_alarms.append((after_snapshots, code))
+                return
+            loop = self._loop
+            if loop is None:
+                self._early_alarms.append(code)
+                return
+        loop.call_soon_threadsafe(self._offer_alarm, code)
+
+    def _offer_due_alarms(self):
+        done = self.processed["episode"]
+        with self._lock:
+            due = [code for after, code in self._deferred_alarms if after <= done]
+            self._deferred_alarms = [(after, code) for after, code in self._deferred_alarms if after > done]
+        for code in due:
+            self._offer_alarm(code)
+
+    def _offer_alarm(self, code):
+        try:
+            self._queues["alarm"].put_nowait(code)
+        except asyncio.QueueFull:
+            self.alarms_dropped += 1
+            return
+        self._note_depth("alarm")
+
+    def stats(self) -> dict:
+        return {
+            "processed": dict(self.processed),
+            "queued": {name: queue.qsize() for name, queue in self._queues.items()},
+            "high_water": dict(self.high_water),
+            "alarms_dropped": self.alarms_dropped,
+            "alarms_skipped": self.alarms_skipped,
+        }
+
+    def _note_depth(self, name):
+        depth = self._queues[name].qsize()
+        if depth > self.high_water[name]:
+            self.high_water[name] = depth
+
+    async def _put(self, name, item):
+        await self._queues[name].put(item)
+        self._note_depth(name)
+
+    def _read_batch(self):
+        """Read up to ``source_batch`` snapshots on the source thread; the flag is True at the end."""
+        batch = []
+        record = self.metrics.record
+        perf = time.perf_counter
+        for _ in range(self.source_batch):
+            if self._stopping.is_set():
+                return batch, True
+            started = perf()
+            try:
+                snap = self.get_snapshot()
+            except StopIteration:
+                print("Sensor data exhausted, stopping pipeline runtime.")
+                return batch, True
+            record("read", perf() - started)
+            batch.append(snap)
+        return batch, False
+
+    async def _source(self, pool):
+        loop = asyncio.get_running_loop()
+        try:
+            ended = False
+            while not ended:
+                batch, ended = await loop.run_in_executor(pool, self._read_batch)
+                pending = []
+                for snap in batch:
+                    pending.append(snap)
+                    delay = self.clock.next_delay()
+                    if delay > 0:
+                        await self._put("score", pending)
+                        pending = []
+                        await asyncio.sleep(delay)
+                if pending:
+                    await self._put("score", pending)
+                self.processed["source"] += len(batch)
+        finally:
+            await self._queues["score"].put(_END)
+
+    async def _score(self, pool):
+        queue = self._queues["score"]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await queue.get()
+            if batch is _END:
+                await self._queues["episode"].put(_END)
+                return
+            scored = await loop.run_in_executor(pool, self._score_batch, batch)
+            self.processed["score"] += len(batch)
+            await self._put("episode", scored)
+
+    def _score_batch(self, batch):
+        """Score ``batch`` on the score thread; touches only the model state and metrics."""
+        metrics = self.metrics
+        perf = time.perf_counter
+        scored = []
+        for snap in batch:
+            metrics.count_snapshot()
+            started = perf()
+            scorer, threshold_t2, threshold_spe = self.state
+            result = scorer.score(snap)
+            exceeded = (result.t2 > threshold_t2) or (result.spe > threshold_spe)
+            metrics.record("score", perf() - started)
+            if not exceeded and self.adaptive is not None:
+                self.adaptive.observe(snap)
+            scored.append((time.time(), snap, result, exceeded, threshold_t2, threshold_spe))
+        return scored
+
+    async def _episode(self):
+        queue = self._queues["episode"]
+        history = self.history
+        metrics = self.metrics
+        ring = isinstance(history, SnapshotRing)
+        perf = time.perf_counter
+        while True:
+            batch = await queue.get()
+            if batch is _END:
+                break
+            for timestamp, snap, result, exceeded, threshold_t2, threshold_spe in batch:
+                history.append(snap if ring else snap.tolist())
+                started = perf()
+                if self.episodes is not None:
+                    analysis = self.episodes.observe(timestamp, result, threshold_t2, threshold_spe)
+                else:
+                    analysis = result.as_dict() if exceeded else None
+                if exceeded:
+                    metrics.record("contribution", perf() - started)
+                if analysis is not None:
+                    await self._emit(analysis)
+            self.processed["episode"] += len(batch)
+            if self._deferred_alarms:
+                self._offer_due_alarms()
+            metrics.maybe_log()
+        with self._lock:
+            missed, self._deferred_alarms = self._deferred_alarms, []
+        for after, code in missed:
+            self.alarms_skipped += 1
+            print(f"[Runtime] Skipped alarm {code}: the source ended before {after} snapshots")
+        if self.episodes is not None and self.episodes.active and history:
+            await self._emit(self.episodes.close(time.time(), reason="stopped"))
+
+    async def _emit(self, analysis):
+        with self.metrics.time("serialize"):
+            event = ai._warn_event(analysis, self.history, self.history[-1])
+        await self._put("sink", event)
+
+    async def _alarm(self):
+        queue = self._queues["alarm"]
+        while True:
+            code = await queue.get()
+            if code is _END:
+                return
+            if not self.history:
+                self.alarms_skipped += 1
+                print(f"[Runtime] Skipped alarm {code}: no snapshot scored yet")
+                continue
+            scorer = self.state[0]
+            with self.metrics.time("serialize"):
+                event = ai.alarm_event(code, self.history, None, None, scorer=scorer)
+            self.processed["alarm"] += 1
+            await self._put("sink", event)
+
+    async def _sink(self, pool):
+        queue = self._queues["sink"]
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await queue.get()
+            if event is _END:
+                return
+            self.log.add(event)
+            try:
+                await loop.run_in_executor(pool, ai.deliver_event, event, self.transport, self.metrics)
+            except Exception as exc:
+                print(f"[Runtime] Failed to deliver {event['event_type']} event: {exc}")
+            self.metrics.count_event()
+            self.processed["sink"] += 1
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Numpy-only scoring core shared by the live loop, backtests and hosts.
+
+Nothing here imports pandas, sklearn or scipy, so a scoring process that
+only needs these helpers (plus a model bundle) starts quickly.
+
+Scoring runs in float64 by default. ``dtype=np.float32`` (or a float32
+model bundle) halves the size of the projector, the block buffers and the
+outputs. The offset is still subtracted in float64, so large raw values
+keep their precision. Against float64, float32 T² and SPE agree within
+``FLOAT32_RTOL`` relative to the value plus ``FLOAT32_ATOL``, and
+contributions within ``FLOAT32_ATOL``. The top-3 sensors can only differ
+where two contributions are within that tolerance of each other.
+"""
+
+import numpy as np
+
+FLOAT32_RTOL = 1e-4
+FLOAT32_ATOL = 1e-4
+DEFAULT_BLOCK_ROWS = 4096
+
+
+def _normalize_rows_inplace(block, totals=None):
+    totals = (block.sum(axis=1) if totals is None else totals)[:, None]
+    np.divide(block, totals, out=block, where=totals > 0)
+
+
+def score_batch(pca, x, scaler=None, contributions=True, dtype=np.float64, block_rows=DEFAULT_BLOCK_ROWS):
+    """Score an (n, n_features) matrix block by block.
+
+    Returns a dict with ``t2`` and ``spe`` arrays of shape (n,) and, when
+    ``contributions`` is set, the row-normalized ``t2_contrib`` and
+    ``spe_contrib`` matrices of shape (n, n_features). Pass ``scaler`` to
+    score raw sensor values; otherwise ``x`` must already be scaled.
+    Outputs have ``dtype``; see :meth:`FusedScorer.score_batch` for the
+    memory bound.
+    """
+    components = np.asarray(pca.components_)
+    n_features = components.shape[1]
+    if scaler is not None:
+        mean, scale = scaler.mean_, scaler.scale_
+    else:
+        mean, scale = np.zeros(n_features), np.ones(n_features)
+    scorer = FusedScorer.from_arrays(
+        mean, scale, components, pca.explained_variance_, pca.mean_, dtype=dtype
+    )
+    return scorer.score_batch(x, contributions=contributions, block_rows=block_rows)
+
+
+def top_k_sensors(contrib, k=3):
+    """Return the ``k`` largest entries of a contribution vector as event dicts."""
+    top_idx = contrib.argsort()[-k:][::-1]
+    return [{"sensor": int(idx + 1), "score": float(contrib[idx])} for idx in top_idx]
+
+
+def top_k_rows(contrib, k=3):
+    """Row-wise top-k of a contribution matrix as ``(sensor_numbers, scores)`` arrays."""
+    top_idx = np.argsort(contrib, axis=1)[:, -k:][:, ::-1]
+    return top_idx + 1, np.take_along_axis(contrib, top_idx, axis=1)
+
+
+class SnapshotScore:
+    """T²/SPE of one snapshot plus the projection they were computed from.
+
+    Contributions are derived lazily from the stored scores/residual, so the
+    exceedance path never projects the snapshot a second time.
+    """
+
+    __slots__ = ("t2", "spe", "scores", "residual", "_abs_components")
+
+    def __init__(self, t2, spe, scores, residual, abs_components):
+        self.t2 = t2
+        self.spe = spe
+        self.scores = scores
+        self.residual = residual
+        self._abs_components = abs_components
+
+    def t2_contributions(self):
+        raw = np.abs(self.scores) @ self._abs_components
+        total = raw.sum()
+        return raw / total if total > 0 else raw
+
+    def spe_contributions(self):
+        raw = self.residual * self.residual
+        return raw / self.spe if self.spe > 0 else raw
+
+    def as_dict(self, top_k=3):
+        return {
+            "risk": self.t2,
+            "spe": self.spe,
+            "top3_t2": top_k_sensors(self.t2_contributions(), top_k),
+            "top3_spe": top_k_sensors(self.spe_contributions(), top_k),
+        }
+
+
+class FusedScorer:
+    """Precompiled scaler + PCA scorer for single snapshots.
+
+    The scaler's mean/scale and the PCA mean are folded into one offset and
+    one (n_features, n_components + n_features) matrix ``[P | I - P P^T]``
+    scaled by ``1 / scale``, so a single matmul yields both the PCA scores
+    and the residual without any sklearn dispatch.
+    """
+
+    def __init__(self, scaler, pca, dtype=np.float64):
+        self._compile(
+            scaler.mean_, scaler.scale_, pca.components_, pca.explained_variance_, pca.mean_, dtype
+        )
+
+    @classmethod
+    def from_arrays(cls, mean, scale, components, explained_variance, pca_mean=None, dtype=np.float64):
+        """Build a scorer from plain arrays instead of fitted sklearn objects."""
+        scorer = cls.__new__(cls)
+        if pca_mean is None:
+            pca_mean = np.zeros(len(mean))
+        scorer._compile(mean, scale, components, explained_variance, pca_mean, dtype)
+        return scorer
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        """Build a scorer on a :class:`~AI.model_bundle.ModelBundle`'s precompiled arrays.
+
+        The projector is used in place, so memory-mapped bundles are shared
+        between processes instead of copied. A bundle exported with
+        ``dtype=np.float32`` gives a float32 scorer.
+        """
+        arrays = bundle.arrays
+        scorer = cls.__new__(cls)
+        scorer.n_components = bundle.n_components
+        scorer.n_features = bundle.n_features
+        scorer.offset = arrays["offset"]
+        scorer.projector = arrays["projector"]
+        scorer.inv_lambdas = arrays["inv_lambdas"]
+        scorer.abs_components = arrays["abs_components"]
+        return scorer
+
+    def _compile(self, mean, scale, components, explained_variance, pca_mean, dtype=np.float64):
+        scale = np.asarray(scale, dtype=float)
+        components = np.asarray(components, dtype=float)
+        n_components, n_features = components.shape
+
+        projector = np.empty((n_features, n_components + n_features))
+        projector[:, :n_components] = components.T
+        projector[:, n_components:] = np.eye(n_features) - components.T @ components
+
+        self.n_components = n_components
+        self.n_features = n_features
+        self.offset = np.asarray(mean, dtype=float) + scale * np.asarray(pca_mean, dtype=float)
+        self.projector = (projector / scale[:, None]).astype(dtype)
+        self.inv_lambdas = (1.0 / np.asarray(explained_variance, dtype=float)).astype(dtype)
+        self.abs_components = np.abs(components).astype(dtype)
+
+    @property
+    def dtype(self):
+        return self.projector.dtype
+
+    def score(self, snap):
+        """Project one raw snapshot and return its :class:`SnapshotScore`."""
+        out = (snap - self.offset).astype(self.projector.dtype, copy=False) @ self.projector
+        scores = out[: self.n_components]
+        residual = out[self.n_components :]
+        t2 = float(scores * scores @ self.inv_lambdas)
+        spe = float(residual @ residual)
+        return SnapshotScore(t2, spe, scores, residual, self.abs_components)
+
+    def analyze(self, snap, top_k=3):
+        """Return risk/spe and the top-k T²/SPE sensors for one raw snapshot."""
+        return self.score(snap).as_dict(top_k)
+
+    def score_batch(self, x, contributions=True, block_rows=DEFAULT_BLOCK_ROWS):
+        """Score raw rows ``block_rows`` at a time; see :func:`score_batch` for the result.
+
+        Each block is offset (in float64) into one preallocated buffer and
+        projected into another. Scores, residuals and contributions are
+        computed in place from those buffers, so the only full-size arrays
+        are the outputs. Working memory is about
+        ``block_rows * (2 * n_features + 2 * n_components)`` values of the
+        scorer's dtype, whatever the number of rows.
+        """
+        x = np.atleast_2d(np.asarray(x))
+        if x.dtype.kind != "f":
+            x = x.astype(float)
+        n, k, p, dtype = len(x), self.n_components, self.n_features, self.projector.dtype
+        result = {"t2": np.empty(n, dtype), "spe": np.empty(n, dtype)}
+        if contributions:
+            result["t2_contrib"] = np.empty((n, p), dtype)
+            result["spe_contrib"] = np.empty((n, p), dtype)
+        rows = max(1, min(block_rows, n))
+        centered = np.empty((rows, p), dtype)
+        projected = np.empty((rows, k + p), dtype)
+        weighted = np.empty((rows, k), dtype)
+
+        for start in range(0, n, rows):
+            stop = min(start + rows, n)
+            m = stop - start
+            z, out, w = centered[:m], projected[:m], weighted[:m]
+            np.subtract(x[start:stop], self.offset, out=z, casting="same_kind")
+            np.matmul(z, self.projector, out=out)
+            scores, residual = out[:, :k], out[:, k:]
+            np.multiply(scores, self.inv_lambdas, out=w)
+            np.einsum("ij,ij->i", w, scores, out=result["t2"][start:stop])
+            spe = np.einsum("ij,ij->i", residual, residual, out=result["spe"][start:stop])
+            if contributions:
+                t2_contrib = result["t2_contrib"][start:stop]
+                np.matmul(np.abs(scores, out=scores), self.abs_components, out=t2_contrib)
+                _normalize_rows_inplace(t2_contrib)
+                spe_contrib = result["spe_contrib"][start:stop]
+                np.multiply(residual, residual, out=spe_contrib)
+                _normalize_rows_inplace(spe_contrib, spe)
+        return result
+
+
+def scorer_from_bundle(bundle):
+    """The scorer a bundle was exported for: :class:`FusedScorer`, or a multi-block one.
+
+    Bundles whose metadata has ``"model": "multiblock"`` come from
+    AI/multiblock.py and get its :class:`~AI.multiblock.MultiBlockScorer`.
+    """
+    if bundle.metadata.get("model") == "multiblock":
+        from AI.multiblock import MultiBlockScorer
+
+        return MultiBlockScorer.from_bundle(bundle)
+    return FusedScorer.from_bundle(bundle)
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""Read sensor rows from the backend `sensor` table without loading the ORM.
+
+Connection settings follow backend/app/DB/db_config.py (DB_USER, DB_PW,
+DB_HOST, DB_PORT, DB_NAME, CHARSET); ``SENSOR_DB_URL`` overrides them all.
+:func:`iter_sensor_chunks` scans a fixed range for training and
+:class:`SensorTail` follows new inserts as the live warn-loop source.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+SENSOR_TABLE = "sensor"
+SENSOR_COLUMNS = [f"XMEAS_{i}" for i in range(1, 42)] + [f"XMV_{i}" for i in range(1, 12)]
+
+
+def sensor_database_url() -> str:
+    url = os.getenv("SENSOR_DB_URL")
+    if url:
+        return url
+
+    db_user = os.getenv("DB_USER", "root")
+    db_password = os.getenv("DB_PW", "")
+    db_host = os.getenv("DB_HOST", "localhost")
+    db_port = os.getenv("DB_PORT")
+    db_name = os.getenv("DB_NAME", "sensor_data")
+    db_charset = os.getenv("CHARSET", "utf8mb4")
+
+    if not db_port:
+        if db_host.isdigit():
+            db_port = db_host
+            db_host = "localhost"
+        else:
+            db_port = "3306"
+
+    return (
+        f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+        f"?charset={db_charset}"
+    )
+
+
+def create_sensor_engine(database_url: str | None = None):
+    from sqlalchemy import create_engine
+
+    return create_engine(database_url or sensor_database_url(), pool_pre_ping=True, pool_recycle=3600)
+
+
+def rows_to_array(rows, n_columns: int = len(SENSOR_COLUMNS)):
+    """Convert fetched ``(id, *values)`` rows to ``(ids, values)`` arrays.
+
+    Numeric columns arrive as ``Decimal`` and NULLs as ``None``; both map
+    straight onto a float64 array (``None`` becomes NaN).
+    """
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, n_columns))
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    values = np.array([row[1:] for row in rows], dtype=float)
+    return ids, values
+
+
+def fill_gaps(values, carry=None):
+    """Fill NaN cells of ``values`` like ``ffill()`` then ``bfill()`` per column.
+
+    ``carry`` (the last filled row of the previous chunk) seeds the forward
+    fill so it continues across chunk boundaries, as :func:`AI.ai.iter_csv_chunks`
+    does for CSV input. Returns ``(filled, carry)`` for the next chunk; a
+    column with no value seen yet stays NaN.
+    """
+    missing = np.isnan(values)
+    if not missing.any():
+        return values, values[-1] if len(values) else carry
+    rows = np.arange(len(values))[:, None]
+    cols = np.arange(values.shape[1])
+    last = np.maximum.accumulate(np.where(missing, 0, rows), axis=0)
+    filled = values[last, cols]
+    if carry is not None:
+        filled = np.where(np.isnan(filled), carry, filled)
+    still = np.isnan(filled)
+    if still.any():
+        first = np.argmax(~still, axis=0)
+        filled = np.where(still, filled[first, cols], filled)
+    return filled, filled[-1]
+
+
+def fetch_sensor_batch(conn, after_id: int, limit: int, max_id: int | None = None):
+    """Fetch up to ``limit`` rows with ``id > after_id`` using the primary-key index."""
+    from sqlalchemy import text
+
+    columns = ", ".join(SENSOR_COLUMNS)
+    upper = " AND id <= :max_id" if max_id is not None else ""
+    query = text(
+        f"SELECT id, {columns} FROM {SENSOR_TABLE} "
+        f"WHERE id > :after_id{upper} ORDER BY id LIMIT :limit"
+    )
+    params = {"after_id": after_id, "limit": limit}
+    if max_id is not None:
+        params["max_id"] = max_id
+    return rows_to_array(conn.execute(query, params).fetchall())
+
+
+def iter_sensor_chunks(chunk_size: int = 50_000, engine=None, after_id: int = 0):
+    """Yield float arrays of ``chunk_size`` rows from the sensor table in id order.
+
+    The scan stops at the highest id present when it starts, so rows inserted
+    while training runs are left for the next run. NULL cells are filled
+    with :func:`fill_gaps`, carrying the last value across chunks.
+    """
+    from sqlalchemy import text
+
+    engine = engine or create_sensor_engine()
+    with engine.connect() as conn:
+        max_id = conn.execute(text(f"SELECT MAX(id) FROM {SENSOR_TABLE}")).scalar()
+        if max_id is None:
+            return
+        carry = None
+        while True:
+            ids, values = fetch_sensor_batch(conn, after_id, chunk_size, max_id=max_id)
+            if len(ids) == 0:
+                return
+            after_id = int(ids[-1])
+            values, carry = fill_gaps(values, carry)
+            yield values
+
+
+def fetch_new_sensor_rows(conn, after_id: int, limit: int):
+    """Fetch up to ``limit`` rows after ``after_id`` for tailing.
+
+    Returns ``(ids, date_times, values)``, where ``values`` holds the sensor
+    columns as float64 in ``SENSOR_COLUMNS`` order. The ``id > :after_id``
+    keyset is a range seek on the primary key, so the cost does not grow
+    with the size of the table.
+    """
+    from sqlalchemy import text
+
+    query = text(
+        f"SELECT id, date_time, {', '.join(SENSOR_COLUMNS)} FROM {SENSOR_TABLE} "
+        "WHERE id > :after_id ORDER BY id LIMIT :limit"
+    )
+    rows = conn.execute(query, {"after_id": after_id, "limit": limit}).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), [], np.empty((0, len(SENSOR_COLUMNS)))
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    values = np.array([row[2:] for row in rows], dtype=float)
+    return ids, [row[1] for row in rows], values
+
+
+class SensorTail:
+    """Snapshot source that follows new rows of the sensor table.
+
+    Call it like the CSV readers (``get_snapshot()``): it returns the next
+    row as a float array, blocking until one is inserted. Rows are fetched
+    ``batch_size`` at a time with a keyset cursor on ``id``. When a poll
+    comes back empty the wait before the next poll doubles, from
+    ``min_interval`` up to ``max_interval``. It drops back to
+    ``min_interval`` as soon as rows arrive, and a full batch is followed
+    by the next one immediately, so a backlog drains at query speed.
+
+    The id and ``date_time`` of the last row handed out are written to
+    ``state_path`` at most every ``save_interval`` seconds, before each
+    poll and on :meth:`close`. A restarted tail resumes after that row.
+    Without saved state it starts after the newest row present, or at the
+    beginning of the table if ``from_start`` is set. A row counts as
+    processed once the next one is requested, so a crash re-scores at most
+    the row that was being scored.
+
+    Each poll takes a fresh pooled connection, so a long-lived transaction
+    never hides newly committed rows. :meth:`stop` (from any thread) or
+    ``idle_timeout`` seconds without new rows ends the stream with
+    ``StopIteration``, as the warn loop expects.
+
+    With several inserters, ids do not become visible in commit order: a
+    lower id can commit after a higher one was already fetched. Ids skipped
+    within the last ``lookback`` ids behind the cursor are kept as gaps and
+    re-polled until they show up (handed out then, out of id order) or fall
+    out of the window; gaps are saved with the cursor. Rolled-back inserts
+    leave gaps that simply age out, and with no gaps a poll is the plain
+    keyset seek. A late commit more than ``lookback`` ids behind is missed.
+    """
+
+    def __init__(
+        self,
+        engine=None,
+        state_path=None,
+        batch_size: int = 500,
+        min_interval: float = 0.05,
+        max_interval: float = 1.0,
+        save_interval: float = 1.0,
+        from_start: bool = False,
+        idle_timeout: float | None = None,
+        lookback: int = 256,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("need 0 < min_interval <= max_interval")
+        if lookback < 0:
+            raise ValueError("lookback must be non-negative")
+        self.engine = engine or create_sensor_engine()
+        self.state_path = Path(state_path) if state_path is not None else None
+        self.batch_size = batch_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.save_interval = save_interval
+        self.idle_timeout = idle_timeout
+        self.lookback = lookback
+        self.interval = min_interval
+        self.rows = 0
+        self.polls = 0
+        self.empty_polls = 0
+        self.late_rows = 0
+        self.last_date_time = None
+        self._stop = threading.Event()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._stamps = []
+        self._values = np.empty((0, len(SENSOR_COLUMNS)))
+        self._pos = 0
+        self._handed_out = None
+        self._gaps = set()
+        self._saved_at = time.monotonic()
+
+        state = self._load_state()
+        if state is not None:
+            self.last_id = int(state["id"])
+            self.last_date_time = state.get("date_time")
+            self._gaps = set(state.get("gaps", []))
+        elif from_start:
+            self.last_id = 0
+        else:
+            from sqlalchemy import text
+
+            with self.engine.connect() as conn:
+                self.last_id = int(conn.execute(text(f"SELECT MAX(id) FROM {SENSOR_TABLE}")).scalar() or 0)
+        self._fetched_id = self.last_id
+        self._dirty = state is None
+
+    def _load_state(self):
+        if self.state_path is None:
+            return None
+        try:
+            return json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return None
+
+    def _save_state(self):
+        if self.state_path is None or not self._dirty:
+            return
+        date_time = self.last_date_time
+        if hasattr(date_time, "isoformat"):
+            date_time = date_time.isoformat()
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        state = {"id": self.last_id, "date_time": date_time}
+        # Ids at or below the cursor that were never fetched, or were fetched late and not handed out yet.
+        pending = {int(i) for i in self._ids[self._pos:]}
+        gaps = sorted(i for i in self._gaps | pending if i <= self.last_id)
+        if gaps:
+            state["gaps"] = gaps
+        tmp_path.write_text(json.dumps(state) + "\n")
+        os.replace(tmp_path, self.state_path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _mark_processed(self):
+        if self._handed_out is None:
+            return
+        row_id, date_time = self._handed_out
+        if row_id > self.last_id:
+            self.last_id, self.last_date_time = row_id, date_time
+        self._handed_out = None
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self._save_state()
+
+    def poll(self) -> int:
+        """Fetch the next batch of unseen rows (new ones and filled gaps); return its size."""
+        fetched = self._fetched_id
+        after_id = min(self._gaps) - 1 if self._gaps else fetched
+        with self.engine.connect() as conn:
+            ids, stamps, values = fetch_new_sensor_rows(conn, after_id, self.batch_size + fetched - after_id)
+        self.polls += 1
+        late = np.isin(ids, list(self._gaps)) if self._gaps else np.zeros(len(ids), dtype=bool)
+        keep = late | (ids > fetched)
+        if keep.any():
+            new_ids = ids[ids > fetched]
+            self._gaps.difference_update(ids[late].tolist())
+            if len(new_ids):
+                self._fetched_id = int(new_ids[-1])
+                window = range(max(fetched, self._fetched_id - self.lookback) + 1, self._fetched_id)
+                self._gaps.update(set(window).difference(new_ids.tolist()))
+            self.late_rows += int(late.sum())
+        self._gaps = {i for i in self._gaps if i > self._fetched_id - self.lookback}
+        if not keep.any():
+            self.empty_polls += 1
+            self.interval = min(self.interval * 2, self.max_interval)
+            return 0
+        self.interval = self.min_interval
+        self._ids, self._values, self._pos = ids[keep], values[keep], 0
+        self._stamps = [stamp for stamp, kept in zip(stamps, keep) if kept]
+        return len(self._ids)
+
+    def __call__(self):
+        self._mark_processed()
+        idle_since = time.monotonic()
+        while self._pos >= len(self._ids):
+            if self._stop.is_set():
+                self.close()
+                raise StopIteration("Sensor tail stopped.")
+            self._save_state()
+            if self.poll():
+                break
+            if self.idle_timeout is not None and time.monotonic() - idle_since >= self.idle_timeout:
+                self.close()
+                raise StopIteration("No new sensor rows within idle_timeout.")
+            self._stop.wait(self.interval)
+
+        pos = self._pos
+        self._pos += 1
+        self.rows += 1
+        self._handed_out = (int(self._ids[pos]), self._stamps[pos])
+        return self._values[pos]
+
+    def stop(self):
+        """Make the blocked or next call raise ``StopIteration``."""
+        self._stop.set()
+
+    def close(self):
+        """Record the last handed-out row as processed and save the cursor."""
+        self._mark_processed()
+        self._save_state()
+
+    def stats(self) -> dict:
+        return {
+            "last_id": self.last_id,
+            "rows": self.rows,
+            "polls": self.polls,
+            "empty_polls": self.empty_polls,
+            "late_rows": self.late_rows,
+            "gaps": len(self._gaps),
+            "buffered": len(self._ids) - self._pos,
+            "interval_s": self.interval,
+        }
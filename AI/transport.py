@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""Non-blocking delivery of AI events to the backend.
+
+The scoring thread only calls :meth:`EventTransport.send`, which enqueues
+and returns. A sender thread drains the queue over one keep-alive
+``requests.Session``: events that arrive within ``batch_window`` seconds of
+each other go to ``/dashboard/events/batch`` in one request (or one by one
+to ``/dashboard/events`` on a backend without the batch route), and every
+created alert is then enqueued on ``/mcp/enqueue``. With ``packed`` the
+dashboard events go to ``/dashboard/events/packed`` as one packed frame
+(AI/wire.py) instead of JSON.
+
+With an :class:`~AI.outbox.Outbox` every event is written to disk before
+delivery and every MCP job is written as soon as its alert exists, and the
+sender replays them in order. An unreachable backend (connection error,
+timeout, 5xx, 408/429) pauses replay with a capped exponential backoff and
+loses nothing. A record the backend rejects is retried ``max_attempts``
+times and then moved to the outbox's dead-letter file.
+"""
+
+import queue
+import threading
+import time
+from uuid import uuid4
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from AI.wire import CONTENT_TYPE, encode_events
+
+OK, REJECTED, UNAVAILABLE = "ok", "rejected", "unavailable"
+_TRANSIENT_STATUS = {408, 429}
+_IDLE = object()
+
+DASHBOARD_EVENTS_URL = "http://127.0.0.1:8000/dashboard/events"
+MCP_ENQUEUE_URL = "http://127.0.0.1:8000/mcp/enqueue"
+
+
+def mcp_job_payload(alert_id, event: dict, manual_path: str) -> dict:
+    """Build the ``/mcp/enqueue`` job for a dashboard alert created from ``event``.
+
+    Events from a multi-block model name their process group (A-E, as in the
+    prompt's group table), so the anomaly carries ``group`` and ``group_label``.
+    """
+    anomaly = {
+        "sensor_id": event.get("sensor_id", 0),
+        "type": event.get("event_type", "warning"),
+    }
+    block = event.get("block")
+    if block:
+        anomaly["group"] = block["group"]
+        anomaly["group_label"] = block["label"]
+    return {
+        "trace_id": f"ai-event-{alert_id}-{uuid4().hex}",
+        "message": str(event.get("alarm_code", "")),
+        "anomaly": anomaly,
+        "manual_reference": {"path": manual_path},
+        "metadata": {
+            "dashboard_id": alert_id,
+            "event_type": (event.get("event_type") or "warning").upper(),
+        },
+    }
+
+
+def wants_mcp_job(event: dict) -> bool:
+    """Closing episode summaries are recorded on the dashboard but need no new LLM job."""
+    return (event.get("episode") or {}).get("phase") != "close"
+
+
+class EventTransport:
+    """Queue events for a background sender with pooled HTTP connections.
+
+    ``send`` never blocks: when ``max_pending`` events are already waiting
+    the new one is dropped and counted in :attr:`dropped`. :attr:`in_flight`
+    counts events accepted but not yet fully delivered (dashboard and MCP),
+    including records still waiting in the ``outbox``. ``manual_path`` is
+    attached to each MCP job; without it no MCP job is sent. Request and
+    frame-packing times are recorded in ``metrics`` (AI/metrics.py) if given.
+    """
+
+    def __init__(
+        self,
+        dashboard_url: str = DASHBOARD_EVENTS_URL,
+        mcp_url: str | None = MCP_ENQUEUE_URL,
+        manual_path: str | None = None,
+        batch_window: float = 0.05,
+        max_batch: int = 64,
+        max_pending: int = 10_000,
+        timeout: float = 5.0,
+        pool_size: int = 4,
+        session=None,
+        outbox=None,
+        max_attempts: int = 5,
+        retry_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        packed: bool = False,
+        metrics=None,
+    ):
+        self.dashboard_url = dashboard_url
+        self.batch_url = dashboard_url.rstrip("/") + "/batch"
+        self.packed_url = dashboard_url.rstrip("/") + "/packed"
+        self.packed = packed
+        self.metrics = metrics
+        self.mcp_url = mcp_url if manual_path else None
+        self.manual_path = manual_path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.outbox = outbox
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.retries = 0
+        self._batch_supported = True
+        self._attempts = {}
+        self._backoff = retry_backoff
+        self._retry_at = 0.0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self._thread = threading.Thread(target=self._run, name="event-transport", daemon=True)
+        self._thread.start()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight + (self.outbox.pending_count if self.outbox is not None else 0)
+
+    def send(self, event: dict) -> bool:
+        """Enqueue ``event``; return False if it was dropped because the queue is full."""
+        with self._idle:
+            self._in_flight += 1
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._done(1)
+            self.dropped += 1
+            if self.dropped == 1:
+                print("[Transport] Queue full, dropping events")
+            return False
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every accepted event has been delivered (or given up on)."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self.in_flight == 0, timeout)
+
+    def close(self, timeout: float | None = None) -> bool:
+        """Flush, then stop the sender; undelivered outbox records stay on disk."""
+        delivered = self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self.session.close()
+        if self.outbox is not None:
+            self.outbox.close()
+        return delivered
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+        }
+
+    def _done(self, count: int = 0):
+        with self._idle:
+            self._in_flight -= count
+            if self.in_flight == 0:
+                self._idle.notify_all()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                event = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                self._queue.put(None)
+                break
+            batch.append(event)
+        return batch
+
+    def _run(self):
+        while True:
+            wait = None
+            if self.outbox is not None and self.outbox.pending_count:
+                wait = max(0.0, self._retry_at - time.monotonic())
+            try:
+                first = self._queue.get(timeout=wait)
+            except queue.Empty:
+                first = _IDLE
+            if first is None:
+                return
+            batch = [] if first is _IDLE else self._collect(first)
+
+            if self.outbox is None:
+                try:
+                    self._deliver(batch)
+                finally:
+                    self._done(len(batch))
+                continue
+
+            if batch:
+                self.outbox.append_many(("event", event) for event in batch)
+                self._done(len(batch))
+            if time.monotonic() >= self._retry_at:
+                self._replay()
+                self._done()
+
+    def _post(self, url, body=None, frame=None):
+        """POST ``body`` as JSON (or ``frame`` as a packed frame) and classify the outcome.
+
+        Returns ``(OK, parsed response)``, ``(REJECTED, status)`` or
+        ``(UNAVAILABLE, status or None)``.
+        """
+        started = time.perf_counter()
+        try:
+            if frame is not None:
+                resp = self.session.post(
+                    url, data=frame, headers={"Content-Type": CONTENT_TYPE}, timeout=self.timeout
+                )
+            else:
+                resp = self.session.post(url, json=body, timeout=self.timeout)
+        except requests.RequestException as exc:
+            print(f"[Transport] {url} unreachable: {exc}")
+            return UNAVAILABLE, None
+        finally:
+            if self.metrics is not None:
+                stage = "mcp_post" if url in (self.mcp_url, MCP_ENQUEUE_URL) else "dashboard_post"
+                self.metrics.record(stage, time.perf_counter() - started)
+        if resp.status_code >= 500 or resp.status_code in _TRANSIENT_STATUS:
+            print(f"[Transport] {url} unavailable ({resp.status_code})")
+            return UNAVAILABLE, resp.status_code
+        if resp.status_code >= 400:
+            print(f"[Transport] {url} rejected request ({resp.status_code}): {resp.text}")
+            return REJECTED, resp.status_code
+        try:
+            return OK, resp.json()
+        except ValueError:
+            return OK, None
+
+    def _post_events(self, events):
+        """Return one ``(outcome, alert)`` per event, in order.
+
+        Packed transport sends them all as one frame. Otherwise several
+        events go to the batch route in one request. Without that route, or
+        when the request is rejected as a whole, they are posted one by one
+        as JSON, stopping at the first UNAVAILABLE.
+        """
+        self.batches += 1
+        started = time.perf_counter()
+        try:
+            frame = encode_events(events) if self.packed else None
+        except (KeyError, TypeError, ValueError) as exc:
+            print(f"[Transport] Cannot pack events, sending JSON: {exc}")
+            frame = None
+        if frame is not None and self.metrics is not None:
+            self.metrics.record("serialize", time.perf_counter() - started)
+        if frame is not None:
+            outcome, data = self._post(self.packed_url, frame=frame)
+            if outcome == OK and isinstance(data, list) and len(data) == len(events):
+                return [(OK, alert) for alert in data]
+            if outcome == UNAVAILABLE:
+                return [(UNAVAILABLE, None)] * len(events)
+            if data in (404, 405, 415):
+                self.packed = False
+                print("[Transport] Packed route unavailable, sending JSON")
+        if len(events) > 1 and self._batch_supported:
+            outcome, data = self._post(self.batch_url, events)
+            if outcome == OK and isinstance(data, list) and len(data) == len(events):
+                return [(OK, alert) for alert in data]
+            if outcome == UNAVAILABLE:
+                return [(UNAVAILABLE, None)] * len(events)
+            if data in (404, 405):
+                self._batch_supported = False
+                print("[Transport] Batch route unavailable, sending events one by one")
+
+        results = []
+        for event in events:
+            outcome, data = self._post(self.dashboard_url, event)
+            results.append((outcome, data))
+            if outcome == UNAVAILABLE:
+                results += [(UNAVAILABLE, None)] * (len(events) - len(results))
+                break
+        return results
+
+    @staticmethod
+    def _alert_id(alert):
+        return alert.get("id") if isinstance(alert, dict) else None
+
+    def _deliver(self, batch):
+        for event, (outcome, alert) in zip(batch, self._post_events(batch)):
+            if outcome != OK:
+                self.failed += 1
+                continue
+            self.sent += 1
+            alert_id = self._alert_id(alert)
+            if alert_id and self.mcp_url and wants_mcp_job(event):
+                self._post(self.mcp_url, mcp_job_payload(alert_id, event, self.manual_path))
+
+    def _replay(self):
+        """Deliver outbox records in order until it is empty or the backend is unavailable."""
+        while True:
+            records = self.outbox.pending(self.max_batch)
+            if not records:
+                self._backoff = self.retry_backoff
+                return
+            if not self._replay_records(records):
+                self.retries += 1
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+                return
+            self._backoff = self.retry_backoff
+
+    def _replay_records(self, records):
+        """Deliver the leading run of same-kind records; return False to back off."""
+        if records[0][1] == "mcp":
+            seq, kind, job = records[0]
+            outcome, _ = self._post(self.mcp_url or MCP_ENQUEUE_URL, job)
+            if outcome == OK:
+                self.outbox.ack(seq)
+                return True
+            return outcome == REJECTED and self._give_up(seq, kind, job, "mcp job rejected")
+
+        events = []
+        for record in records:
+            if record[1] != "event":
+                break
+            events.append(record)
+        jobs, acked = [], None
+        for (seq, kind, event), (outcome, alert) in zip(events, self._post_events([r[2] for r in events])):
+            if outcome == UNAVAILABLE:
+                break
+            if outcome == REJECTED and not self._give_up(seq, kind, event, "dashboard event rejected"):
+                break
+            if outcome == OK:
+                self.sent += 1
+                self._attempts.pop(seq, None)
+                alert_id = self._alert_id(alert)
+                if alert_id and self.mcp_url and wants_mcp_job(event):
+                    jobs.append(("mcp", mcp_job_payload(alert_id, event, self.manual_path)))
+            acked = seq
+        if jobs:
+            self.outbox.append_many(jobs)
+        if acked is not None:
+            self.outbox.ack(acked)
+        return acked == events[-1][0]
+
+    def _give_up(self, seq, kind, body, reason):
+        """Count a rejection; after ``max_attempts`` dead-letter the record and return True."""
+        attempts = self._attempts.get(seq, 0) + 1
+        if attempts < self.max_attempts:
+            self._attempts[seq] = attempts
+            return False
+        self._attempts.pop(seq, None)
+        self.failed += 1
+        self.outbox.dead_letter(seq, kind, body, f"{reason} after {attempts} attempts")
+        if kind == "mcp":
+            self.outbox.ack(seq)
+        return True
@@ -75,21 +75,26 @@ def update_dashboard_alert_handled(
     return DashboardAlertResponse.from_dashboard(alert)
 
 
-def create_dashboard_alert(
+def create_dashboard_alerts(
     db: Session,
-    payload: DashboardEventCreateDTO,
-) -> DashboardAlertResponse:
-    """Insert a new dashboard alert row from an AI event."""
-    alert = DashboardAlert(
-        sensor_id=payload.sensor_id,
-        type=payload.event_type,
-        message=payload.alarm_code,
-        timestamp=datetime.utcnow(),
-    )
-    db.add(alert)
+    payloads: list[DashboardEventCreateDTO],
+) -> list[DashboardAlertResponse]:
+    """Insert several AI events as dashboard alerts in one transaction."""
+    now = datetime.utcnow()
+    alerts = [
+        DashboardAlert(
+            sensor_id=payload.sensor_id,
+            type=payload.event_type,
+            message=payload.alarm_code,
+            timestamp=now,
+        )
+        for payload in payloads
+    ]
+    db.add_all(alerts)
     db.commit()
-    db.refresh(alert)
-    return DashboardAlertResponse.from_dashboard(alert)
+    for alert in alerts:
+        db.refresh(alert)
+    return [DashboardAlertResponse.from_dashboard(alert) for alert in alerts]
 
 
 def _resolve_occurred_at(alert: DashboardAlert) -> str:
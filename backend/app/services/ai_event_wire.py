@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import struct
+import sys
+from array import array
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+CONTENT_TYPE = "application/x-ai-event"
+MAGIC = b"AIEV"
+WIRE_VERSION = 1
+_HEADER = struct.Struct("<4sBBHII")
+_FLOAT_SIZE = 4
+
+
+class WireFormatError(ValueError):
+    """The request body is not a valid AI event frame."""
+
+
+class PackedEventMeta(BaseModel):
+    """Per-event fields of a packed frame. Sensor rows are indexes into the frame's row table."""
+
+    event_type: str
+    timestamp: float
+    risk: float
+    spe: float
+    top3_t2: List[Dict[str, Any]]
+    top3_spe: List[Dict[str, Any]]
+    alarm_code: str | int
+    source: str
+    history: List[int]
+    raw: int
+
+    model_config = ConfigDict(extra="allow")
+
+
+class PackedEvents:
+    """Decoded frame: validated event metadata plus a lazily decoded float32 row table."""
+
+    def __init__(self, events: List[PackedEventMeta], rows: memoryview, n_features: int):
+        self.events = events
+        self.n_features = n_features
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def row(self, index: int) -> List[float]:
+        start = index * self.n_features * _FLOAT_SIZE
+        values = array("f")
+        values.frombytes(self._rows[start : start + self.n_features * _FLOAT_SIZE])
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values.tolist()
+
+    def raw_data(self, position: int) -> List[float]:
+        return self.row(self.events[position].raw)
+
+    def history(self, position: int) -> List[List[float]]:
+        return [self.row(index) for index in self.events[position].history]
+
+
+def decode_event_frame(body: bytes) -> PackedEvents:
+    """Parse a packed frame; only the header and the small JSON part are parsed up front."""
+    if len(body) < _HEADER.size:
+        raise WireFormatError("Frame shorter than its header")
+    magic, version, _flags, n_features, n_rows, meta_len = _HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise WireFormatError("Not an AI event frame")
+    if version != WIRE_VERSION:
+        raise WireFormatError(f"Unsupported frame version {version}")
+    start = _HEADER.size + meta_len
+    if len(body) != start + n_rows * n_features * _FLOAT_SIZE:
+        raise WireFormatError("Frame length does not match its header")
+
+    try:
+        events = [PackedEventMeta.model_validate(item) for item in json.loads(body[_HEADER.size : start])]
+    except (ValueError, TypeError, ValidationError) as exc:
+        raise WireFormatError(f"Invalid event metadata: {exc}") from exc
+    if not events:
+        raise WireFormatError("Frame contains no events")
+    for event in events:
+        if any(not 0 <= index < n_rows for index in (*event.history, event.raw)):
+            raise WireFormatError("Row reference outside the frame's row table")
+
+    return PackedEvents(events, memoryview(body)[start:], n_features)
@@ -5,7 +5,7 @@ from pathlib import Path
 from uuid import uuid4
 from typing import Any, Dict, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
@@ -17,10 +17,11 @@ from app.DB.use_dashboard import (
     DashboardAlertResponse,
     DashboardEventCreateDTO,
     fetch_dashboard_alerts,
-    create_dashboard_alert,
+    create_dashboard_alerts,
     update_dashboard_alert_handled,
 )
 from app.logging_config import get_logger
+from app.services.ai_event_wire import CONTENT_TYPE, PackedEvents, WireFormatError, decode_event_frame
 from app.services.mcp_service import MCPQueueError, MCPService, get_mcp_service
 
 logger = get_logger(__name__)
@@ -173,21 +174,66 @@ class AIEventPayload(BaseModel):
     source: str
 
 
-@router.post("/events", response_model=DashboardAlertResponse, status_code=status.HTTP_201_CREATED)
-def ingest_ai_event(payload: AIEventPayload, db: Session = Depends(dashboard_db)):
-    """Accept AI sensor events and persist them as dashboard alerts."""
+def _store_events(db: Session, events) -> List[DashboardAlertResponse]:
+    """Persist AI events (anything with ``event_type``/``alarm_code``) as dashboard alerts in one transaction."""
     sensor_id = 1  # 실제 sensor_id 가 아직 AI 이벤트에 포함되지 않으므로, DB FK 제약을 만족시키기 위해 sensor 테이블에 존재하는 기본 ID(예: 1번 센서)를 임시로 사용합니다. 추후 이벤트에서 실제 sensor_id 를 전달하면 이 값을 교체하세요.
     try:
-        create_payload = DashboardEventCreateDTO(
-            event_type=payload.event_type,
-            alarm_code=str(payload.alarm_code),
-            sensor_id=sensor_id,
-        )
-        return create_dashboard_alert(db, create_payload)
+        create_payloads = [
+            DashboardEventCreateDTO(
+                event_type=event.event_type,
+                alarm_code=str(event.alarm_code),
+                sensor_id=sensor_id,
+            )
+            for event in events
+        ]
+        return create_dashboard_alerts(db, create_payloads)
     except SQLAlchemyError as exc:
         db.rollback()
-        logger.exception("Failed to insert AI event into dashboard table")
+        logger.exception("Failed to insert AI events into dashboard table")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to store event: {exc.__class__.__name__}",
         ) from exc
+
+
+@router.post("/events", response_model=DashboardAlertResponse, status_code=status.HTTP_201_CREATED)
+def ingest_ai_event(payload: AIEventPayload, db: Session = Depends(dashboard_db)):
+    """Accept AI sensor events and persist them as dashboard alerts."""
+    return _store_events(db, [payload])[0]
+
+
+@router.post(
+    "/events/batch",
+    response_model=List[DashboardAlertResponse],
+    status_code=status.HTTP_201_CREATED,
+)
+def ingest_ai_events(payloads: List[AIEventPayload], db: Session = Depends(dashboard_db)):
+    """Accept a batch of AI events; responses are returned in request order."""
+    return _store_events(db, payloads)
+
+
+async def packed_event_frame(request: Request) -> PackedEvents:
+    """Read and decode an ``application/x-ai-event`` body (docs/specs/ai_event_wire.md)."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != CONTENT_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Expected {CONTENT_TYPE}",
+        )
+    try:
+        return decode_event_frame(await request.body())
+    except WireFormatError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+
+@router.post(
+    "/events/packed",
+    response_model=List[DashboardAlertResponse],
+    status_code=status.HTTP_201_CREATED,
+)
+def ingest_packed_ai_events(
+    frame: PackedEvents = Depends(packed_event_frame),
+    db: Session = Depends(dashboard_db),
+):
+    """Accept AI events in the packed wire format; sensor rows are not parsed here."""
+    return _store_events(db, frame.events)
@@ -1,7 +1,13 @@
+import json
+import pickle
 import sys
+import threading
+import time
+from collections import deque
 from pathlib import Path
 import types
 
+import numpy as np
 import pytest
 
 ROOT_DIR = Path(__file__).resolve().parents[2]
@@ -18,6 +24,50 @@ sys.modules.setdefault("sklearn.decomposition", sklearn_decomp)
 sys.modules.setdefault("sklearn.preprocessing", sklearn_preproc)
 
 from AI import ai  # noqa: E402
+from AI import backtest  # noqa: E402
+from AI import episodes  # noqa: E402
+from AI import frame_ring  # noqa: E402
+from AI import history  # noqa: E402
+from AI import metrics  # noqa: E402
+from AI import host  # noqa: E402
+from AI import model_registry  # noqa: E402
+from AI import model_selection  # noqa: E402
+from AI import multiblock  # noqa: E402
+from AI import outbox  # noqa: E402
+from AI import runtime  # noqa: E402
+from AI import scoring  # noqa: E402
+from AI import sensor_db  # noqa: E402
+from AI import transport  # noqa: E402
+from AI import wire  # noqa: E402
+from AI.benchmarks import engine, startup, synthetic  # noqa: E402
+
+
+class FakePCA:
+    """Minimal stand-in for a fitted sklearn PCA (sklearn is stubbed above)."""
+
+    def __init__(self, n_features: int = 6, n_components: int = 3, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        q, _ = np.linalg.qr(rng.normal(size=(n_features, n_features)))
+        self.components_ = q[:, :n_components].T
+        self.mean_ = rng.normal(scale=0.1, size=n_features)
+        self.explained_variance_ = np.sort(rng.uniform(0.5, 3.0, size=n_components))[::-1]
+        self.n_components_ = n_components
+
+    def transform(self, x):
+        return (x - self.mean_) @ self.components_.T
+
+    def inverse_transform(self, t):
+        return t @ self.components_ + self.mean_
+
+
+class FakeScaler:
+    def __init__(self, n_features: int = 6, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.mean_ = rng.normal(loc=50.0, scale=10.0, size=n_features)
+        self.scale_ = rng.uniform(0.5, 5.0, size=n_features)
+
+    def transform(self, x):
+        return (x - self.mean_) / self.scale_
 
 
 class DummyResponse:
@@ -60,3 +110,1158 @@ def test_ai_pipeline_enqueues_mcp(monkeypatch):
     assert captured[0][0].endswith("/dashboard/events")
     assert captured[1][0].endswith("/mcp/enqueue")
     assert captured[1][1]["metadata"]["dashboard_id"] == 42
+
+
+def test_score_batch_matches_per_row_scoring():
+    pca = FakePCA()
+    x = np.random.default_rng(1).normal(size=(20, 6))
+
+    scores = ai.score_batch(pca, x)
+
+    for i in range(len(x)):
+        row = x[i : i + 1]
+        assert scores["t2"][i] == pytest.approx(ai.compute_risk_pca(pca, row))
+        assert scores["spe"][i] == pytest.approx(ai.compute_spe(pca, row))
+        np.testing.assert_allclose(scores["t2_contrib"][i], ai.get_feature_contributions(pca, row))
+        np.testing.assert_allclose(scores["spe_contrib"][i], ai.get_spe_contributions(pca, row))
+
+
+def test_fused_scorer_matches_sklearn_style_path():
+    pca, scaler = FakePCA(), FakeScaler()
+    scorer = ai.FusedScorer(scaler, pca)
+    raw = np.random.default_rng(2).normal(loc=50.0, scale=10.0, size=(10, 6))
+
+    for snap in raw:
+        scaled = scaler.transform(snap.reshape(1, -1))
+        analysis = scorer.analyze(snap)
+        assert analysis["risk"] == pytest.approx(ai.compute_risk_pca(pca, scaled))
+        assert analysis["spe"] == pytest.approx(ai.compute_spe(pca, scaled))
+        assert [d["sensor"] for d in analysis["top3_t2"]] == [
+            d["sensor"] for d in ai.get_top3_features_with_scores(pca, scaled)
+        ]
+        assert [d["sensor"] for d in analysis["top3_spe"]] == [
+            d["sensor"] for d in ai.get_top3_spe_features(pca, scaled)
+        ]
+
+
+def test_float32_blockwise_scoring_matches_float64(tmp_path):
+    pca, scaler = FakePCA(), FakeScaler()
+    raw = np.random.default_rng(21).normal(loc=50.0, scale=10.0, size=(37, 6))
+    reference = ai.score_batch(pca, raw, scaler=scaler)
+
+    blockwise = ai.score_batch(pca, raw, scaler=scaler, block_rows=8)
+    for key, values in reference.items():
+        np.testing.assert_allclose(blockwise[key], values, rtol=1e-12, atol=1e-12)
+
+    single = ai.score_batch(pca, raw.astype(np.float32), scaler=scaler, dtype=np.float32, block_rows=8)
+    for key, values in reference.items():
+        assert single[key].dtype == np.float32
+        np.testing.assert_allclose(single[key], values, rtol=scoring.FLOAT32_RTOL, atol=scoring.FLOAT32_ATOL)
+
+    path = ai.export_model_bundle(tmp_path / "model.bundle", scaler, pca, 12.5, 3.25, dtype=np.float32)
+    bundle = ai.load_model_bundle(path)
+    assert bundle.metadata["scoring_dtype"] == "float32"
+    scorer = ai.FusedScorer.from_bundle(bundle)
+    assert scorer.dtype == np.float32
+    result = scorer.score(raw[0])
+    assert result.t2 == pytest.approx(reference["t2"][0], rel=scoring.FLOAT32_RTOL)
+    assert result.spe == pytest.approx(reference["spe"][0], rel=scoring.FLOAT32_RTOL)
+
+
+def test_analytical_limits_match_chi_square_references():
+    stats = pytest.importorskip("scipy.stats")
+
+    # Equal residual eigenvalues make SPE / lambda exactly chi-square(m).
+    spe_limit = ai.spe_control_limit(np.full(10, 0.5), confidence=0.99)
+    assert spe_limit == pytest.approx(0.5 * stats.chi2.ppf(0.99, 10), rel=0.02)
+
+    # One dominant eigenvalue over a flat tail gives h0 <= 0, where Jackson–Mudholkar is undefined;
+    # every caller (including the numpy-only adaptive refresh) falls back to Box's g·chi-square(h).
+    flat = np.r_[1.0, np.full(30, 0.1)]
+    theta1, theta2 = flat.sum(), (flat**2).sum()
+    box = theta2 / theta1 * stats.chi2.ppf(0.99, theta1**2 / theta2)
+    assert ai._jackson_mudholkar(flat, stats.norm.ppf(0.99)) == pytest.approx(box, rel=0.01)
+    assert ai.spe_control_limit(flat, confidence=0.99) == pytest.approx(box, rel=0.01)
+
+    # The F-based T² limit converges to chi-square(k) for large samples.
+    t2_limit = ai.t2_control_limit(5, n_samples=1_000_000, confidence=0.95)
+    assert t2_limit == pytest.approx(stats.chi2.ppf(0.95, 5), rel=1e-3)
+    assert ai.t2_control_limit(5, n_samples=50) > t2_limit
+
+
+def test_running_covariance_matches_full_batch():
+    data = np.random.default_rng(3).normal(loc=5.0, size=(1000, 4)) @ np.diag([1.0, 2.0, 0.5, 3.0])
+    stats = ai.RunningCovariance(4)
+    for start in range(0, len(data), 128):
+        stats.update(data[start : start + 128])
+
+    assert stats.n == len(data)
+    np.testing.assert_allclose(stats.mean, data.mean(axis=0))
+    np.testing.assert_allclose(stats.covariance(), np.cov(data, rowvar=False))
+    np.testing.assert_allclose(stats.variance(), data.var(axis=0))
+
+
+def test_iter_sensor_chunks_pages_by_id(tmp_path):
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'sensor.db'}")
+    columns = ", ".join(f"{name} NUMERIC" for name in sensor_db.SENSOR_COLUMNS)
+    placeholders = ", ".join(f":{name}" for name in sensor_db.SENSOR_COLUMNS)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(f"CREATE TABLE sensor (id INTEGER PRIMARY KEY, {columns})"))
+        for row in range(7):
+            values = {name: row + i / 100 for i, name in enumerate(sensor_db.SENSOR_COLUMNS)}
+            conn.execute(
+                sqlalchemy.text(f"INSERT INTO sensor ({', '.join(values)}) VALUES ({placeholders})"),
+                values,
+            )
+
+    chunks = list(sensor_db.iter_sensor_chunks(chunk_size=3, engine=engine))
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    stacked = np.vstack(chunks)
+    assert stacked.shape == (7, 52)
+    assert stacked[6, 0] == pytest.approx(6.0)
+    assert stacked[0, 51] == pytest.approx(0.51)
+
+
+def test_db_training_fills_null_sensor_cells(tmp_path, monkeypatch):
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    db_path = tmp_path / "sensor.db"
+    engine = sqlalchemy.create_engine(f"sqlite:///{db_path}")
+    columns = ", ".join(f"{name} NUMERIC" for name in sensor_db.SENSOR_COLUMNS)
+    placeholders = ", ".join(f":{name}" for name in sensor_db.SENSOR_COLUMNS)
+    data = synthetic.generate(400, seed=0)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(f"CREATE TABLE sensor (id INTEGER PRIMARY KEY, {columns})"))
+        for i, row in enumerate(data):
+            values = dict(zip(sensor_db.SENSOR_COLUMNS, row.tolist()))
+            if i in (0, 150, 151, 300):
+                values["XMEAS_1"] = None  # a NULL at the very start and one across a chunk boundary
+            conn.execute(
+                sqlalchemy.text(f"INSERT INTO sensor ({', '.join(values)}) VALUES ({placeholders})"),
+                values,
+            )
+
+    ids, values = sensor_db.rows_to_array([(1, None, 2.0), (2, 3.0, None), (3, None, None)], n_columns=2)
+    assert np.isnan(values).sum() == 4
+    filled, carry = sensor_db.fill_gaps(values)
+    np.testing.assert_array_equal(filled, [[3.0, 2.0], [3.0, 2.0], [3.0, 2.0]])
+    filled, _ = sensor_db.fill_gaps(np.array([[np.nan, 5.0]]), carry)
+    np.testing.assert_array_equal(filled, [[3.0, 5.0]])
+
+    chunks = list(sensor_db.iter_sensor_chunks(chunk_size=151, engine=engine))
+    stacked = np.vstack(chunks)
+    assert np.isfinite(stacked).all()
+    assert stacked[0, 0] == pytest.approx(data[1, 0]) and stacked[151, 0] == pytest.approx(data[149, 0])
+
+    # The same moment accumulation train_models_streaming runs on DB chunks (sklearn is stubbed here).
+    stats = ai.RunningCovariance(52)
+    for chunk in chunks:
+        stats.update(chunk)
+    assert np.isfinite(stats.mean).all() and np.isfinite(stats.covariance()).all()
+    model = multiblock.fit_multiblock(stats)
+    assert np.isfinite(model.components).all() and np.isfinite(model.block_limits).all()
+
+    # A column that is NULL throughout cannot be filled; training stops instead of fitting NaN.
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("UPDATE sensor SET XMV_11 = NULL"))
+    monkeypatch.setenv("SENSOR_DB_URL", f"sqlite:///{db_path}")
+    with pytest.raises(ValueError, match="no finite values"):
+        ai.train_models_streaming(chunk_size=151, from_db=True, out_dir=tmp_path)
+
+
+def test_sensor_tail_follows_inserts_and_resumes(tmp_path):
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'sensor.db'}")
+    columns = ", ".join(f"{name} NUMERIC" for name in sensor_db.SENSOR_COLUMNS)
+    insert = sqlalchemy.text(
+        f"INSERT INTO sensor (date_time, {', '.join(sensor_db.SENSOR_COLUMNS)}) "
+        f"VALUES (:date_time, {', '.join(':' + name for name in sensor_db.SENSOR_COLUMNS)})"
+    )
+
+    def add_rows(start, count):
+        with engine.begin() as conn:
+            for row in range(start, start + count):
+                values = {name: row + i / 100 for i, name in enumerate(sensor_db.SENSOR_COLUMNS)}
+                conn.execute(insert, {"date_time": f"2025-01-01 00:00:{row:02d}", **values})
+
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(f"CREATE TABLE sensor (id INTEGER PRIMARY KEY, date_time TEXT, {columns})"))
+    add_rows(0, 5)
+    state_path = tmp_path / "cursor.json"
+
+    latest = sensor_db.SensorTail(engine, state_path=tmp_path / "other.json", idle_timeout=0.0)
+    assert latest.last_id == 5
+    with pytest.raises(StopIteration):
+        latest()
+
+    tail = sensor_db.SensorTail(
+        engine, state_path=state_path, batch_size=2, min_interval=0.001, max_interval=0.004, from_start=True
+    )
+    first = [tail()[0] for _ in range(3)]
+    assert first == pytest.approx([0.0, 1.0, 2.0])
+    assert tail.last_id == 2 and tail.stats()["buffered"] == 1
+    tail.close()
+    assert json.loads(state_path.read_text()) == {"id": 3, "date_time": "2025-01-01 00:00:02"}
+
+    add_rows(5, 2)
+    resumed = sensor_db.SensorTail(engine, state_path=state_path, batch_size=2, min_interval=0.001, idle_timeout=0.05)
+    snaps = []
+    with pytest.raises(StopIteration):
+        while True:
+            snaps.append(resumed())
+    assert [snap[0] for snap in snaps] == pytest.approx([3.0, 4.0, 5.0, 6.0])
+    assert snaps[-1][51] == pytest.approx(6.51)
+    assert json.loads(state_path.read_text())["id"] == 7
+    stats = resumed.stats()
+    assert stats["rows"] == 4 and stats["empty_polls"] >= 1 and stats["interval_s"] > 0.001
+
+
+def test_sensor_tail_picks_up_ids_that_commit_out_of_order(tmp_path):
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'sensor.db'}")
+    columns = ", ".join(f"{name} NUMERIC" for name in sensor_db.SENSOR_COLUMNS)
+    insert = sqlalchemy.text(
+        f"INSERT INTO sensor (id, date_time, {', '.join(sensor_db.SENSOR_COLUMNS)}) "
+        f"VALUES (:id, :date_time, {', '.join(':' + name for name in sensor_db.SENSOR_COLUMNS)})"
+    )
+
+    def add_ids(*ids):
+        with engine.begin() as conn:
+            for row in ids:
+                values = {name: float(row) for name in sensor_db.SENSOR_COLUMNS}
+                conn.execute(insert, {"id": row, "date_time": f"2025-01-01 00:00:{row:02d}", **values})
+
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(f"CREATE TABLE sensor (id INTEGER PRIMARY KEY, date_time TEXT, {columns})"))
+    state_path = tmp_path / "cursor.json"
+
+    # Two writers took ids 2 and 3; 3 commits first and is read before 2 is visible.
+    add_ids(1, 3)
+    tail = sensor_db.SensorTail(engine, state_path=state_path, min_interval=0.001, from_start=True, lookback=4)
+    assert [tail()[0] for _ in range(2)] == [1.0, 3.0]
+    add_ids(2, 4)
+    assert [tail()[0] for _ in range(2)] == [2.0, 4.0]
+    assert tail.stats()["late_rows"] == 1 and tail.stats()["gaps"] == 0
+
+    # Gaps that are still open when the tail stops survive a restart; one outside the window is dropped.
+    add_ids(6, 7, 12)
+    assert [tail()[0] for _ in range(3)] == [6.0, 7.0, 12.0]
+    tail.close()
+    assert json.loads(state_path.read_text())["gaps"] == [9, 10, 11]
+    add_ids(5, 10)
+    resumed = sensor_db.SensorTail(engine, state_path=state_path, min_interval=0.001, idle_timeout=0.05, lookback=4)
+    snaps = []
+    with pytest.raises(StopIteration):
+        while True:
+            snaps.append(resumed())
+    assert [snap[0] for snap in snaps] == [10.0]
+    assert json.loads(state_path.read_text()) == {
+        "id": 12, "date_time": "2025-01-01 00:00:12", "gaps": [9, 11]
+    }
+
+
+def test_adaptive_model_refreshes_from_normal_samples():
+    pytest.importorskip("scipy")
+    rng = np.random.default_rng(4)
+    loadings = rng.normal(size=(2, 6))
+    data = rng.normal(size=(3000, 2)) @ loadings + 0.2 * rng.normal(size=(3000, 6)) + 10.0
+
+    model = ai.AdaptivePCAModel(
+        FakeScaler(), FakePCA(), 1.0, 1.0, forgetting=0.999, refresh_every=500
+    )
+    initial_state = model.state
+    for snap in data:
+        model.observe(snap)
+
+    assert model.state is not initial_state
+    assert model.refreshes == 5
+    scorer, t2_limit, spe_limit = model.state
+    np.testing.assert_allclose(scorer.offset, data[-1000:].mean(axis=0), atol=0.2)
+    t2 = np.array([scorer.score(snap).t2 for snap in data[-1000:]])
+    assert 0.01 < np.mean(t2 > t2_limit) < 0.10
+    assert spe_limit > 0
+
+
+def test_chunked_snapshot_reader_projects_sensor_columns(tmp_path):
+    rng = np.random.default_rng(5)
+    values = rng.normal(size=(9, len(ai.SENSOR_COLUMNS)))
+    shuffled = list(reversed(ai.SENSOR_COLUMNS))
+    header = ",".join(["timestamp", "Fault Number", *shuffled])
+    lines = [header]
+    for i, row in enumerate(values):
+        by_name = dict(zip(ai.SENSOR_COLUMNS, row))
+        lines.append(",".join([f"t{i}", "0", *(repr(float(by_name[col])) for col in shuffled)]))
+    csv_path = tmp_path / "replay.csv"
+    csv_path.write_text("\n".join(lines) + "\n")
+
+    reader = ai.make_chunked_snapshot_reader(ai.prefetch(ai.iter_sensor_csv(str(csv_path), chunk_size=4)))
+    rows = [reader() for _ in range(len(values))]
+    with pytest.raises(StopIteration):
+        reader()
+
+    np.testing.assert_allclose(np.array(rows), values, rtol=1e-12)
+
+    empty = ai.make_chunked_snapshot_reader(iter([]))
+    with pytest.raises(RuntimeError):
+        empty()
+
+
+def test_warn_loop_backtest_clock_runs_unthrottled(monkeypatch):
+    posted = []
+    monkeypatch.setattr(ai, "send_event_to_dashboard", lambda event: posted.append(event) or None)
+    data = np.random.default_rng(6).normal(loc=50.0, scale=10.0, size=(25, 6))
+    history = deque(maxlen=5)
+    log = ai.EventLog()
+    clock = ai.ReplayClock("backtest", interval=3.0)
+
+    report = ai.warn_loop(
+        ai.make_snapshot_reader(data), history, FakeScaler(), FakePCA(), log, 0.0, 0.0, clock=clock
+    )
+
+    assert report["snapshots"] == len(data)
+    assert report["elapsed_s"] < 3.0
+    assert sum(event["event_type"] == "WARN" for event in log.logs) == len(data)
+    assert len(posted) == len(log.logs)
+
+
+def test_replay_clock_modes():
+    assert ai.ReplayClock("accelerated", interval=3.0, speed=60).period == pytest.approx(0.05)
+    assert ai.ReplayClock("realtime", interval=3.0, speed=60).period == pytest.approx(3.0)
+    assert ai.ReplayClock.from_csv("test2.csv").interval == pytest.approx(180.0)
+    with pytest.raises(ValueError):
+        ai.ReplayClock("warp")
+
+
+def write_sensor_csv(path, values):
+    lines = [",".join(["", *ai.SENSOR_COLUMNS])]
+    lines += [",".join([f"t{i}", *(repr(float(v)) for v in row)]) for i, row in enumerate(values)]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_backtest_file_writes_columnar_scores(tmp_path):
+    n_features = len(ai.SENSOR_COLUMNS)
+    pca, scaler = FakePCA(n_features, 4), FakeScaler(n_features)
+    values = np.random.default_rng(7).normal(loc=50.0, scale=10.0, size=(30, n_features))
+    csv_path = write_sensor_csv(tmp_path / "fault01.csv", values)
+    expected = ai.score_batch(pca, values, scaler=scaler)
+    t2_limit = float(np.median(expected["t2"]))
+
+    result = backtest.backtest_file(csv_path, tmp_path, (ai.FusedScorer(scaler, pca), t2_limit, np.inf), chunk_size=8)
+
+    columns = np.load(result["output"])
+    np.testing.assert_allclose(columns["t2"], expected["t2"], rtol=1e-5)
+    np.testing.assert_array_equal(columns["t2_exceed"], expected["t2"] > t2_limit)
+    np.testing.assert_array_equal(columns["event_row"], np.flatnonzero(expected["t2"] > t2_limit))
+    first = columns["event_row"][0]
+    assert [d["sensor"] for d in ai.top_k_sensors(expected["t2_contrib"][first])] == list(
+        columns["event_top3_t2"][0]
+    )
+    assert result["rows"] == 30
+    assert result["first_event_row"] == first
+
+    # A limit just under a row's float64 T² that rounds to the same float32: the row is an event and flagged.
+    edge = np.nextafter(expected["t2"][3], -np.inf)
+    result = backtest.backtest_file(csv_path, tmp_path, (ai.FusedScorer(scaler, pca), float(edge), np.inf), chunk_size=8)
+    columns = np.load(result["output"])
+    assert 3 in columns["event_row"]
+    np.testing.assert_array_equal(np.flatnonzero(columns["t2_exceed"]), columns["event_row"])
+    assert result["t2_exceed_rate"] == result["event_rate"]
+
+    # Workers score from the numpy-only bundle; --float32 casts a float64 bundle's scoring arrays.
+    model_dir = tmp_path / "model"
+    model_dir.mkdir()
+    ai.export_model_bundle(model_dir / ai.MODEL_BUNDLE_NAME, scaler, pca, t2_limit, np.inf)
+    summary = backtest.run_backtest([csv_path], tmp_path / "out", model_dir=model_dir, workers=1, chunk_size=8)
+    columns = np.load(summary["files"][0]["output"])
+    np.testing.assert_allclose(columns["t2"], expected["t2"], rtol=1e-5)
+    np.testing.assert_array_equal(columns["t2_exceed"], expected["t2"] > t2_limit)
+    scorer, threshold_t2, _ = backtest.load_model(model_dir, np.float32)
+    assert scorer.dtype == np.float32 and threshold_t2 == t2_limit
+    summary = backtest.run_backtest(
+        [csv_path], tmp_path / "out32", model_dir=model_dir, workers=1, chunk_size=8, dtype=np.float32
+    )
+    np.testing.assert_allclose(np.load(summary["files"][0]["output"])["t2"], expected["t2"], rtol=1e-3)
+
+
+def test_model_selection_sweeps_from_one_decomposition(tmp_path, monkeypatch):
+    if sys.modules["sklearn.decomposition"] is sklearn_decomp:
+        monkeypatch.setattr(sklearn_decomp, "PCA", lambda n_components: types.SimpleNamespace())
+        monkeypatch.setattr(sklearn_preproc, "StandardScaler", types.SimpleNamespace)
+    rng = np.random.default_rng(21)
+    n_features = len(ai.SENSOR_COLUMNS)
+    loadings = rng.normal(size=(4, n_features))
+
+    def sample(n):
+        return rng.normal(size=(n, 4)) @ loadings + 0.3 * rng.normal(size=(n, n_features)) + 40.0
+
+    normal = write_sensor_csv(tmp_path / "normal.csv", sample(2000))
+    drifted = sample(200)
+    drifted[50:, 7] += 6.0
+    fault = write_sensor_csv(tmp_path / "fault01.csv", drifted)
+
+    report = model_selection.sweep(
+        normal, [fault], variances=(0.5, 0.9), limits=(("empirical", 0.95, 0.99),),
+        fault_start=50, max_false_alarm=0.1, workers=2, chunk_size=256,
+    )
+
+    decomposition = report["_decomposition"]
+    assert report["train_rows"] == 1400 and report["normal_rows"] == 600
+    for candidate in report["candidates"]:
+        k = candidate["n_components"]
+        pca = FakePCA(n_features, k)
+        pca.components_ = decomposition.components[:k]
+        pca.explained_variance_ = decomposition.eigvals[:k]
+        pca.mean_ = np.zeros(n_features)
+        scaler = types.SimpleNamespace(mean_=decomposition.mean, scale_=decomposition.scale)
+        expected = ai.score_batch(pca, drifted[50:], scaler=scaler, contributions=False)
+        t2, spe = decomposition.scores(drifted[50:], [k])
+        np.testing.assert_allclose(t2[:, 0], expected["t2"], rtol=1e-8)
+        np.testing.assert_allclose(spe[:, 0], expected["spe"], rtol=1e-6, atol=1e-9)
+        exceed = (expected["t2"] > candidate["threshold_t2"]) | (expected["spe"] > candidate["threshold_spe"])
+        assert candidate["detection"][str(fault)] == pytest.approx(exceed.mean())
+    assert report["chosen"]["detection_rate"] > 0.9 and report["within_budget"]
+
+    model_selection.write_chosen_bundle(report, tmp_path / "model.bundle")
+    bundle = ai.load_model_bundle(tmp_path / "model.bundle")
+    assert bundle.threshold_t2 == report["chosen"]["threshold_t2"]
+    assert bundle.pca.n_components_ == report["chosen"]["n_components"]
+
+
+def write_model_dir(path, pca, scaler, threshold_t2, threshold_spe):
+    """Persist fake artifacts as plain namespaces so spawned workers can unpickle them."""
+    path.mkdir()
+    with open(path / "scaler.pkl", "wb") as f:
+        pickle.dump(types.SimpleNamespace(mean_=scaler.mean_, scale_=scaler.scale_), f)
+    with open(path / "pca.pkl", "wb") as f:
+        pickle.dump(
+            types.SimpleNamespace(
+                components_=pca.components_, mean_=pca.mean_, explained_variance_=pca.explained_variance_
+            ),
+            f,
+        )
+    (path / "threshold.txt").write_text(str(threshold_t2))
+    (path / "threshold_spe.txt").write_text(str(threshold_spe))
+    return path
+
+
+def test_scoring_host_routes_lines_to_their_models(tmp_path):
+    pca, scaler = FakePCA(), FakeScaler()
+    line_dirs = {
+        "quiet": write_model_dir(tmp_path / "quiet", pca, scaler, np.inf, np.inf),
+        "noisy": write_model_dir(tmp_path / "noisy", pca, scaler, 0.0, 0.0),
+    }
+    events = []
+    snaps = np.random.default_rng(8).normal(loc=50.0, scale=10.0, size=(12, 6))
+
+    with host.ScoringHost(line_dirs, workers=2, batch_size=4, on_event=events.append) as scoring_host:
+        assert scoring_host.shards == 2
+        for i, snap in enumerate(snaps):
+            scoring_host.submit("quiet" if i % 2 else "noisy", snap, timestamp=float(i))
+        assert scoring_host.join(timeout=30)
+
+    assert scoring_host.scored == len(snaps)
+    assert {event["line_id"] for event in events} == {"noisy"}
+    assert sorted(event["timestamp"] for event in events) == [float(i) for i in range(0, 12, 2)]
+    assert len(events[-1]["history"]) == 5
+
+
+def test_frame_ring_hands_out_views_and_counts_overruns():
+    with frame_ring.FrameRing.create(capacity=8, n_values=3, max_readers=2) as ring:
+        remote = frame_ring.FrameRing.attach(ring.name)
+        fast, slow = remote.reader(0), remote.reader(1)
+        values = np.arange(30, dtype=float).reshape(10, 3)
+
+        ring.write_many(np.arange(6) % 2, np.arange(6.0), values[:6])
+        batch = fast.read()
+        np.testing.assert_array_equal(batch.values, values[:6])
+        np.testing.assert_array_equal(batch.line_codes, [0, 1, 0, 1, 0, 1])
+        assert np.shares_memory(batch.frames, remote._frames)
+        assert fast.release()
+        del batch
+
+        # The slow reader falls 12 frames behind an 8-frame ring and loses 5: frame 4 is the next
+        # one the writer claims, so only 5..11 are handed out.
+        ring.write_many(7, np.arange(6.0, 12.0), np.tile(values[6:], (2, 1))[:6])
+        assert slow.lag == 12
+        first = slow.read()
+        assert first.start == 5 and len(first) == 3
+        assert slow.release()
+        rest = slow.read()
+        assert rest.start == 8 and len(rest) == 4
+        np.testing.assert_array_equal(rest.timestamps, np.arange(8.0, 12.0))
+        assert slow.release()
+        del first, rest
+
+        stats = ring.stats()
+        assert stats["written"] == 12
+        assert stats["readers"][1] == {"read": 12, "lag": 0, "max_lag": 12, "overruns": 5, "torn": 0}
+        assert stats["readers"][0]["lag"] == 6 and stats["readers"][0]["overruns"] == 0
+
+        ring.close_writer()
+        batch = fast.wait()
+        assert (batch.start, len(batch)) == (6, 2)  # stops at the wrap
+        fast.release()
+        batch = fast.wait()
+        assert (batch.start, len(batch)) == (8, 4)
+        fast.release()
+        del batch
+        assert fast.wait() is None
+        remote.close()
+
+    with frame_ring.FrameRing.create(capacity=4, n_values=1) as ring:
+        reader = ring.reader(0)
+        ring.write_many(0, np.arange(3.0), np.zeros((3, 1)))
+        batch = reader.read()
+        # The writer claims slot 0 for frame 4 before it copies anything: the batch is already torn.
+        ring._header[frame_ring._CLAIM_SEQ] = 5
+        assert not reader.release(batch)
+        assert reader.stats()["torn"] == 1
+        del batch
+
+
+def test_scoring_host_reads_snapshots_from_a_shared_ring(tmp_path):
+    pca, scaler = FakePCA(), FakeScaler()
+    line_dirs = {
+        "quiet": write_model_dir(tmp_path / "quiet", pca, scaler, np.inf, np.inf),
+        "noisy": write_model_dir(tmp_path / "noisy", pca, scaler, 0.0, 0.0),
+    }
+    events = []
+    snaps = np.random.default_rng(8).normal(loc=50.0, scale=10.0, size=(40, 6))
+
+    with host.ScoringHost(
+        line_dirs, workers=2, on_event=events.append, ring_capacity=16, n_values=6, ring_overwrite=False
+    ) as scoring_host:
+        for i, snap in enumerate(snaps):
+            scoring_host.submit("quiet" if i % 2 else "noisy", snap, timestamp=float(i))
+        assert scoring_host.join(timeout=30)
+        stats = scoring_host.stats()
+
+    assert scoring_host.scored == len(snaps)
+    assert sorted(event["timestamp"] for event in events) == [float(i) for i in range(0, 40, 2)]
+    np.testing.assert_allclose(events[0]["raw_data"], snaps[0])
+    assert stats["ring"]["written"] == 40 and stats["torn_dropped"] == 0
+    assert all(r["lag"] == 0 and r["overruns"] == 0 for r in stats["ring"]["readers"].values())
+
+
+def test_scoring_host_raises_when_a_shard_fails_instead_of_hanging(tmp_path):
+    started = time.monotonic()
+    with pytest.raises(FileNotFoundError) as failure:
+        host.ScoringHost({"a": str(tmp_path / "missing")}, workers=1, poll_interval=0.1)
+    assert "Traceback" in str(failure.value.__cause__)
+    assert time.monotonic() - started < 30
+
+    pca, scaler = FakePCA(), FakeScaler()
+    line_dirs = {"a": write_model_dir(tmp_path / "a", pca, scaler, np.inf, np.inf)}
+    scoring_host = host.ScoringHost(
+        line_dirs, workers=1, ring_capacity=4, n_values=6, ring_overwrite=False, poll_interval=0.1
+    )
+    scoring_host._processes[0].kill()
+    # A non-overwriting ring stops waiting for the dead reader once it is detached.
+    with pytest.raises(RuntimeError, match="exited with code"):
+        for i in range(50):
+            scoring_host.submit("a", np.zeros(6), timestamp=float(i))
+        scoring_host.join(timeout=30)
+    scoring_host.close()
+    assert time.monotonic() - started < 60
+
+
+def test_model_bundle_round_trip_is_memory_mapped(tmp_path):
+    pca, scaler = FakePCA(), FakeScaler()
+    path = ai.export_model_bundle(tmp_path / "model.bundle", scaler, pca, 12.5, 3.25)
+
+    bundle = ai.load_model_bundle(path)
+    base = bundle.arrays["projector"]
+    while not isinstance(base, np.memmap) and getattr(base, "base", None) is not None:
+        base = base.base
+    assert isinstance(base, np.memmap)
+    assert not bundle.arrays["projector"].flags.writeable
+    assert (bundle.threshold_t2, bundle.threshold_spe) == (12.5, 3.25)
+    assert bundle.n_components == 3
+
+    snap = np.random.default_rng(9).normal(loc=50.0, scale=10.0, size=6)
+    assert ai.FusedScorer.from_bundle(bundle).analyze(snap) == ai.FusedScorer(scaler, pca).analyze(snap)
+
+    (tmp_path / "broken.bundle").write_bytes(b"not a bundle at all")
+    with pytest.raises(ValueError):
+        ai.load_model_bundle(tmp_path / "broken.bundle")
+
+
+def test_inference_path_skips_training_imports(tmp_path):
+    path = ai.export_model_bundle(tmp_path / "model.bundle", FakeScaler(), FakePCA(), 12.5, 3.25)
+
+    report = startup.measure_once("AI.ai", path)
+
+    assert report["heavy_modules"] == []
+    assert report["first_score_s"] > 0
+
+
+def test_registry_watcher_swaps_models_between_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai, "send_event_to_dashboard", lambda event: None)
+    pca, scaler = FakePCA(), FakeScaler()
+    registry = model_registry.ModelRegistry(tmp_path / "registry")
+    registry.publish(ai.export_model_bundle(tmp_path / "strict.bundle", scaler, pca, 0.0, 0.0), "v1")
+    registry.publish(ai.export_model_bundle(tmp_path / "lenient.bundle", scaler, pca, 1e9, 1e9), "v2", activate=False)
+    assert registry.versions() == ["v1", "v2"] and registry.active_version() == "v1"
+    watcher = model_registry.RegistryWatcher(registry)
+
+    data = np.random.default_rng(10).normal(loc=50.0, scale=10.0, size=(10, 6))
+    read_next = ai.make_snapshot_reader(data)
+    served = []
+
+    def get_snapshot():
+        if len(served) == 4:
+            registry.activate("v2")
+            assert watcher.check()
+        served.append(watcher.version)
+        return read_next()
+
+    log = ai.EventLog()
+    ai.warn_loop(
+        get_snapshot, deque(maxlen=5), scaler, pca, log, 0.0, 0.0,
+        clock=ai.ReplayClock("backtest"), watcher=watcher,
+    )
+
+    assert served[:4] == ["v1"] * 4 and set(served[4:]) == {"v2"}
+    assert sum(event["event_type"] == "WARN" for event in log.logs) == 4
+    assert watcher.swaps == 1
+
+    with open(registry.bundle_path("v1"), "r+b") as f:
+        f.seek(-1, 2)
+        f.write(b"\xff")
+    with pytest.raises(ValueError):
+        registry.activate("v1")
+    assert registry.active_version() == "v2"
+
+
+class FakeSession:
+    """Records posts; the dashboard answers slowly and can lack the batch route."""
+
+    def __init__(self, delay=0.0, batch_route=True):
+        self.delay = delay
+        self.batch_route = batch_route
+        self.posts = []
+        self.frames = []
+        self.next_id = 0
+
+    def post(self, url, json=None, data=None, headers=None, timeout=None):
+        time.sleep(self.delay)
+        self.posts.append((url, json))
+        if data is not None:
+            self.frames.append(data)
+            json = wire.decode_events(data)
+        if url.endswith(("/batch", "/packed")):
+            if not self.batch_route:
+                return types.SimpleNamespace(status_code=404, text="Not Found", json=lambda: None)
+            alerts = [self._alert() for _ in json]
+            return types.SimpleNamespace(status_code=201, text="", json=lambda: alerts)
+        if url.endswith("/enqueue"):
+            return types.SimpleNamespace(status_code=200, text="", json=lambda: {})
+        alert = self._alert()
+        return types.SimpleNamespace(status_code=201, text="", json=lambda: alert)
+
+    def _alert(self):
+        self.next_id += 1
+        return {"id": str(self.next_id)}
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("batch_route", [True, False])
+def test_event_transport_batches_without_blocking(batch_route):
+    session = FakeSession(delay=0.05, batch_route=batch_route)
+    sender = transport.EventTransport(
+        "http://backend/dashboard/events",
+        "http://backend/mcp/enqueue",
+        manual_path="manual.txt",
+        batch_window=0.2,
+        session=session,
+    )
+
+    started = time.perf_counter()
+    for i in range(5):
+        assert sender.send({"event_type": "WARN", "alarm_code": f"Warning-{i}"})
+    assert time.perf_counter() - started < 0.05
+    assert sender.in_flight == 5
+
+    assert sender.close(timeout=10)
+    assert sender.stats()["sent"] == 5 and sender.in_flight == 0
+    dashboard = [body for url, body in session.posts if "/dashboard/" in url]
+    jobs = [body for url, body in session.posts if url.endswith("/enqueue")]
+    if batch_route:
+        assert len(dashboard) == 1 and len(dashboard[0]) == 5
+    else:
+        assert [body["alarm_code"] for body in dashboard[1:]] == [f"Warning-{i}" for i in range(5)]
+    assert [job["metadata"]["dashboard_id"] for job in jobs] == [str(i) for i in range(1, 6)]
+    assert jobs[0]["manual_reference"] == {"path": "manual.txt"}
+
+
+def test_outbox_replays_in_order_compacts_and_recovers(tmp_path):
+    box = outbox.Outbox(tmp_path / "outbox", segment_bytes=256, fsync=False)
+    box.append_many(("event", {"n": i}) for i in range(40))
+    box.append_many(("event", {"n": i}) for i in range(40, 60))
+    assert box.pending_count == 60
+    segments = len(list((tmp_path / "outbox").glob("*.log")))
+    assert segments > 1
+
+    first = box.pending(25)
+    assert [body["n"] for _, _, body in first] == list(range(25))
+    box.ack(first[-1][0])
+    assert len(list((tmp_path / "outbox").glob("*.log"))) <= segments
+    box.close()
+
+    with open(sorted((tmp_path / "outbox").glob("*.log"))[-1], "ab") as f:
+        f.write(b'[61,"event",{"n":')
+    reopened = outbox.Outbox(tmp_path / "outbox", segment_bytes=256, fsync=False)
+    assert reopened.pending_count == 35
+    rest = reopened.pending(100)
+    assert [body["n"] for _, _, body in rest] == list(range(25, 60))
+    reopened.ack(rest[-1][0])
+    assert reopened.append("mcp", {"n": 60}) == 61
+    assert [body for _, _, body in reopened.pending(10)] == [{"n": 60}]
+
+
+class FlakySession(FakeSession):
+    """Unreachable for the first ``outage`` posts; rejects alarm code ``bad``."""
+
+    def __init__(self, outage):
+        super().__init__(batch_route=True)
+        self.outage = outage
+        self.calls = 0
+
+    def post(self, url, json=None, data=None, headers=None, timeout=None):
+        self.calls += 1
+        if self.calls <= self.outage:
+            raise transport.requests.ConnectionError("backend restarting")
+        if not url.endswith("/enqueue"):
+            bodies = json if url.endswith("/batch") else [json]
+            if any(body["alarm_code"] == "bad" for body in bodies):
+                return types.SimpleNamespace(status_code=422, text="invalid", json=lambda: None)
+        return super().post(url, json=json, timeout=timeout)
+
+
+def test_event_transport_outbox_survives_outage(tmp_path):
+    session = FlakySession(outage=3)
+    box = outbox.Outbox(tmp_path / "outbox", fsync=False)
+    sender = transport.EventTransport(
+        "http://backend/dashboard/events",
+        "http://backend/mcp/enqueue",
+        manual_path="manual.txt",
+        batch_window=0.01,
+        session=session,
+        outbox=box,
+        max_attempts=2,
+        retry_backoff=0.01,
+    )
+    codes = [f"Warning-{i}" for i in range(2000)]
+    codes[7] = "bad"
+    for code in codes:
+        assert sender.send({"event_type": "WARN", "alarm_code": code})
+
+    assert sender.flush(timeout=30)
+    sender.close()
+    delivered = []
+    for url, body in session.posts:
+        if url.endswith("/batch"):
+            delivered += [event["alarm_code"] for event in body]
+        elif url.endswith("/events"):
+            delivered.append(body["alarm_code"])
+    expected = [code for code in codes if code != "bad"]
+    assert [code for code in dict.fromkeys(delivered) if code != "bad"] == expected
+    jobs = [body for url, body in session.posts if url.endswith("/enqueue")]
+    assert len(jobs) == len(expected)
+    assert sender.stats()["failed"] == 1 and sender.stats()["retries"] >= 1
+    assert "bad" in (tmp_path / "outbox" / outbox.DEAD_LETTER_NAME).read_text()
+    assert outbox.Outbox(tmp_path / "outbox").pending_count == 0
+
+
+def test_packed_frames_share_rows_and_round_trip():
+    rows = np.random.default_rng(11).normal(loc=50.0, scale=10.0, size=(8, 52))
+    events = [
+        {
+            "event_type": "WARN",
+            "timestamp": float(i),
+            "risk": 20.0 + i,
+            "spe": 5.0,
+            "top3_t2": [{"sensor": 1, "score": 0.5}],
+            "top3_spe": [{"sensor": 2, "score": 0.4}],
+            "history": rows[i - 4 : i + 1].tolist(),
+            "alarm_code": "Warning",
+            "raw_data": rows[i].tolist(),
+            "source": "sensor",
+            "line_id": "line-a",
+        }
+        for i in range(4, 8)
+    ]
+
+    frame = wire.encode_events(events)
+    assert len(frame) < 16 + 8 * 52 * 4 + 1024
+    decoded = wire.decode_events(frame)
+    for original, restored in zip(events, decoded):
+        assert restored["line_id"] == "line-a" and restored["risk"] == original["risk"]
+        np.testing.assert_allclose(restored["history"], original["history"], rtol=1e-6)
+        np.testing.assert_allclose(restored["raw_data"], original["raw_data"], rtol=1e-6)
+    with pytest.raises(ValueError):
+        wire.decode_events(frame[:-1])
+
+
+def test_event_transport_sends_packed_frames():
+    session = FakeSession()
+    sender = transport.EventTransport("http://backend/dashboard/events", batch_window=0.2, session=session, packed=True)
+    events = [
+        {"event_type": "WARN", "alarm_code": f"Warning-{i}", "history": [[float(i)] * 3], "raw_data": [float(i)] * 3}
+        for i in range(3)
+    ]
+    for event in events:
+        sender.send(event)
+    assert sender.close(timeout=10)
+
+    (url, _), = session.posts
+    assert url.endswith("/packed")
+    assert [event["alarm_code"] for event in wire.decode_events(session.frames[0])] == [
+        "Warning-0", "Warning-1", "Warning-2"
+    ]
+
+
+def test_episode_tracker_coalesces_sustained_excursion(monkeypatch):
+    posted = []
+    monkeypatch.setattr(ai, "send_event_to_dashboard", lambda event: posted.append(event) or None)
+    pca, scaler = FakePCA(), FakeScaler()
+    rng = np.random.default_rng(12)
+    normal = scaler.mean_ + rng.normal(scale=0.1, size=(40, 6)) * scaler.scale_
+    fault = normal[:30] + 8.0 * scaler.scale_ * np.eye(6)[2]
+    data = np.vstack([normal[:10], fault, normal[10:]])
+    baseline = ai.score_batch(pca, normal, scaler=scaler, contributions=False)
+    t2_limit, spe_limit = 3 * baseline["t2"].max(), 3 * baseline["spe"].max()
+
+    tracker = episodes.EpisodeTracker(dwell=3)
+    log = ai.EventLog()
+    ai.warn_loop(
+        ai.make_snapshot_reader(data), deque(maxlen=5), scaler, pca, log, t2_limit, spe_limit,
+        clock=ai.ReplayClock("backtest"), episodes=tracker,
+    )
+
+    warns = [event for event in log.logs if event["event_type"] == "WARN"]
+    assert [event["episode"]["phase"] for event in warns] == ["open", "close"]
+    opened, closed = warns
+    assert opened["alarm_code"] == "Warning" and closed["alarm_code"] == "Warning-cleared"
+    assert closed["episode"]["id"] == opened["episode"]["id"]
+    assert closed["episode"]["exceedances"] == 30
+    assert closed["top3_t2"][0]["sensor"] == 3 or closed["top3_spe"][0]["sensor"] == 3
+    assert tracker.stats() == {"opened": 1, "updates": 0, "closed": 1, "suppressed": 29}
+    assert not transport.wants_mcp_job(closed) and transport.wants_mcp_job(opened)
+
+    # A zero SPE limit (empty residual spectrum) is left out of the severity instead of divided by.
+    scorer, unmonitored = ai.FusedScorer(scaler, pca), episodes.EpisodeTracker()
+    assert unmonitored.observe(0.0, scorer.score(normal[0]), t2_limit, 0.0) is None
+    opened = unmonitored.observe(1.0, scorer.score(fault[0]), t2_limit, 0.0)
+    assert opened["episode"]["severity"] == pytest.approx(scorer.score(fault[0]).t2 / t2_limit)
+
+
+def test_snapshot_ring_views_and_window_stats():
+    rng = np.random.default_rng(13)
+    data = 2700.0 + rng.normal(scale=0.5, size=(23, 4))
+    ring = history.SnapshotRing(4, window=7)
+    assert not ring and len(ring) == 0
+
+    for i, row in enumerate(data):
+        ring.append(row)
+        expected = data[max(0, i - 6) : i + 1]
+        np.testing.assert_array_equal(ring.view(), expected)
+        np.testing.assert_allclose(ring.mean(), expected.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(ring.var(), expected.var(axis=0), rtol=1e-6, atol=1e-8)
+
+    view = ring.view(3)
+    assert np.shares_memory(view, ring._data) and not view.flags.writeable
+    np.testing.assert_array_equal(view, data[-3:])
+    np.testing.assert_array_equal(ring[-1], data[-1])
+    assert ring.tolist(2) == data[-2:].tolist()
+
+    ring.extend(data[:10])
+    np.testing.assert_array_equal(ring.view(), data[3:10])
+    stats = ring.window_stats(4)
+    np.testing.assert_allclose(stats["std"], data[6:10].std(axis=0))
+    np.testing.assert_allclose(ring.std(ddof=1), data[3:10].std(axis=0, ddof=1), rtol=1e-6)
+
+
+def test_warn_loop_accepts_snapshot_ring(monkeypatch):
+    monkeypatch.setattr(ai, "send_event_to_dashboard", lambda event: None)
+    data = np.random.default_rng(14).normal(loc=50.0, scale=10.0, size=(8, 6))
+    ring = history.SnapshotRing(6, window=60)
+    log = ai.EventLog()
+
+    ai.warn_loop(
+        ai.make_snapshot_reader(data), ring, FakeScaler(), FakePCA(), log, 0.0, 0.0,
+        clock=ai.ReplayClock("backtest"),
+    )
+
+    last_warn = [event for event in log.logs if event["event_type"] == "WARN"][-1]
+    assert last_warn["history"] == data[-ai.EVENT_HISTORY_ROWS :].tolist()
+    assert last_warn["raw_data"] == data[-1].tolist()
+    assert len(ring) == len(data)
+
+
+def test_runtime_stages_match_warn_loop_under_backpressure(monkeypatch):
+    delivered = []
+
+    def slow_dashboard(event):
+        time.sleep(0.002)
+        delivered.append(event)
+
+    monkeypatch.setattr(ai, "send_event_to_dashboard", slow_dashboard)
+    pca, scaler = FakePCA(), FakeScaler()
+    data = np.random.default_rng(17).normal(loc=50.0, scale=10.0, size=(60, 6))
+    limits = ai.score_batch(pca, data, scaler=scaler, contributions=False)
+    t2_limit = float(np.median(limits["t2"]))
+
+    reference = ai.EventLog()
+    ai.warn_loop(
+        ai.make_snapshot_reader(data), history.SnapshotRing(6), scaler, pca, reference, t2_limit, np.inf,
+        clock=ai.ReplayClock("backtest"), metrics=metrics.PipelineMetrics(log_interval=None),
+    )
+    delivered.clear()
+
+    log = ai.EventLog()
+    pipeline = runtime.PipelineRuntime(
+        ai.make_snapshot_reader(data), ai.FusedScorer(scaler, pca), t2_limit, np.inf, history.SnapshotRing(6), log,
+        clock=ai.ReplayClock("backtest"), metrics=metrics.PipelineMetrics(log_interval=None),
+        queue_sizes={"score": 4, "episode": 4, "sink": 2}, concurrency={"sink": 2}, source_batch=8,
+    )
+    # Deferred by snapshot count: in backtest mode wall-clock delays are 0 and would fire on an empty history.
+    pipeline.raise_alarm(101, after_snapshots=20)
+    pipeline.raise_alarm(102, after_snapshots=len(data) + 1)
+    report = pipeline.run()
+
+    assert report["snapshots"] == len(data)
+    warns = [event for event in log.logs if event["event_type"] == "WARN"]
+    assert [(e["risk"], e["history"]) for e in warns] == [(e["risk"], e["history"]) for e in reference.logs]
+    alarms = [event for event in log.logs if event["event_type"] == "ALARM"]
+    assert [event["alarm_code"] for event in alarms] == [101] and pipeline.alarms_skipped == 1
+    assert len(delivered) == len(log.logs)
+    stats = pipeline.stats()
+    assert stats["processed"]["score"] == stats["processed"]["episode"] == len(data)
+    assert stats["high_water"]["sink"] <= 2 and stats["high_water"]["score"] <= 4
+
+    with pytest.raises(ValueError):
+        runtime.PipelineRuntime(None, None, 0.0, 0.0, [], log, concurrency={"score": 4})
+
+
+def test_runtime_takes_alarms_while_a_long_batch_is_scored(monkeypatch):
+    delivered = []
+    monkeypatch.setattr(ai, "send_event_to_dashboard", lambda event: delivered.append((time.monotonic(), event)))
+    pca, scaler = FakePCA(), FakeScaler()
+
+    class SlowScorer(ai.FusedScorer):
+        def score(self, snap):
+            time.sleep(0.01)
+            return super().score(snap)
+
+    data = np.random.default_rng(23).normal(loc=50.0, scale=10.0, size=(160, 6))
+    pipeline = runtime.PipelineRuntime(
+        ai.make_snapshot_reader(data), SlowScorer(scaler, pca), np.inf, np.inf, history.SnapshotRing(6), ai.EventLog(),
+        clock=ai.ReplayClock("backtest"), metrics=metrics.PipelineMetrics(log_interval=None), source_batch=80,
+    )
+    raised = []
+
+    def alarm_during_second_batch():
+        while pipeline.processed["episode"] < 80:
+            time.sleep(0.005)
+        raised.append(time.monotonic())
+        pipeline.raise_alarm(101)
+
+    trigger = threading.Thread(target=alarm_during_second_batch)
+    trigger.start()
+    pipeline.run()
+    trigger.join()
+
+    (delivered_at, event), = delivered
+    assert event["event_type"] == "ALARM"
+    # The second batch takes ~0.8 s to score; the alarm does not wait for it.
+    assert delivered_at - raised[0] < 0.4
+
+
+def test_runtime_stop_drains_and_closes_the_open_episode(monkeypatch):
+    monkeypatch.setattr(ai, "send_event_to_dashboard", lambda event: None)
+    pca, scaler = FakePCA(), FakeScaler()
+    rng = np.random.default_rng(18)
+    faulty = scaler.mean_ + 8.0 * scaler.scale_ * np.eye(6)[1]
+    served = []
+
+    def endless():
+        if len(served) == 20:
+            threading.Timer(0.0, pipeline.stop).start()
+        served.append(faulty + rng.normal(scale=0.1, size=6) * scaler.scale_)
+        return served[-1]
+
+    log = ai.EventLog()
+    pipeline = runtime.PipelineRuntime(
+        endless, ai.FusedScorer(scaler, pca), 1.0, 1.0, history.SnapshotRing(6), log,
+        episodes=episodes.EpisodeTracker(dwell=3), clock=ai.ReplayClock("accelerated", interval=1.0, speed=1000),
+        metrics=metrics.PipelineMetrics(log_interval=None), shutdown_timeout=5.0,
+    )
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(pipeline.run()))
+    worker.start()
+    worker.join(timeout=30)
+
+    assert not worker.is_alive()
+    assert result["snapshots"] == pipeline.stats()["processed"]["episode"] >= 20
+    phases = [event["episode"]["phase"] for event in log.logs]
+    assert phases[0] == "open" and phases[-1] == "close"
+    assert log.logs[-1]["episode"]["reason"] == "stopped"
+
+
+def test_latency_histogram_percentiles_within_bucket_error():
+    durations = np.random.default_rng(15).lognormal(mean=np.log(2e-4), sigma=1.0, size=5000)
+    histogram = metrics.LatencyHistogram()
+    for seconds in durations:
+        histogram.record(float(seconds))
+
+    for q in metrics.PERCENTILES:
+        exact = np.percentile(durations, q)
+        assert exact <= histogram.percentile(q) <= exact * 1.13
+    assert histogram.summary()["max_ms"] == pytest.approx(durations.max() * 1e3)
+
+
+def test_warn_loop_records_stage_timings_and_serves_stats(monkeypatch):
+    import urllib.request
+
+    session = FakeSession()
+    stats = metrics.PipelineMetrics(log_interval=None)
+    sender = transport.EventTransport(
+        "http://backend/dashboard/events", "http://backend/mcp/enqueue", manual_path="manual.txt",
+        batch_window=0.01, session=session, packed=True, metrics=stats,
+    )
+    stats.add_source("transport", sender.stats)
+    data = np.random.default_rng(16).normal(loc=50.0, scale=10.0, size=(12, 6))
+
+    ai.warn_loop(
+        ai.make_snapshot_reader(data), history.SnapshotRing(6), FakeScaler(), FakePCA(), ai.EventLog(),
+        0.0, 0.0, clock=ai.ReplayClock("backtest"), transport=sender, metrics=stats,
+    )
+    assert sender.close(timeout=10)
+
+    server = metrics.serve_stats(stats)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/stats", timeout=5) as resp:
+            served = json.loads(resp.read())
+    finally:
+        server.shutdown()
+
+    assert served["snapshots"] == 12 and served["events"] == 12
+    stages = served["stages"]
+    assert stages["read"]["count"] == stages["score"]["count"] == stages["contribution"]["count"] == 12
+    assert stages["serialize"]["count"] >= 12
+    assert stages["dashboard_post"]["count"] >= 1 and stages["mcp_post"]["count"] >= 1
+    assert stages["score"]["p50_ms"] <= stages["score"]["p99_ms"] <= stages["score"]["max_ms"]
+    assert served["transport"]["sent"] == 12
+
+
+def test_synthetic_tep_rows_are_chunk_invariant_correlated_and_faultable(tmp_path):
+    whole = synthetic.generate(3000, seed=5)
+    chunked = np.concatenate(list(synthetic.iter_chunks(3000, chunk_rows=701, seed=5)))
+    np.testing.assert_allclose(chunked, whole, rtol=1e-12)
+    assert whole.shape == (3000, 52)
+    correlation = np.corrcoef(whole, rowvar=False)
+    assert np.abs(correlation[np.triu_indices(52, 1)]).mean() > 0.1
+
+    fault = synthetic.Fault(start=2000, sensors=(3,), kind="step", magnitude=5.0)
+    faulty = synthetic.generate(3000, seed=5, fault=fault)
+    np.testing.assert_array_equal(faulty[:2000], whole[:2000])
+    shift = (faulty - whole)[2000:]
+    assert np.allclose(shift[:, 3], 5.0 * synthetic.TEPGenerator(5).spread[3])
+    assert not shift[:, np.arange(52) != 3].any()
+
+    path = synthetic.write_csv(tmp_path / "normal.csv", 50, seed=5, chunk_rows=16)
+    np.testing.assert_allclose(ai.load_sensor_data(str(path)), whole[:50], rtol=1e-9)
+
+
+def test_multiblock_model_flags_the_faulty_process_group(tmp_path):
+    stats = ai.RunningCovariance(52)
+    for chunk in synthetic.iter_chunks(20_000, seed=0):
+        stats.update(chunk)
+    model = multiblock.fit_multiblock(stats)
+    assert [block[0] for block in model.blocks] == ["A", "B", "C", "D", "E"]
+    assert model.projector.shape == (52, 2 * model.n_block_components + 52)
+
+    # Continue the same plant past the training rows; reactor sensors (XMEAS 10, 13) step from row 22000.
+    fault = synthetic.Fault(start=22_000, sensors=(9, 12), kind="step", magnitude=4.0)
+    rows = synthetic.generate(23_000, seed=0, fault=fault)[20_000:]
+    batch = model.score_batch(rows, block_rows=256)
+    normal, faulty = slice(0, 2000), slice(2000, None)
+    assert (batch["t2"][normal] > model.threshold_t2).mean() < 0.1
+    assert (batch["spe"][normal] > model.threshold_spe).mean() < 0.1
+    exceeded = model.exceeded_blocks(batch["block_t2"], batch["block_spe"])
+    assert exceeded[faulty, 1].all()
+    assert exceeded[faulty][:, [0, 2, 3, 4]].mean() < 0.1
+
+    for i in (5, 2500):
+        single = model.score(rows[i])
+        assert single.t2 == pytest.approx(batch["t2"][i]) and single.spe == pytest.approx(batch["spe"][i])
+        np.testing.assert_allclose(single.block_t2, batch["block_t2"][i])
+        np.testing.assert_allclose(single.spe_contributions(), batch["spe_contrib"][i])
+
+    path = multiblock.export_multiblock_bundle(tmp_path / "multiblock.bundle", model, n_samples=stats.n)
+    loaded = scoring.scorer_from_bundle(ai.load_model_bundle(path))
+    assert isinstance(loaded, multiblock.MultiBlockScorer)
+    analysis = loaded.analyze(rows[2500])
+    assert analysis["risk"] == pytest.approx(batch["t2"][2500])
+    assert analysis["block"]["group"] == "B" and analysis["block"]["label"] == "REACTOR"
+    assert analysis["block"]["exceeded"] == ["B"]
+
+    tracker = episodes.EpisodeTracker()
+    event = ai._warn_event(
+        tracker.observe(0.0, loaded.score(rows[2500]), loaded.threshold_t2, loaded.threshold_spe),
+        history.SnapshotRing(52, 5),
+        rows[2500],
+    )
+    assert event["block"]["group"] == "B"
+    assert tracker.close(1.0)["block"]["group"] == "B"
+    ring = history.SnapshotRing(52, 5)
+    ring.append(rows[2500])
+    alarm = ai.alarm_event(101, ring, None, None, scorer=loaded)
+    assert alarm["block"] == analysis["block"] and alarm["source"] == "machine"
+    anomaly = transport.mcp_job_payload(1, event, "manual.txt")["anomaly"]
+    assert anomaly["group"] == "B" and anomaly["group_label"] == "REACTOR"
+
+    refit = multiblock.fit_multiblock(stats, refit=("B",), previous=loaded)
+    np.testing.assert_allclose(refit.components, model.components)
+    np.testing.assert_allclose(refit.block_limits, model.block_limits)
+
+    # Retrain only the reactor block on data where XMEAS(1), in the feed block, got noisier: the kept
+    # blocks keep their standardization as well as their loadings, so they score raw rows as before.
+    moved = ai.RunningCovariance(52)
+    shift = synthetic.Fault(start=0, sensors=(0,), kind="noise", magnitude=3.0)
+    for chunk in synthetic.iter_chunks(20_000, seed=0, fault=shift):
+        moved.update(chunk)
+    retrained = multiblock.fit_multiblock(moved, refit=("B",), previous=model)
+    kept = [0, 2, 3, 4]
+    before, after = model.score(rows[2500]), retrained.score(rows[2500])
+    np.testing.assert_allclose(after.block_t2[kept], before.block_t2[kept])
+    np.testing.assert_allclose(after.block_spe[kept], before.block_spe[kept])
+    np.testing.assert_allclose(retrained.block_limits[kept], model.block_limits[kept])
+    with pytest.raises(ValueError):
+        multiblock.fit_multiblock(moved, refit=("Z",), previous=model)
+
+    # Keeping every component of a block leaves it no residual and a zero SPE limit.
+    full = multiblock.fit_multiblock(stats, n_components=7).score(rows[2500])
+    assert np.isfinite(full.severities()).all()
+
+
+def test_benchmark_comparison_flags_regressions():
+    def results(*timings):
+        return {
+            "results": [
+                {"benchmark": name, "rows": rows, "min_seconds": seconds} for name, rows, seconds in timings
+            ]
+        }
+
+    baseline = results(("score_batch", 1000, 0.010), ("contributions", 1000, 0.020))
+    current = results(("score_batch", 1000, 0.014), ("contributions", 1000, 0.012), ("score_batch", 10_000, 0.1))
+
+    rows = engine.compare(current, baseline, tolerance=0.2)
+
+    assert [row["status"] for row in rows] == ["regression", "improvement", "new"]
+    assert rows[0]["ratio"] == pytest.approx(1.4)
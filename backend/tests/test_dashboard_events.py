@@ -1,4 +1,7 @@
+import json
+import struct
 import sys
+from array import array
 from pathlib import Path
 
 import pytest
@@ -13,6 +16,7 @@ if str(ROOT_DIR) not in sys.path:
 from app.main import create_app
 from app.DB import db_config
 from app.DB.table_dashboard import DashboardAlert
+from app.services.ai_event_wire import CONTENT_TYPE, decode_event_frame
 from router import dashboard_router as dashboard
 
 
@@ -66,3 +70,77 @@ def test_ai_event_route_inserts_dashboard_row(dashboard_client):
         assert len(alerts) == 1
         assert alerts[0].sensor_id == 1
         assert alerts[0].message == "101"
+
+
+def test_ai_event_batch_route_preserves_order(dashboard_client):
+    client, TestingSession = dashboard_client
+    payloads = [
+        {
+            "event_type": "WARN",
+            "timestamp": 1234567890.0 + i,
+            "risk": 12.3,
+            "spe": 4.5,
+            "top3_t2": [{"sensor": 1, "score": 0.5}],
+            "top3_spe": [{"sensor": 2, "score": 0.4}],
+            "history": [[1.0, 2.0]],
+            "alarm_code": f"Warning-{i}",
+            "raw_data": [9.9, 8.8],
+            "source": "sensor",
+        }
+        for i in range(3)
+    ]
+
+    resp = client.post("/dashboard/events/batch", json=payloads)
+    assert resp.status_code == 201
+    body = resp.json()
+    assert [item["message"] for item in body] == ["Warning-0", "Warning-1", "Warning-2"]
+    assert len({item["id"] for item in body}) == 3
+
+    with TestingSession() as session:
+        assert session.query(DashboardAlert).count() == 3
+
+
+def build_frame(events, rows):
+    meta = json.dumps(events).encode("utf-8")
+    meta += b" " * (-(16 + len(meta)) % 4)
+    header = struct.pack("<4sBBHII", b"AIEV", 1, 0, len(rows[0]), len(rows), len(meta))
+    return header + meta + array("f", [value for row in rows for value in row]).tobytes()
+
+
+def packed_event(i, history, raw):
+    return {
+        "event_type": "WARN",
+        "timestamp": 1234567890.0 + i,
+        "risk": 12.3,
+        "spe": 4.5,
+        "top3_t2": [{"sensor": 1, "score": 0.5}],
+        "top3_spe": [{"sensor": 2, "score": 0.4}],
+        "alarm_code": f"Warning-{i}",
+        "source": "sensor",
+        "history": history,
+        "raw": raw,
+    }
+
+
+def test_packed_event_route_shares_history_rows(dashboard_client):
+    client, TestingSession = dashboard_client
+    rows = [[1.5, 2.5], [3.5, 4.5], [5.5, 6.5]]
+    frame = build_frame([packed_event(0, [0, 1], 1), packed_event(1, [1, 2], 2)], rows)
+
+    decoded = decode_event_frame(frame)
+    assert decoded.history(1) == [[3.5, 4.5], [5.5, 6.5]]
+    assert decoded.raw_data(0) == [3.5, 4.5]
+
+    resp = client.post("/dashboard/events/packed", content=frame, headers={"Content-Type": CONTENT_TYPE})
+    assert resp.status_code == 201
+    assert [item["message"] for item in resp.json()] == ["Warning-0", "Warning-1"]
+    with TestingSession() as session:
+        assert session.query(DashboardAlert).count() == 2
+
+    resp = client.post("/dashboard/events/packed", content=frame[:-4], headers={"Content-Type": CONTENT_TYPE})
+    assert resp.status_code == 400
+    bad_ref = build_frame([packed_event(0, [0, 7], 1)], rows)
+    resp = client.post("/dashboard/events/packed", content=bad_ref, headers={"Content-Type": CONTENT_TYPE})
+    assert resp.status_code == 400
+    resp = client.post("/dashboard/events/packed", json=[packed_event(0, [0], 0)])
+    assert resp.status_code == 415